@@ -6,9 +6,10 @@
 # Loosely based on the API implementation from 'whatbetter', by Zachary Denton
 # See https://github.com/zacharydenton/whatbetter
 
-import json
 import time
+import threading
 import requests
+from contextlib import contextmanager
 
 from user import User
 from artist import Artist
@@ -17,7 +18,21 @@ from request import Request
 from torrent_group import TorrentGroup
 from torrent import Torrent
 from category import Category
-from inbox import Mailbox
+from inbox import Mailbox, MailboxSyncState
+from rate_limiter import TokenBucket
+from scheduler import PriorityScheduler, NORMAL, LOW
+from bulk import InFlightRequests, fetch_many
+from identity_map import IdentityMap
+from pagination import PageIterator
+from torrent_table import TorrentTable
+from local_index import LocalIndex
+from tag_index import TagIndex
+from json_decoder import get_decoder
+from sync import REFETCH_FIELDS, ArtistSyncState, snapshot_artist, diff_snapshots
+from artist_graph import SimilarArtistCrawler
+from snapshot import Snapshot, save_snapshot
+from freshness import REFRESH, stale
+from downloader import TorrentDownloader, DownloadException, atomic_write, is_valid_torrent_file
 
 class LoginException(Exception):
     pass
@@ -25,6 +40,12 @@ class LoginException(Exception):
 class RequestException(Exception):
     pass
 
+class FailedRequestException(RequestException):
+    """
+    The site answered, but with a status other than 'success' (e.g. a bad ID).
+    """
+    pass
+
 class GazelleAPI(object):
     last_request = time.time() # share amongst all api objects
     default_headers = {
@@ -40,75 +61,345 @@ class GazelleAPI(object):
         'Accept-Charset': 'ISO-8859-1,utf-8;q=0.7,*;q=0.3'}
 
 
-    def __init__(self, username=None, password=None):
-        self.session = requests.session(headers=self.default_headers)
+    identity_map_names = ('users', 'artists', 'tags', 'torrent_groups', 'torrents', 'requests', 'categories')
+
+    def __init__(self, username=None, password=None, rate_limiter=None, site=None, cache=None, identity_maps=None,
+                 decoder=None, instrumentation=None, session_store=None, indexes=False):
+        """
+        Logs in with the given credentials. Requests are spaced out by a TokenBucket with one request every 2 seconds
+        (change it through rate_limit at any time); pass your own rate_limiter (anything with wait(), record_success()
+        and record_failure()) to tune bursts and backoff.
+        Pass site to talk to another Gazelle instance, such as a local stand-in server, and cache (a ResponseCache) to
+        keep responses across restarts.
+        identity_maps bounds the memory used by known objects: it maps names from identity_map_names to IdentityMaps,
+        e.g. {'torrents': IdentityMap(max_entries=100000)}. Unlisted entity types are kept forever.
+        decoder picks the JSON parser: a name from json_decoder.DECODERS, or any loads-like function taking bytes.
+        By default the fastest installed one is used.
+        instrumentation, an Instrumentation, collects per-action latency, size, decode, hydration and rate limit
+        wait statistics. It's off by default.
+        session_store, a SessionStore, saves the logged in session to disk. If it holds a session for this site and
+        username, that's reused instead of logging in; should it have expired, the first request logs in again.
+        indexes turns on the local indexes, local (a LocalIndex) and tag_index (a TagIndex), which are then kept up to
+        date with every object filled in. They're off by default, leaving both None, as that upkeep adds to every
+        hydration.
+        """
+        self.session = requests.Session()
+        self.session.headers.update(self.default_headers)
+        self._setup(username, password, rate_limiter, site, cache, identity_maps, decoder, instrumentation,
+                    session_store, indexes)
+        if not self._restore_session():
+            self._login()
+
+    def _setup(self, username=None, password=None, rate_limiter=None, site=None, cache=None, identity_maps=None,
+               decoder=None, instrumentation=None, session_store=None, indexes=False):
+        """
+        Private method.
+        Sets up credentials, identity caches and rate limiting. Does no network access.
+        """
         self.username = username
         self.password = password
         self.authkey = None
         self.passkey = None
         self.userid = None
         self.logged_in_user = None
-        self.cached_users = {}
-        self.cached_artists = {}
-        self.cached_tags = {}
-        self.cached_torrent_groups = {}
-        self.cached_torrents = {}
-        self.cached_requests = {}
-        self.cached_categories = {}
-        self.site = "https://what.cd/"
-        self.rate_limit = 2.0 # seconds between requests
-        self._login()
+        identity_maps = identity_maps or {}
+        for name in identity_maps:
+            if name not in self.identity_map_names:
+                raise ValueError("Unknown identity map '%s', expected one of %s" % (name, self.identity_map_names))
+        for name in self.identity_map_names:
+            identity_map = identity_maps.get(name)
+            setattr(self, 'cached_' + name, IdentityMap() if identity_map is None else identity_map)
+        self.site = site or "https://what.cd/"
+        self.rate_limiter = rate_limiter or TokenBucket(2.0)
+        self.scheduler = PriorityScheduler(self.rate_limiter)
+        self._priority = threading.local()
+        self.in_flight = InFlightRequests()
+        self.cache = cache
+        self._hydrate_lock = threading.RLock()
+        self.local = LocalIndex(self) if indexes else None
+        self.tag_index = TagIndex(self) if indexes else None
+        self.snapshot = None
+        if callable(decoder):
+            self.json_decoder, self.json_loads = 'custom', decoder
+        else:
+            self.json_decoder, self.json_loads = get_decoder(decoder)
+        self.instrumentation = instrumentation
+        self.session_store = session_store
+        self.logins = 0
+        self._login_lock = threading.Lock()
 
     def _login(self):
         """
         Private method.
         Logs in user and gets authkey from server.
         """
-        loginpage = 'https://what.cd/login.php'
-        data = {'username': self.username,
-                'password': self.password}
-        r = self.session.post(loginpage, data=data)
+        r = self.session.post(self._url('login.php'), data=self._login_data())
         if r.status_code != 200:
             raise LoginException
-        accountinfo = self.request('index')
+        status_code, content = self._fetch('ajax.php', 'index', {}, relogin=False)
+        accountinfo = self._parse_response(content, 'index', {}, status_code)
+        self._save_session(accountinfo)
+        self._set_account_info(accountinfo)
+        self.logins += 1
+
+    def _relogin(self, logins):
+        """
+        Private method.
+        Logs in again after a request found the session expired, unless another thread already has since the number of
+        logins was logins.
+        """
+        if self.username is None:
+            raise LoginException("Session expired, and there are no credentials to log in again")
+        with self._login_lock:
+            if self.logins == logins:
+                self.session.cookies.clear()
+                self._login()
+
+    def _session_expired(self, status_code, headers):
+        """
+        Private method.
+        Gazelle sends requests without a valid session to the login page.
+        """
+        return status_code == 401 or (status_code in (301, 302, 303, 307) and 'login' in headers.get('Location', ''))
+
+    def _restore_session(self):
+        """
+        Private method.
+        Takes up the session saved in the session store, if there's one for this site and user. Returns whether one was
+        restored. It's not checked here; the first request finds out whether it's still good.
+        """
+        if self.session_store is None:
+            return False
+        state = self.session_store.load(self.site, self.username)
+        if state is None:
+            return False
+        self._restore_cookies(state['cookies'])
+        self._set_account_info(state['account'])
+        return True
+
+    def _save_session(self, accountinfo):
+        if self.session_store is not None:
+            self.session_store.save(self.site, self.username, self._session_cookies(), accountinfo)
+
+    def _session_cookies(self):
+        return [{'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain, 'path': cookie.path}
+                for cookie in self.session.cookies]
+
+    def _restore_cookies(self, cookies):
+        for cookie in cookies:
+            self.session.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'], path=cookie['path'])
+
+    def _login_data(self):
+        return {'username': self.username,
+                'password': self.password}
+
+    def _set_account_info(self, accountinfo):
+        """
+        Private method.
+        Stores the logged in user's ID and keys from a parsed 'index' response.
+        """
         self.userid = accountinfo['id']
         self.authkey = accountinfo['authkey']
         self.passkey = accountinfo['passkey']
         self.logged_in_user = User(self.userid, self)
         self.logged_in_user.set_index_data(accountinfo)
 
-    def request(self, action, **kwargs):
+    def on_hydrated(self, entity, source):
+        """
+        Called by the model objects each time one of their set_*_data() methods has filled them from an API response.
+        source is the API action the data came from.
+        """
+        if self.local is None:
+            return
+        self.local.on_hydrated(entity, source)
+        self.tag_index.on_hydrated(entity, source)
+
+    def on_blocking_call(self, caller):
+        """
+        Called by the model objects' methods that make blocking request() calls (Artist.update_data(), ...) before
+        they do, with the method's name. AsyncGazelleAPI refuses them here.
+        """
+        pass
+
+    @property
+    def rate_limit(self):
+        """
+        Seconds between requests, when the site isn't being backed off from. Setting it retunes the rate limiter.
+        """
+        return getattr(self.rate_limiter, 'rate_limit', None)
+
+    @rate_limit.setter
+    def rate_limit(self, seconds):
+        if not hasattr(self.rate_limiter, 'set_rate_limit'):
+            raise TypeError("%r has no set_rate_limit(); configure it directly" % (self.rate_limiter,))
+        self.rate_limiter.set_rate_limit(seconds)
+
+    @contextmanager
+    def priority(self, priority):
+        """
+        Makes the requests this thread sends inside the 'with' block default to the given priority (HIGH, NORMAL or
+        LOW from the scheduler module), e.g. to serve a page view ahead of a background crawl:
+
+            with api.priority(HIGH):
+                artist.update_data()
+        """
+        previous = getattr(self._priority, 'value', None)
+        self._priority.value = priority
+        try:
+            yield
+        finally:
+            self._priority.value = previous
+
+    def _current_priority(self, priority):
+        if priority is None:
+            priority = getattr(self._priority, 'value', None)
+        return NORMAL if priority is None else priority
+
+    def request(self, action, bypass_cache=False, priority=None, **kwargs):
         """
         Makes an AJAX request at a given action.
         Pass an action and relevant arguments for that action.
+        If the API object has a cache, fresh enough cached responses are returned without a network call; pass
+        bypass_cache=True to always hit the site (the fresh response still refreshes the cache).
+        When requests queue up for the rate limit, those with a better priority (HIGH, NORMAL or LOW from the
+        scheduler module) go first. It defaults to NORMAL, or to the priority set with api.priority().
         """
+        if not bypass_cache:
+            cached = self._cached_response(action, kwargs)
+            if cached is not None:
+                return cached
 
         ajaxpage = 'ajax.php'
-        content = self.unparsed_request(ajaxpage, action, **kwargs)
+        # identical requests already running in other threads at the same priority are merged into one network call
+        # (a HIGH request mustn't wait behind a queued LOW one); each caller still parses its own copy, since
+        # hydrating a response modifies it, but only the one that made the call reports the outcome to the rate
+        # limiter and the cache
+        priority = self._current_priority(priority)
+        owner = []
+        def fetch():
+            owner.append(True)
+            return self._fetch(ajaxpage, action, kwargs, priority=priority)
+        status_code, content = self.in_flight.call((priority,) + self._request_key(action, kwargs), fetch)
+        return self._parse_response(content, action, kwargs, status_code, report=bool(owner))
+
+    def _parse_response(self, content, action=None, kwargs=None, status_code=200, report=True):
+        """
+        Private method.
+        Decodes an 'ajax.php' response body, feeding the outcome back to the rate limiter and the cache unless report
+        is False (for callers sharing a response another one reports). Returns the 'response' part of the payload, or
+        raises RequestException if the body isn't JSON and FailedRequestException if the status isn't 'success'. An
+        HTTP error status_code has already been reported to the rate limiter by _check_status(), so a failed body
+        doesn't count a second time.
+        """
+        record_failure = report and status_code < 400
         try:
-            parsed = json.loads(content)
-            if parsed['status'] != 'success':
-                raise RequestException
-            return parsed['response']
+            if self.instrumentation is None:
+                parsed = self.json_loads(content)
+            else:
+                start = time.time()
+                parsed = self.json_loads(content)
+                self.instrumentation.record_decode(action, time.time() - start)
         except ValueError:
+            if record_failure:
+                self.rate_limiter.record_failure()
             raise RequestException
+        if parsed.get('status') != 'success':
+            if record_failure:
+                self.rate_limiter.record_failure()
+                if self.cache is not None and action: # only a proper answer can say the thing doesn't exist
+                    self.cache.set_failure(action, kwargs, parsed.get('error'), self._cache_scope())
+            raise FailedRequestException(parsed.get('error'))
+        if report:
+            self.rate_limiter.record_success()
+            if self.cache is not None and action:
+                self.cache.set(action, kwargs, content, self._cache_scope())
+        return parsed['response']
+
+    def _cached_response(self, action, kwargs):
+        """
+        Private method.
+        Returns the cached 'response' for the request, None if it isn't cached, or raises FailedRequestException if
+        the request is remembered as failing.
+        """
+        if self.cache is None:
+            return None
+        cached = self.cache.get(action, kwargs, self._cache_scope())
+        if self.instrumentation is not None:
+            self.instrumentation.record_cache(action, cached is not None)
+        if cached is None:
+            return None
+        failed, content = cached
+        if failed:
+            raise FailedRequestException(content.decode('utf-8') or None)
+        return self.json_loads(content)['response']
+
+    def _cache_scope(self):
+        # responses depend on the site and on who's logged in
+        return [self.site, self.userid]
+
+    def _request_key(self, action, kwargs):
+        return (action,) + tuple(sorted((key, str(value)) for key, value in kwargs.items()))
 
     def unparsed_request(self, sitepage, action, **kwargs):
         """
         Makes a generic HTTP request at a given page with a given action.
         Also pass relevant arguments for that action.
         """
-        while time.time() - self.last_request < self.rate_limit:
-            time.sleep(0.1)
+        return self._unparsed_request(sitepage, action, kwargs)
+
+    def _unparsed_request(self, sitepage, action, kwargs, relogin=True, priority=None):
+        return self._fetch(sitepage, action, kwargs, relogin, priority)[1]
+
+    def _fetch(self, sitepage, action, kwargs, relogin=True, priority=None):
+        """
+        Private method.
+        Makes the request and returns its HTTP status and body.
+        """
+        r, waited, start = self._get(sitepage, action, kwargs, relogin, priority=priority)
+        content = r.content
+        self.last_request = time.time()
+        if self.instrumentation is not None:
+            self.instrumentation.record_queue_wait(action, waited[0])
+            self.instrumentation.record_rate_wait(action, waited[1])
+            self.instrumentation.record_request(action, self.last_request - start, len(content))
+        self._check_status(r.status_code)
+        return r.status_code, content
+
+    def _get(self, sitepage, action, kwargs, relogin=True, stream=False, priority=None):
+        """
+        Private method.
+        Waits for its turn at the rate limiter, then GETs sitepage. If the site says the session has expired, logs in
+        again (unless relogin is False) and retries once. Returns the response, the seconds spent queued for the rate
+        limiter and waiting on it (as a pair) and the time the request was sent.
+        """
+        priority = self._current_priority(priority)
+        queued = limited = 0.0
+        for retry in (False, True):
+            logins = self.logins
+            queue_wait, rate_wait = self.scheduler.wait(priority)
+            queued += queue_wait
+            limited += rate_wait
+            start = time.time()
+            r = self.session.get(self._url(sitepage), params=self._request_params(action, kwargs),
+                                 allow_redirects=False, stream=stream)
+            if retry or not relogin or not self._session_expired(r.status_code, r.headers):
+                return r, (queued, limited), start
+            r.close()
+            self._relogin(logins)
+
+    def _url(self, sitepage):
+        return "%s/%s" % (self.site.rstrip('/'), sitepage)
 
-        url = "%s/%s" % (self.site, sitepage)
+    def _request_params(self, action, kwargs):
         params = {'action': action}
         if self.authkey:
             params['auth'] = self.authkey
         params.update(kwargs)
-        r = self.session.get(url, params=params, allow_redirects=False)
-        self.last_request = time.time()
-        return r.content
+        return params
+
+    def _check_status(self, status_code):
+        if status_code >= 400:
+            self.rate_limiter.record_failure() # 429s and 5xxs mean we're being throttled or the site is struggling
 
     def get_user(self, id):
         """
@@ -119,19 +410,37 @@ class GazelleAPI(object):
         id = int(id)
         if id == self.userid:
             return self.logged_in_user
-        elif id in self.cached_users.keys():
-            return self.cached_users[id]
         else:
-            return User(id, self)
+            return self.cached_users.get(id) or User(id, self)
 
-    def search_users(self, search_query):
+    def search_users(self, search_query, page=None):
         """
         Returns a list of users returned for the search query. You can search by name, part of name, and ID number. If
         one of the returned users is the currently logged-in user, that user object will be pre-populated with the
         information from an 'index' API call. Otherwise only the limited info returned by the search will be pre-pop'd.
         You can query more information with User.update_user_data(). This is done on demand to reduce unnecessary API calls.
+        Only one page of results is returned; pass page for later ones, or use iter_search_users().
+        """
+        if page is None:
+            response = self.request(action='usersearch', search=search_query)
+        else:
+            response = self.request(action='usersearch', search=search_query, page=page)
+        return self._set_user_search_data(response)
+
+    def iter_search_users(self, search_query, page=1, max_pages=None, max_results=None, prefetch=True):
+        """
+        Returns a PageIterator yielding the Users found by search_users() across all result pages, starting at page.
+        The next page is requested in the background while you work through the current one.
+        """
+        return PageIterator(lambda page: self.request(action='usersearch', search=search_query, page=page),
+                            lambda response: (self._set_user_search_data(response), response.get('pages') or 1),
+                            page, max_pages, max_results, prefetch)
+
+    def _set_user_search_data(self, response):
+        """
+        Private method.
+        Builds the list of Users from a parsed 'usersearch' response.
         """
-        response = self.request(action='usersearch', search=search_query)
         results = response['results']
 
         found_users = []
@@ -154,16 +463,72 @@ class GazelleAPI(object):
         """
         return Mailbox(self, 'sentbox', page, sort)
 
+    def iter_mailbox(self, boxtype='inbox', page=1, sort='unread', max_pages=None, max_results=None, prefetch=True):
+        """
+        Returns a PageIterator yielding the MailboxMessages in the logged in user's inbox or sentbox across all pages,
+        starting at page. The next page is requested in the background while you work through the current one.
+        """
+        return Mailbox(self, boxtype, page, sort).iter_messages(max_pages, max_results, prefetch)
+
+    def sync_mailbox(self, boxtype='inbox', state_path=None, workers=4, batch_size=50, priority=LOW):
+        """
+        Reads the logged in user's inbox or sentbox newest first and fills the Conversations that are new, have new
+        replies or are unread since the last sync, fetching them in batches of batch_size on workers threads within
+        the rate limit. The next listing page is requested in the background meanwhile. The listing is by date, so
+        fetching a conversation (which marks it read) doesn't reorder the pages still to come.
+        Which conversations have been fetched is kept in a JSON file at state_path (see inbox.MailboxSyncState), which
+        is saved after every batch, so an interrupted sync picks up where it left off. Once a sync has fetched
+        everything it needed to, the next one stops listing at the first conversation older than everything it saw.
+        Without a state_path, every conversation is fetched.
+        Returns a dict with 'messages', every MailboxMessage listed, 'fetched', the Conversations filled in, and
+        'errors', a dict of conversation ID to the exception its call raised.
+        """
+        state = MailboxSyncState(state_path)
+        messages = []
+        fetched = []
+        errors = {}
+        batch = []
+
+        def fetch(message):
+            response = self.request(action='inbox', priority=priority, type='viewconv', id=message.id)
+            with self._hydrate_lock:
+                message.conv.set_conv_data(response)
+            return message.conv
+
+        def fetch_batch():
+            by_id = dict((message.id, message) for message in batch)
+            outcome = fetch_many(list(by_id), lambda conv_id: fetch(by_id[conv_id]), workers)
+            for conversation in outcome['results']:
+                if conversation is not None:
+                    fetched.append(conversation)
+                    state.mark_seen(boxtype, by_id[conversation.id])
+            errors.update(outcome['errors'])
+            state.save()
+            del batch[:]
+
+        for message in self.iter_mailbox(boxtype, sort='date'):
+            if state.below_high_water(boxtype, message):
+                break
+            messages.append(message)
+            if state.needs_fetch(boxtype, message):
+                batch.append(message)
+                if len(batch) >= batch_size:
+                    fetch_batch()
+        if batch:
+            fetch_batch()
+        dates = [message.date for message in messages if not message.sticky]
+        if dates and not errors: # failed conversations must stay above the mark to be retried
+            state.high_water[boxtype] = max(dates + [state.high_water.get(boxtype, '')])
+            state.save()
+        return {'messages': messages, 'fetched': fetched, 'errors': errors}
+
     def get_artist(self, id, name=None):
         """
         Returns an Artist for the passed ID, associated with this API object. You'll need to call Artist.update_data()
         if the artist hasn't already been cached. This is done on demand to reduce unnecessary API calls.
         """
         id = int(id)
-        if id in self.cached_artists.keys():
-            artist = self.cached_artists[id]
-        else:
-            artist = Artist(id, self)
+        artist = self.cached_artists.get(id) or Artist(id, self)
         if name:
             artist.name = name
         return artist
@@ -174,10 +539,7 @@ class GazelleAPI(object):
         pass it to update the object. There is no way to query the count directly from the API, but it can be retrieved
         from other calls such as 'artist', however.
         """
-        if name in self.cached_tags.keys():
-            return self.cached_tags[name]
-        else:
-            return Tag(name, self)
+        return self.cached_tags.get(name) or Tag(name, self)
 
     def get_request(self, id):
         """
@@ -185,44 +547,206 @@ class GazelleAPI(object):
         if the request hasn't already been cached. This is done on demand to reduce unnecessary API calls.
         """
         id = int(id)
-        if id in self.cached_requests.keys():
-            return self.cached_requests[id]
-        else:
-            return Request(id, self)
+        return self.cached_requests.get(id) or Request(id, self)
 
     def get_torrent_group(self, id):
         """
         Returns a TorrentGroup for the passed ID, associated with this API object.
         """
         id = int(id)
-        if id in self.cached_torrent_groups.keys():
-            return self.cached_torrent_groups[id]
-        else:
-            return TorrentGroup(id, self)
+        return self.cached_torrent_groups.get(id) or TorrentGroup(id, self)
 
     def get_torrent(self, id):
         """
         Returns a TorrentGroup for the passed ID, associated with this API object.
         """
         id = int(id)
-        if id in self.cached_torrents.keys():
-            return self.cached_torrents[id]
-        else:
-            return Torrent(id, self)
+        return self.cached_torrents.get(id) or Torrent(id, self)
 
     def get_category(self, id, name=None):
         """
         Returns a Category for the passed ID, associated with this API object.
         """
         id = int(id)
-        if id in self.cached_categories.keys():
-            cat = self.cached_categories[id]
-        else:
-            cat = Category(id, self)
+        cat = self.cached_categories.get(id) or Category(id, self)
         if name:
             cat.name = name
         return cat
 
+    def identity_map_stats(self):
+        """
+        Returns a dict of identity map name to that map's stats() (size, evictions, hit and miss counts).
+        """
+        return dict((name, getattr(self, 'cached_' + name).stats()) for name in self.identity_map_names)
+
+    def save_snapshot(self, path):
+        """
+        Writes every known object and the references between them to path in a compact binary format, so a later
+        run can start from them with load_snapshot(). Objects only known from a loaded snapshot are kept. Returns the
+        size of the file in bytes. See snapshot.py for the format.
+        """
+        with self._hydrate_lock:
+            return save_snapshot(self, path)
+
+    def load_snapshot(self, path):
+        """
+        Memory maps a file written by save_snapshot() and makes this API's identity maps load objects from it as
+        they're asked for: get_torrent(id) and the like return an object with only its ID set, which fills itself
+        from the snapshot the first time another of its attributes is read. Opening even a very large snapshot only
+        reads its keys. Returns the snapshot.Snapshot; objects already known to this API are left as they are.
+        """
+        snapshot = Snapshot(path)
+        snapshot.attach(self)
+        return snapshot
+
+    def fetch_users(self, ids, workers=4, priority=LOW, bypass_cache=False):
+        """
+        Fills the Users for all passed IDs with 'user' API calls, made from a pool of worker threads within the rate
+        limit. Returns a dict with 'results', a list of Users in the same order as ids (None where the call failed),
+        and 'errors', a dict of ID to the exception its call raised.
+        The calls queue for the rate limit at LOW priority unless told otherwise, so interactive requests overtake them.
+        bypass_cache works as for request().
+        """
+        return self._fetch_many(ids, 'user', self.get_user, User.set_user_data, workers, priority, bypass_cache)
+
+    def fetch_artists(self, ids, workers=4, priority=LOW, bypass_cache=False):
+        """
+        Fills the Artists for all passed IDs with 'artist' API calls. Works like fetch_users().
+        """
+        return self._fetch_many(ids, 'artist', self.get_artist, Artist.set_data, workers, priority, bypass_cache)
+
+    def fetch_torrent_groups(self, ids, workers=4, priority=LOW, bypass_cache=False):
+        """
+        Fills the TorrentGroups for all passed IDs with 'torrentgroup' API calls. Works like fetch_users().
+        """
+        return self._fetch_many(ids, 'torrentgroup', self.get_torrent_group, TorrentGroup.set_group_data, workers,
+                                priority, bypass_cache)
+
+    def sync_artists(self, ids, workers=4, priority=LOW, refetch_fields=REFETCH_FIELDS, state_path=None):
+        """
+        Refreshes many artists incrementally: fetches them like fetch_artists(), compares each with what was known
+        before (as Artist.sync_data() does), then makes 'torrentgroup' calls only for the groups that are new or had
+        torrents added, removed or edited, all in one batch. All these calls bypass the response cache, which would
+        otherwise hand back the very data being compared against. Returns a dict with 'results', a dict of artist ID
+        to sync.SyncResult, 'errors', a dict of artist ID to the exception its call raised, and 'group_errors', a dict
+        of group ID to the exception its 'torrentgroup' call raised.
+        With a state_path, what each artist looked like after its last complete sync is kept in a JSON file there (see
+        sync.ArtistSyncState) and compared against, so a sync in a new process only refetches what changed since.
+        Artists not in the file, or without a state_path, are compared with what's loaded now.
+        """
+        ids = [int(id) for id in ids]
+        state = ArtistSyncState(state_path)
+        before = {}
+        for id in set(ids):
+            before[id] = state.get(id)
+            if before[id] is None:
+                before[id] = snapshot_artist(self.get_artist(id))
+        fetched = self.fetch_artists(ids, workers, priority, bypass_cache=True)
+        results = {}
+        after = {}
+        refetch_groups = []
+        for artist in fetched['results']:
+            if artist is not None and artist.id not in results:
+                after[artist.id] = snapshot_artist(artist)
+                result = diff_snapshots(before[artist.id], after[artist.id], refetch_fields)
+                results[artist.id] = result
+                refetch_groups.extend(result.refetch_groups)
+        group_errors = {}
+        if refetch_groups:
+            group_errors = self.fetch_torrent_groups(refetch_groups, workers, priority, bypass_cache=True)['errors']
+        for artist_id, result in results.items():
+            result.group_errors = dict((group_id, group_errors[group_id]) for group_id in result.refetch_groups
+                                       if group_id in group_errors)
+            if not result.group_errors: # otherwise the next sync has to find the same groups to refetch
+                state.set(artist_id, after[artist_id])
+        state.save()
+        return {'results': results, 'errors': fetched['errors'], 'group_errors': group_errors}
+
+    def refresh_stale(self, entity_type, max_age, budget=None, workers=4, priority=LOW):
+        """
+        Refills the known entities of entity_type ('users', 'artists', 'torrent_groups' or 'torrents') whose data is
+        more than max_age seconds old, oldest first, making at most budget API calls (no limit if None). Users,
+        artists and torrent groups are refilled with their own 'user', 'artist' and 'torrentgroup' calls, and their age
+        is that of their last such call. Torrents are refreshed through their groups' 'torrentgroup' calls, by the age
+        of their latest data from any call, so one call covers every stale torrent in a group. Entities that were never
+        filled are left alone (see freshness.py).
+        The calls are made like fetch_users() does, at LOW priority unless told otherwise, and always go to the site
+        rather than the response cache. Returns a dict with 'results', the refilled Users, Artists or TorrentGroups,
+        'errors', a dict of ID to the exception its call raised, 'remaining', the number of stale entities left for
+        lack of budget, and 'ungrouped', the number of stale torrents that can't be refreshed because their group isn't
+        known (always 0 for other entity types).
+        """
+        if entity_type not in REFRESH:
+            raise ValueError("Can't refresh '%s', expected one of %s" % (entity_type, sorted(REFRESH)))
+        _, source = REFRESH[entity_type]
+        expired = stale(getattr(self, 'cached_' + entity_type).values(), max_age, source)
+        if entity_type == 'torrents':
+            ids = []
+            chosen = set()
+            covered = 0
+            ungrouped = 0
+            for torrent in expired:
+                if torrent.group is None:
+                    ungrouped += 1
+                    continue
+                if torrent.group.id not in chosen:
+                    if budget is not None and len(ids) >= budget:
+                        continue
+                    ids.append(torrent.group.id)
+                    chosen.add(torrent.group.id)
+                covered += 1
+            remaining = len(expired) - covered - ungrouped
+        else:
+            ids = [entity.id for entity in expired[:budget]]
+            remaining = len(expired) - len(ids)
+            ungrouped = 0
+        fetch = {'users': self.fetch_users, 'artists': self.fetch_artists}.get(entity_type, self.fetch_torrent_groups)
+        outcome = fetch(ids, workers, priority, True) if ids else {'results': [], 'errors': {}}
+        return {'results': [entity for entity in outcome['results'] if entity is not None],
+                'errors': outcome['errors'], 'remaining': remaining, 'ungrouped': ungrouped}
+
+    def crawl_similar_artists(self, seeds, max_depth=2, max_artists=1000, workers=4, priority=LOW):
+        """
+        Crawls the similar-artist graph breadth first from the seed artist IDs, up to max_depth levels out or
+        max_artists artists fetched, and returns it as an artist_graph.ArtistGraph. Only the raw 'artist' responses
+        are read; no Artist objects are filled.
+        """
+        return SimilarArtistCrawler(self, workers, priority).crawl(seeds, max_depth, max_artists)
+
+    def _fetch_many(self, ids, action, get_entity, set_data, workers, priority=LOW, bypass_cache=False):
+        """
+        Private method.
+        Requests each ID concurrently, then hydrates its object one thread at a time so the identity caches stay
+        consistent. An ID that isn't a number fails on its own, with int()'s exception in 'errors'.
+        """
+        def as_int(id):
+            try:
+                return int(id)
+            except (TypeError, ValueError):
+                return id # int() raises again in fetch(), so fetch_many() reports it
+
+        def fetch(id):
+            id = int(id)
+            response = self.request(action, bypass_cache, priority, id=id)
+            with self._hydrate_lock:
+                entity = get_entity(id)
+                set_data(entity, response)
+            return entity
+        return fetch_many([as_int(id) for id in ids], fetch, workers)
+
+    def iter_search_torrents(self, max_pages=None, max_results=None, prefetch=True, **kwargs):
+        """
+        Returns a PageIterator yielding the Torrents matched by search_torrents() across all result pages. Takes the
+        same search args; 'page' sets the page to start (or resume) from. The next page is requested in the
+        background while you work through the current one. Stops after max_pages pages or max_results Torrents.
+        """
+        start_page = kwargs.pop('page', 1)
+        def parse_page(response):
+            found = self._set_torrent_search_data(response)
+            return found['results'], found['pages']
+        return PageIterator(lambda page: self.request(action='browse', page=page, **kwargs), parse_page,
+                            start_page, max_pages, max_results, prefetch)
+
     def search_torrents(self, **kwargs):
         """
         Searches based on the args you pass and returns torrent groups filled with torrents.
@@ -263,6 +787,13 @@ class GazelleAPI(object):
         """
 
         response = self.request(action='browse', **kwargs)
+        return self._set_torrent_search_data(response)
+
+    def _set_torrent_search_data(self, response):
+        """
+        Private method.
+        Fills TorrentGroups and Torrents from a parsed 'browse' response, returning search_torrents()'s result dict.
+        """
         results = response['results']
         if len(results):
             curr_page = response['currentPage']
@@ -284,13 +815,53 @@ class GazelleAPI(object):
 
         return {'curr_page': curr_page, 'pages': pages, 'results': matching_torrents}
 
+    def torrent_table(self, torrents=None):
+        """
+        Returns a TorrentTable (NumPy columns, needs numpy) of the passed Torrents, e.g. search_torrents()['results'],
+        or of every cached Torrent if none are passed.
+        """
+        if torrents is None:
+            torrents = self.cached_torrents.values()
+        return TorrentTable.from_torrents(torrents, self)
+
     def generate_torrent_link(self, id):
         url = "%storrents.php?action=download&id=%s&authkey=%s&torrent_pass=%s" %\
               (self.site, id, self.logged_in_user.authkey, self.logged_in_user.passkey)
         return url
 
-    def save_torrent_file(self, id, dest):
-        file_data = self.unparsed_request("torrents.php", 'download',
-            id=id, authkey=self.logged_in_user.authkey, torrent_pass=self.logged_in_user.passkey)
-        with open(dest, 'w+') as dest_file:
-            dest_file.write(file_data)
+    def _download_params(self, id):
+        return {'id': id, 'authkey': self.logged_in_user.authkey, 'torrent_pass': self.logged_in_user.passkey}
+
+    def save_torrent_file(self, id, dest, chunk_size=64 * 1024, priority=None):
+        """
+        Downloads the .torrent file for torrent id to dest and returns its size. The body is streamed to a temporary
+        file beside dest, checked to be a valid .torrent and then renamed over dest, so dest is either the complete
+        file or untouched. Raises RequestException if the site doesn't answer with a valid .torrent file.
+        """
+        r, waited, start = self._get('torrents.php', 'download', self._download_params(id), stream=True,
+                                     priority=priority)
+        try:
+            self._check_status(r.status_code)
+            if r.status_code != 200:
+                raise RequestException("HTTP %s downloading torrent %s" % (r.status_code, id))
+            try:
+                size = atomic_write(dest, r.iter_content(chunk_size), is_valid_torrent_file)
+            except DownloadException as e:
+                raise RequestException(str(e))
+        finally:
+            r.close()
+        self.last_request = time.time()
+        if self.instrumentation is not None:
+            self.instrumentation.record_queue_wait('download', waited[0])
+            self.instrumentation.record_rate_wait('download', waited[1])
+            self.instrumentation.record_request('download', self.last_request - start, size)
+        return size
+
+    def download_torrents(self, ids, dest_dir, workers=4, queue_size=None, on_result=None, priority=LOW):
+        """
+        Downloads the .torrent files for all passed torrent IDs into dest_dir as <id>.torrent, skipping any already
+        there, on workers threads sharing this API's rate limit. Returns a dict of ID to DownloadResult (see
+        downloader.TorrentDownloader for the details).
+        """
+        return TorrentDownloader(self, dest_dir, workers, queue_size, on_result=on_result,
+                                 priority=priority).download(ids)
\ No newline at end of file
@@ -1,13 +1,27 @@
+from hooks import hydrates, fault_in
+from sync import REFETCH_FIELDS, snapshot_artist, diff_snapshots
+from schema import Schema, Field
+from freshness import is_fresh
 
 
 class InvalidArtistException(Exception):
     pass
 
+# what an 'artist' response fills in besides the lists; keys are the camelCase attribute names (see schema.py)
+FROM_ARTIST = Schema('artist_from_artist', [
+    Field('name'), Field('notifications_enabled'), Field('has_bookmarked'), Field('image'), Field('body'),
+    Field('vanity_house'), Field('statistics'),
+])
+
 class Artist(object):
     """
     This class represents an Artist. It is created knowing only its ID. To reduce API accesses, load information using
     Artist.update_data() only as needed.
     """
+    __slots__ = ('__weakref__', 'id', 'parent_api', 'name', 'notifications_enabled', 'has_bookmarked', 'image', 'body',
+                 'vanity_house', '_tags', '_similar_artists_and_score', 'statistics', '_torrent_groups', '_requests',
+                 'fetched')
+
     def __init__(self, id, parent_api):
         self.id = id
         self.parent_api = parent_api
@@ -17,29 +31,92 @@ class Artist(object):
         self.image = None
         self.body = None
         self.vanity_house = None
-        self.tags = []
-        self.similar_artists_and_score = {}
+        self._tags = None # containers are only created when first used; most known artists are never filled in
+        self._similar_artists_and_score = None
         self.statistics = None
-        self.torrent_groups = []
-        self.requests = []
+        self._torrent_groups = None
+        self._requests = None
+        self.fetched = None
 
         self.parent_api.cached_artists[self.id] = self # add self to cache of known Artist objects
 
-    def update_data(self):
-        response = self.parent_api.request(action='artist', id=self.id)
+    @property
+    def tags(self):
+        if self._tags is None:
+            self._tags = []
+        return self._tags
+
+    @tags.setter
+    def tags(self, value):
+        self._tags = value
+
+    @property
+    def similar_artists_and_score(self):
+        if self._similar_artists_and_score is None:
+            self._similar_artists_and_score = {}
+        return self._similar_artists_and_score
+
+    @similar_artists_and_score.setter
+    def similar_artists_and_score(self, value):
+        self._similar_artists_and_score = value
+
+    @property
+    def torrent_groups(self):
+        if self._torrent_groups is None:
+            self._torrent_groups = []
+        return self._torrent_groups
+
+    @torrent_groups.setter
+    def torrent_groups(self, value):
+        self._torrent_groups = value
+
+    @property
+    def requests(self):
+        if self._requests is None:
+            self._requests = []
+        return self._requests
+
+    @requests.setter
+    def requests(self, value):
+        self._requests = value
+
+    def update_data(self, max_age=None):
+        """
+        Calls 'artist' API action and updates this Artist with it, unless max_age is given and the 'artist' data is at
+        most that many seconds old (the call then bypasses the API's response cache). Returns whether the call was
+        made.
+        """
+        self.parent_api.on_blocking_call('Artist.update_data')
+        if is_fresh(self, max_age, 'artist'):
+            return False
+        response = self.parent_api.request(action='artist', id=self.id, bypass_cache=max_age is not None)
         self.set_data(response)
+        return True
 
+    def sync_data(self, fetch_groups=True, refetch_fields=REFETCH_FIELDS, workers=4):
+        """
+        Like update_data(), but also works out what changed since this artist was last loaded and returns it as a
+        sync.SyncResult. With fetch_groups, the torrent groups that are new or had torrents added, removed or edited
+        (see sync.REFETCH_FIELDS) are then filled with 'torrentgroup' calls; unchanged groups, and ones where only
+        seeders/snatches moved, keep what they had, updated from the 'artist' response. Both kinds of call bypass the
+        API's response cache.
+        """
+        self.parent_api.on_blocking_call('Artist.sync_data')
+        before = snapshot_artist(self)
+        self.set_data(self.parent_api.request(action='artist', id=self.id, bypass_cache=True))
+        result = diff_snapshots(before, snapshot_artist(self), refetch_fields)
+        if fetch_groups and result.refetch_groups:
+            result.group_errors = self.parent_api.fetch_torrent_groups(result.refetch_groups, workers,
+                                                                       bypass_cache=True)['errors']
+        return result
+
+    @hydrates('artist')
     def set_data(self, artist_json_response):
         if self.id != artist_json_response['id']:
             raise InvalidArtistException("Tried to update an artists's information from an 'artist' API call with a different id." +
                                " Should be %s, got %s" % (self.id, artist_json_response['id']) )
 
-        self.name = artist_json_response['name']
-        self.notifications_enabled = artist_json_response['notificationsEnabled']
-        self.has_bookmarked = artist_json_response['hasBookmarked']
-        self.image = artist_json_response['image']
-        self.body = artist_json_response['body']
-        self.vanity_house = artist_json_response['vanityHouse']
+        FROM_ARTIST.hydrate(self, artist_json_response)
 
         self.tags = []
         for tag_dict in artist_json_response['tags']:
@@ -53,8 +130,6 @@ class Artist(object):
             similar_artist.name = similar_artist_dict['name']
             self.similar_artists_and_score[similar_artist] = similar_artist_dict['score']
 
-        self.statistics = artist_json_response['statistics']
-
         self.torrent_groups = []
         for torrent_group_item in artist_json_response['torrentgroup']:
             torrent_group = self.parent_api.get_torrent_group(torrent_group_item['groupId'])
@@ -67,6 +142,16 @@ class Artist(object):
             request.set_data(request_json_item)
             self.requests.append(request)
 
+    def torrent_table(self):
+        """
+        Returns a TorrentTable (NumPy columns, needs numpy) of the torrents in this artist's torrent groups.
+        """
+        return self.parent_api.torrent_table([torrent for torrent_group in self.torrent_groups
+                                              for torrent in torrent_group.torrents])
+
+    def __getattr__(self, name):
+        return fault_in(self, name) # only reached for attributes never set, i.e. on objects loaded from a snapshot
+
     def __repr__(self):
         return "Artist: %s - ID: %s" % (self.name, self.id)
 
@@ -0,0 +1,247 @@
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from collections import deque
+
+from bulk import fetch_many
+
+try:
+    array('q')
+    _ID_TYPECODE = 'q'
+except ValueError:
+    _ID_TYPECODE = 'l' # Python 2 has no 'q'; 'l' is 64 bits on the platforms that matter
+
+_MAGIC = b'PGAG'
+_VERSION = 1
+# magic, version, little endian flag, node count, edge count, then the item sizes of ids/indptr and indices/weights
+_HEADER = struct.Struct('<4sHBxQQBB6x')
+
+class ArtistGraph(object):
+    """
+    The similar-artist graph in compressed sparse row form: ids holds the artist IDs in ascending order, and the
+    edges of the artist at position i are indices[indptr[i]:indptr[i + 1]] (positions in ids) with the matching
+    similarity scores in weights, highest score first. names[i] is the artist's name, if known.
+
+    Everything lives in a handful of flat arrays, so even a graph of millions of edges takes a few bytes per edge and
+    saves and loads with a single read or write per array. Build one with SimilarArtistCrawler (or
+    GazelleAPI.crawl_similar_artists()) or from_edges(), and keep it with save() and ArtistGraph.load().
+    """
+    def __init__(self, ids, indptr, indices, weights, names=None):
+        self.ids = ids
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.names = names if names is not None else [''] * len(ids)
+
+    @classmethod
+    def from_edges(cls, edges, names=None):
+        """
+        Builds a graph from a dict of artist ID to a list of (similar artist ID, score), and optionally a dict of
+        artist ID to name. Artists only seen as someone's neighbour become nodes without edges.
+        """
+        names = names or {}
+        node_ids = set(edges)
+        for neighbours in edges.values():
+            node_ids.update(neighbour for neighbour, _ in neighbours)
+        ids = array(_ID_TYPECODE, sorted(node_ids))
+        position = dict((id, i) for i, id in enumerate(ids))
+        indptr = array(_ID_TYPECODE, [0])
+        indices = array('i')
+        weights = array('i')
+        for id in ids:
+            neighbours = sorted(edges.get(id, ()), key=lambda edge: (-edge[1], edge[0]))
+            indices.extend(position[neighbour] for neighbour, _ in neighbours)
+            weights.extend(int(score) for _, score in neighbours)
+            indptr.append(len(indices))
+        return cls(ids, indptr, indices, weights, [names.get(id) or '' for id in ids])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, id):
+        return self.position(id) is not None
+
+    @property
+    def edge_count(self):
+        return len(self.indices)
+
+    def position(self, id):
+        """
+        Returns the row of artist id, or None if it isn't in the graph.
+        """
+        i = bisect_left(self.ids, id)
+        if i < len(self.ids) and self.ids[i] == id:
+            return i
+        return None
+
+    def _row(self, id):
+        i = self.position(id)
+        if i is None:
+            raise KeyError(id)
+        return i
+
+    def name(self, id):
+        return self.names[self._row(id)]
+
+    def degree(self, id):
+        i = self._row(id)
+        return self.indptr[i + 1] - self.indptr[i]
+
+    def neighbours(self, id):
+        """
+        Returns the artists similar to id as a list of (artist ID, score), highest score first. Raises KeyError if id
+        isn't in the graph.
+        """
+        i = self._row(id)
+        ids = self.ids
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return [(ids[j], weight) for j, weight in zip(self.indices[start:end], self.weights[start:end])]
+
+    def top_k(self, id, k=10):
+        """
+        Returns the k highest scoring neighbours of id as (artist ID, score) pairs. Rows are stored sorted by score,
+        so this is a slice.
+        """
+        i = self._row(id)
+        start = self.indptr[i]
+        end = min(self.indptr[i + 1], start + k)
+        ids = self.ids
+        return [(ids[j], weight) for j, weight in zip(self.indices[start:end], self.weights[start:end])]
+
+    def shortest_path(self, source, target, max_depth=None):
+        """
+        Returns the fewest-hops path from source to target along similarity edges as a list of artist IDs (both ends
+        included), or None if target can't be reached (within max_depth hops, if given).
+        """
+        start, goal = self._row(source), self._row(target)
+        if start == goal:
+            return [source]
+        indptr, indices = self.indptr, self.indices
+        parents = {start: None}
+        frontier = deque([(start, 0)])
+        while frontier:
+            node, depth = frontier.popleft()
+            if max_depth is not None and depth >= max_depth:
+                continue
+            for neighbour in indices[indptr[node]:indptr[node + 1]]:
+                if neighbour in parents:
+                    continue
+                parents[neighbour] = node
+                if neighbour == goal:
+                    path = []
+                    while neighbour is not None:
+                        path.append(self.ids[neighbour])
+                        neighbour = parents[neighbour]
+                    return path[::-1]
+                frontier.append((neighbour, depth + 1))
+        return None
+
+    def save(self, path):
+        """
+        Writes the graph to path in a compact binary format: a header, the four arrays as raw little endian data, then
+        the names as length-prefixed UTF-8.
+        """
+        little_endian = sys.byteorder == 'little'
+        with open(path, 'wb') as graph_file:
+            graph_file.write(_HEADER.pack(_MAGIC, _VERSION, 1, len(self.ids), len(self.indices),
+                                          self.ids.itemsize, self.indices.itemsize))
+            for values in (self.ids, self.indptr, self.indices, self.weights):
+                if not little_endian:
+                    values = array(values.typecode, values)
+                    values.byteswap()
+                values.tofile(graph_file)
+            encoded = [name.encode('utf-8') for name in self.names]
+            lengths = array('i', [len(name) for name in encoded])
+            if not little_endian:
+                lengths.byteswap()
+            lengths.tofile(graph_file)
+            graph_file.write(b''.join(encoded))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as graph_file:
+            magic, version, _, node_count, edge_count, id_size, index_size = \
+                _HEADER.unpack(graph_file.read(_HEADER.size))
+            if magic != _MAGIC or version != _VERSION:
+                raise ValueError("%s is not an artist graph file" % path)
+            if id_size != array(_ID_TYPECODE).itemsize or index_size != array('i').itemsize:
+                raise ValueError("%s was written with incompatible integer sizes" % path)
+            arrays = []
+            for typecode, count in ((_ID_TYPECODE, node_count), (_ID_TYPECODE, node_count + 1), ('i', edge_count),
+                                    ('i', edge_count), ('i', node_count)):
+                values = array(typecode)
+                values.fromfile(graph_file, count)
+                if sys.byteorder != 'little':
+                    values.byteswap()
+                arrays.append(values)
+            ids, indptr, indices, weights, lengths = arrays
+            blob = graph_file.read()
+        names = []
+        offset = 0
+        for length in lengths:
+            names.append(blob[offset:offset + length].decode('utf-8'))
+            offset += length
+        return cls(ids, indptr, indices, weights, names)
+
+    def __repr__(self):
+        return "ArtistGraph: %s artists, %s edges" % (len(self.ids), len(self.indices))
+
+
+class SimilarArtistCrawler(object):
+    """
+    Crawls the similar-artist graph breadth first from seed artists. Each artist is read with a raw 'artist' request
+    and only its name and similar artists are kept, so no Artist objects (or their torrent groups) are built. A
+    level's artists are fetched concurrently on workers threads, all within the API's rate limit.
+
+    crawl() stops after max_depth levels beyond the seeds or once max_artists artists have been fetched, whichever
+    comes first. Artists that were reached but not fetched are in the graph without edges of their own. Failed
+    fetches are recorded in errors (artist ID to exception).
+    """
+    def __init__(self, api, workers=4, priority=None):
+        self.api = api
+        self.workers = workers
+        self.priority = priority
+        self.errors = {}
+
+    def fetch(self, artist_id):
+        """
+        Returns (name, [(similar artist ID, score), ...], {similar artist ID: name}) for artist_id.
+        """
+        response = self.api.request('artist', priority=self.priority, id=artist_id)
+        similar_artists = response['similarArtists']
+        return (response['name'],
+                [(int(similar['artistId']), similar['score']) for similar in similar_artists],
+                dict((int(similar['artistId']), similar['name']) for similar in similar_artists))
+
+    def crawl(self, seeds, max_depth=2, max_artists=1000):
+        edges = {}
+        names = {}
+        seen = set()
+        frontier = []
+        for seed in seeds:
+            seed = int(seed)
+            if seed not in seen:
+                seen.add(seed)
+                frontier.append(seed)
+        depth = 0
+        while frontier and len(edges) < max_artists:
+            frontier = frontier[:max_artists - len(edges)]
+            outcome = fetch_many(frontier, self.fetch, self.workers)
+            self.errors.update(outcome['errors'])
+            next_frontier = []
+            for artist_id, result in zip(frontier, outcome['results']):
+                if result is None:
+                    continue
+                names[artist_id], edges[artist_id], similar_names = result
+                for similar_id, name in similar_names.items():
+                    names.setdefault(similar_id, name)
+                for similar_id, _ in edges[artist_id]:
+                    if similar_id not in seen:
+                        seen.add(similar_id)
+                        next_frontier.append(similar_id)
+            if depth >= max_depth:
+                break
+            frontier = next_frontier
+            depth += 1
+        return ArtistGraph.from_edges(edges, names)
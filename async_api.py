@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+#
+# asyncio flavour of GazelleAPI. Requires Python 3 and aiohttp.
+
+import asyncio
+import time
+from http.cookies import SimpleCookie
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+else:
+    from yarl import URL # installed with aiohttp
+
+from api import GazelleAPI, LoginException, RequestException
+from downloader import atomic_write, is_valid_torrent
+from freshness import is_fresh
+
+# the blocking helpers with a coroutine to use instead
+COROUTINES = {
+    'User.update_index_data': 'update_index_data(user)',
+    'User.update_user_data': 'update_user_data(user)',
+    'Artist.update_data': 'update_artist_data(artist)',
+    'TorrentGroup.update_group_data': 'update_group_data(torrent_group)',
+    'Mailbox.update_mbox_data': 'update_mbox_data(mailbox)',
+    'Conversation.update_conv_data': 'update_conv_data(conversation)',
+}
+
+# GazelleAPI's helpers built on blocking request() calls, which AsyncGazelleAPI refuses
+BLOCKING_METHODS = ('fetch_users', 'fetch_artists', 'fetch_torrent_groups', 'sync_artists', 'sync_mailbox',
+                    'refresh_stale', 'crawl_similar_artists', 'iter_search_users', 'iter_search_torrents',
+                    'iter_mailbox', 'download_torrents')
+
+
+class AsyncGazelleAPI(GazelleAPI):
+    """
+    An asyncio client for the Gazelle JSON API. It fills the same User/Artist/TorrentGroup/Torrent objects and identity
+    caches as GazelleAPI, so get_user(), get_artist() etc. work exactly as they do there, but every call that touches
+    the network is a coroutine:
+
+        api = AsyncGazelleAPI(username, password)
+        await api.login()
+        artist = api.get_artist(1460)
+        await api.update_artist_data(artist)
+        await api.close()
+
+    (or use 'async with AsyncGazelleAPI(...) as api:', which logs in and closes for you.)
+
+    The model objects' own update_*() methods make blocking calls through parent_api.request(), so with this client
+    use the api.update_*() coroutines instead; they and GazelleAPI's other blocking helpers (BLOCKING_METHODS: the
+    fetch_*(), iter_*() and sync_*() methods, refresh_stale(), download_torrents(), ...) raise TypeError here. Run
+    several coroutines at once with asyncio.gather() for the same effect.
+
+    All coroutines draw from one rate limiter: each one reserves its slot up front and awaits it, so concurrent tasks
+    share a single request budget without blocking the event loop. The limiter can be shared with a blocking
+    GazelleAPI too.
+
+    There is no priority queue here: GazelleAPI's PriorityScheduler blocks threads, so coroutines take their slots
+    straight from the rate limiter, in the order they ask, and the priority arguments are accepted but have no
+    effect. Their waits show up in the rate limiter's stats, not the scheduler's. To put interactive requests ahead
+    of a background crawl, give the crawl fewer concurrent tasks or its own GazelleAPI.
+    """
+    def __init__(self, username=None, password=None, rate_limiter=None, site=None, cache=None, identity_maps=None,
+                 decoder=None, instrumentation=None, session_store=None, indexes=False):
+        if aiohttp is None:
+            raise ImportError("AsyncGazelleAPI requires the aiohttp package")
+        self.session = None # created on first use, inside the running event loop
+        self._setup(username, password, rate_limiter, site, cache, identity_maps, decoder, instrumentation,
+                    session_store, indexes)
+        self._async_login_lock = None
+
+    def on_blocking_call(self, caller):
+        instead = COROUTINES.get(caller)
+        raise TypeError("%s() makes blocking calls, which AsyncGazelleAPI can't; %s" %
+                        (caller, "use 'await api.%s' instead" % instead if instead else "use its coroutines instead"))
+
+    async def __aenter__(self):
+        await self.login()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _get_session(self):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(headers=self.default_headers)
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def login(self):
+        """
+        Logs in user and gets authkey from server. A session saved in the session store is reused instead, as with
+        GazelleAPI.
+        """
+        if not self._restore_session():
+            await self._async_login()
+
+    async def _async_login(self):
+        async with self._get_session().post(self._url('login.php'), data=self._login_data()) as r:
+            if r.status != 200:
+                raise LoginException
+        status, content = await self._fetch('ajax.php', 'index', {}, relogin=False)
+        accountinfo = self._parse_response(content, 'index', {}, status)
+        self._save_session(accountinfo)
+        self._set_account_info(accountinfo)
+        self.logins += 1
+
+    async def _relogin(self, logins):
+        if self.username is None:
+            raise LoginException("Session expired, and there are no credentials to log in again")
+        if self._async_login_lock is None:
+            self._async_login_lock = asyncio.Lock()
+        async with self._async_login_lock:
+            if self.logins == logins:
+                self._get_session().cookie_jar.clear()
+                await self._async_login()
+
+    def _session_cookies(self):
+        return [{'name': morsel.key, 'value': morsel.value, 'domain': morsel['domain'], 'path': morsel['path']}
+                for morsel in self._get_session().cookie_jar]
+
+    def _restore_cookies(self, cookies):
+        jar = SimpleCookie()
+        for cookie in cookies:
+            jar[cookie['name']] = cookie['value']
+            jar[cookie['name']]['domain'] = cookie['domain'] or ''
+            jar[cookie['name']]['path'] = cookie['path'] or '/'
+        self._get_session().cookie_jar.update_cookies(jar, URL(self.site))
+
+    async def _wait_for_slot(self):
+        delay = self.rate_limiter.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self.rate_limiter.record_wait(delay)
+        return delay
+
+    async def request(self, action, bypass_cache=False, priority=None, **kwargs):
+        """
+        Makes an AJAX request at a given action.
+        Pass an action and relevant arguments for that action. Uses the cache like GazelleAPI.request(). priority is
+        ignored (see the class docs).
+        """
+        if not bypass_cache:
+            cached = self._cached_response(action, kwargs)
+            if cached is not None:
+                return cached
+        status, content = await self._fetch('ajax.php', action, kwargs)
+        return self._parse_response(content, action, kwargs, status)
+
+    async def unparsed_request(self, sitepage, action, **kwargs):
+        """
+        Makes a generic HTTP request at a given page with a given action.
+        Also pass relevant arguments for that action.
+        """
+        return await self._unparsed_request(sitepage, action, kwargs)
+
+    async def _unparsed_request(self, sitepage, action, kwargs, relogin=True):
+        return (await self._fetch(sitepage, action, kwargs, relogin))[1]
+
+    async def _fetch(self, sitepage, action, kwargs, relogin=True):
+        """
+        Private method.
+        Waits for a rate limiter slot and GETs sitepage, logging in again and retrying once if the session expired.
+        Returns the HTTP status and the body.
+        """
+        waited = 0.0
+        for retry in (False, True):
+            logins = self.logins
+            waited += await self._wait_for_slot()
+            start = time.time()
+            async with self._get_session().get(self._url(sitepage), params=self._str_params(action, kwargs),
+                                               allow_redirects=False) as r:
+                content = await r.read()
+            if retry or not relogin or not self._session_expired(r.status, r.headers):
+                break
+            await self._relogin(logins)
+        self.last_request = time.time()
+        if self.instrumentation is not None:
+            self.instrumentation.record_rate_wait(action, waited)
+            self.instrumentation.record_request(action, self.last_request - start, len(content))
+        self._check_status(r.status)
+        return r.status, content
+
+    def _str_params(self, action, kwargs):
+        # aiohttp only accepts string query values
+        return dict((key, str(value)) for key, value in self._request_params(action, kwargs).items())
+
+    async def search_users(self, search_query, page=None):
+        """
+        Coroutine version of GazelleAPI.search_users(). Returns one page of results, the first unless page is given.
+        """
+        if page is None:
+            response = await self.request(action='usersearch', search=search_query)
+        else:
+            response = await self.request(action='usersearch', search=search_query, page=page)
+        return self._set_user_search_data(response)
+
+    async def search_torrents(self, **kwargs):
+        """
+        Coroutine version of GazelleAPI.search_torrents(). Takes the same arguments and returns the same dict.
+        """
+        response = await self.request(action='browse', **kwargs)
+        return self._set_torrent_search_data(response)
+
+    async def update_index_data(self, user, max_age=None):
+        """
+        Coroutine version of User.update_index_data(). Only valid for the logged in user. Returns whether the call was
+        made, as the update_*_data() methods of the models do.
+        """
+        if is_fresh(user, max_age, 'index'):
+            return False
+        user.set_index_data(await self.request(action='index', bypass_cache=max_age is not None))
+        return True
+
+    async def update_user_data(self, user, max_age=None):
+        """
+        Coroutine version of User.update_user_data().
+        """
+        if is_fresh(user, max_age, 'user'):
+            return False
+        user.set_user_data(await self.request(action='user', id=user.id, bypass_cache=max_age is not None))
+        return True
+
+    async def update_artist_data(self, artist, max_age=None):
+        """
+        Coroutine version of Artist.update_data().
+        """
+        if is_fresh(artist, max_age, 'artist'):
+            return False
+        artist.set_data(await self.request(action='artist', id=artist.id, bypass_cache=max_age is not None))
+        return True
+
+    async def update_group_data(self, torrent_group, max_age=None):
+        """
+        Coroutine version of TorrentGroup.update_group_data().
+        """
+        if is_fresh(torrent_group, max_age, 'torrentgroup'):
+            return False
+        torrent_group.set_group_data(await self.request(action='torrentgroup', id=torrent_group.id,
+                                                        bypass_cache=max_age is not None))
+        return True
+
+    async def update_mbox_data(self, mailbox):
+        """
+        Coroutine version of Mailbox.update_mbox_data().
+        """
+        mailbox.set_mbox_data(await self.request(action='inbox', type=mailbox.boxtype, page=mailbox.current_page,
+                                                 sort=mailbox.sort))
+        return mailbox
+
+    async def update_conv_data(self, conversation):
+        """
+        Coroutine version of Conversation.update_conv_data().
+        """
+        conversation.set_conv_data(await self.request(action='inbox', type='viewconv', id=conversation.id))
+        return conversation
+
+    async def save_torrent_file(self, id, dest):
+        """
+        Downloads the .torrent file for torrent id to dest, atomically, like GazelleAPI.save_torrent_file(). Returns
+        its size. Raises RequestException if the site doesn't answer with a valid .torrent file.
+        """
+        status, file_data = await self._fetch("torrents.php", 'download', self._download_params(id))
+        if status != 200:
+            raise RequestException("HTTP %s downloading torrent %s" % (status, id))
+        if not is_valid_torrent(file_data):
+            raise RequestException("%s is not a valid .torrent file" % dest)
+        return atomic_write(dest, [file_data])
+
+
+def _refuse(name):
+    def method(self, *args, **kwargs):
+        self.on_blocking_call('GazelleAPI.' + name)
+    method.__name__ = name
+    method.__doc__ = "Not available: GazelleAPI.%s() makes blocking calls. Raises TypeError." % name
+    return method
+
+for _name in BLOCKING_METHODS:
+    setattr(AsyncGazelleAPI, _name, _refuse(_name))
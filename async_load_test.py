@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+#
+# load_test's counterpart for AsyncGazelleAPI: the same operations, run as asyncio tasks. Requires Python 3 and aiohttp.
+# Used by load_test.py's --async option.
+
+import asyncio
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from async_api import AsyncGazelleAPI
+from load_test import DEFAULT_MIX, summarize, _weighted_choice
+
+async def _artist(api, rng, catalogue, workdir):
+    await api.update_artist_data(api.get_artist(rng.randint(1, catalogue['artists'])))
+
+async def _torrentgroup(api, rng, catalogue, workdir):
+    group_id = rng.randint(1, catalogue['artists']) * 10000 + rng.randint(0, catalogue['groups_per_artist'] - 1)
+    await api.update_group_data(api.get_torrent_group(group_id))
+
+async def _browse(api, rng, catalogue, workdir):
+    await api.search_torrents(searchstr='', page=rng.randint(1, 20))
+
+async def _user(api, rng, catalogue, workdir):
+    await api.update_user_data(api.get_user(rng.randint(2, 5000)))
+
+async def _usersearch(api, rng, catalogue, workdir):
+    await api.search_users('user')
+
+async def _inbox(api, rng, catalogue, workdir):
+    await api.update_mbox_data(api.get_inbox())
+
+async def _download(api, rng, catalogue, workdir):
+    torrent_id = rng.randint(1, 10 ** 6)
+    await api.save_torrent_file(torrent_id, os.path.join(workdir, '%s.torrent' % torrent_id))
+
+OPERATIONS = {'artist': _artist, 'torrentgroup': _torrentgroup, 'browse': _browse, 'user': _user,
+              'usersearch': _usersearch, 'inbox': _inbox, 'download': _download}
+
+async def run_async_load_test(api, mix=None, tasks=8, requests=200, duration=None, catalogue=None, seed=0):
+    """
+    Like load_test.run_load_test(), with tasks concurrent asyncio tasks sharing the logged in AsyncGazelleAPI api.
+    Returns a report of the same shape. Coroutines wait on the rate limiter directly, so queue_wait is always 0.
+    """
+    mix = mix or DEFAULT_MIX
+    catalogue = catalogue or {'artists': 1000, 'groups_per_artist': 10}
+    names = sorted(mix)
+    weights = [mix[name] for name in names]
+    latencies = dict((name, []) for name in names)
+    errors = {}
+    budget = [requests]
+    workdir = tempfile.mkdtemp(prefix='pygazelle-load-')
+    wait_before = api.rate_limiter.stats()['total_wait']
+    start = time.time()
+    deadline = start + duration if duration else None
+
+    def take():
+        if deadline is not None and time.time() >= deadline:
+            return False
+        if requests is not None:
+            if budget[0] <= 0:
+                return False
+            budget[0] -= 1
+        return True
+
+    async def worker(worker_id):
+        rng = random.Random(seed * 1000 + worker_id)
+        while take():
+            name = _weighted_choice(rng, names, weights)
+            op_start = time.time()
+            try:
+                await OPERATIONS[name](api, rng, catalogue, workdir)
+            except Exception as e:
+                key = '%s: %s' % (name, type(e).__name__)
+                errors[key] = errors.get(key, 0) + 1
+            latencies[name].append(time.time() - op_start)
+
+    try:
+        await asyncio.gather(*[worker(i) for i in range(tasks)])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    elapsed = time.time() - start
+    all_latencies = [latency for values in latencies.values() for latency in values]
+    rate_limit_wait = api.rate_limiter.stats()['total_wait'] - wait_before
+    task_time = elapsed * tasks
+    return {'operations': len(all_latencies),
+            'elapsed': elapsed,
+            'throughput': len(all_latencies) / elapsed if elapsed else None,
+            'latency': summarize(all_latencies),
+            'latency_by_operation': dict((name, summarize(values)) for name, values in latencies.items() if values),
+            'errors': errors,
+            'rate_limit_wait': rate_limit_wait,
+            'rate_limit_wait_share': rate_limit_wait / task_time if task_time else None,
+            'queue_wait': 0.0,
+            'queue_wait_share': 0.0,
+            'rate_limiter': api.rate_limiter.stats(),
+            'instrumentation': api.instrumentation.snapshot() if api.instrumentation is not None else None}
+
+def run(username, password, rate_limiter, site, instrumentation=None, **options):
+    """
+    Logs an AsyncGazelleAPI in to site and runs run_async_load_test() with it in a new event loop. Returns the
+    report.
+    """
+    async def session():
+        async with AsyncGazelleAPI(username, password, rate_limiter, site=site,
+                                   instrumentation=instrumentation) as api:
+            return await run_async_load_test(api, **options)
+    return asyncio.run(session())
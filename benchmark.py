@@ -0,0 +1,439 @@
+#!/usr/bin/env python
+#
+# Offline benchmarks for pygazelle's parsing and model objects. Run from the package directory with:
+#   python benchmark.py --help
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import timeit
+
+from api import GazelleAPI
+from json_decoder import available_decoders, get_decoder
+from file_list import FileList
+import torrent
+import torrent_table
+import fixtures
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+class OfflineAPI(GazelleAPI):
+    """
+    A GazelleAPI that never touches the network, for hydrating recorded or generated payloads.
+    """
+    def __init__(self, **options):
+        self.session = None
+        self._setup(**options)
+
+
+class _DictModel(object):
+    """
+    Plain __dict__-backed object used as the "before" baseline in the memory benchmark.
+    """
+    pass
+
+
+def _as_dict_model(obj):
+    # copy every attribute a slotted model exposes onto a plain object, the way the models stored them before slots
+    # (containers created up front). The values are the very objects the slotted model holds, interned strings
+    # included, so both sides of the comparison count only the object and its attribute storage.
+    copy = _DictModel()
+    for cls in type(obj).__mro__:
+        for slot in getattr(cls, '__slots__', ()):
+            if not slot.startswith('__'):
+                name = slot.lstrip('_')
+                setattr(copy, name, getattr(obj, name))
+    return copy
+
+
+def _allocated_bytes(build):
+    """
+    Returns (result of build(), bytes it allocated that are still alive).
+    """
+    gc.collect()
+    if tracemalloc is None:
+        raise RuntimeError("the memory benchmark needs tracemalloc (Python 3.4+)")
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return result, after - before
+
+
+def model_memory(count=2000):
+    """
+    Builds count hydrated Torrents, TorrentGroups, Artists and Users, and returns a dict of class name to bytes per
+    object for the slotted models and for equivalent plain __dict__ objects holding the same attribute values.
+    """
+    api = OfflineAPI()
+    group_ids = range(1, count // 5 + 1)
+    for group_id in group_ids:
+        api.get_torrent_group(group_id).set_group_data(fixtures.torrentgroup_response(group_id, 5, 12, group_id))
+    artist_ids = range(1, count + 1)
+    for artist_id in artist_ids:
+        api.get_artist(artist_id).set_data(fixtures.artist_response(artist_id, 1, 1, 2, 0))
+    user_ids = range(1, count + 1)
+    for user_id in user_ids:
+        api.get_user(user_id).set_user_data(fixtures.user_response(user_id))
+
+    results = {}
+    for name, objects in [('Torrent', [api.get_torrent(id) for id in api.cached_torrents.keys()][:count]),
+                          ('TorrentGroup', [api.get_torrent_group(id) for id in group_ids]),
+                          ('Artist', [api.get_artist(id) for id in artist_ids]),
+                          ('User', [api.get_user(id) for id in user_ids])]:
+        # measure the object shells and the per-object storage of their attributes, not the shared values
+        slotted, slotted_bytes = _allocated_bytes(lambda: [_reconstruct(obj) for obj in objects])
+        plain, plain_bytes = _allocated_bytes(lambda: [_as_dict_model(obj) for obj in objects])
+        results[name] = {'objects': len(objects),
+                         'before_bytes_per_object': plain_bytes // len(objects),
+                         'after_bytes_per_object': slotted_bytes // len(objects)}
+    return results
+
+
+def _reconstruct(obj):
+    # a fresh copy of a slotted model, built without registering it with the API
+    copy = type(obj).__new__(type(obj))
+    for cls in type(obj).__mro__:
+        for slot in getattr(cls, '__slots__', ()):
+            if not slot.startswith('__'):
+                setattr(copy, slot, getattr(obj, slot))
+    return copy
+
+
+# the hand-written Torrent.set_*_data() bodies the compiled schemas replaced, kept as the baseline for
+# hydrator_speed()
+def _hand_written_torrent_from_artist(self, data):
+    self.group = self.parent_api.get_torrent_group(data['groupId'])
+    self.media = data['media']
+    self.format = data['format']
+    self.encoding = data['encoding']
+    self.remaster_year = data['remasterYear']
+    self.remastered = data['remastered']
+    self.remaster_title = data['remasterTitle']
+    self.remaster_record_label = data['remasterRecordLabel']
+    self.scene = data['scene']
+    self.has_log = data['hasLog']
+    self.has_cue = data['hasCue']
+    self.log_score = data['logScore']
+    self.file_count = data['fileCount']
+    self.free_torrent = data['freeTorrent']
+    self.size = data['size']
+    self.leechers = data['leechers']
+    self.seeders = data['seeders']
+    self.snatched = data['snatched']
+    self.time = data['time']
+    self.has_file = data['hasFile']
+
+def _hand_written_torrent_from_torrent_group(self, data):
+    self.group = self.parent_api.get_torrent_group(data['groupId'])
+    self.media = data['media']
+    self.format = data['format']
+    self.encoding = data['encoding']
+    self.remastered = data['remastered']
+    self.remaster_year = data['remasterYear']
+    self.remaster_title = data['remasterTitle']
+    self.remaster_record_label = data['remasterRecordLabel']
+    self.remaster_catalogue_number = data['remasterCatalogueNumber']
+    self.scene = data['scene']
+    self.has_log = data['hasLog']
+    self.has_cue = data['hasCue']
+    self.log_score = data['logScore']
+    self.file_count = data['fileCount']
+    self.size = data['size']
+    self.seeders = data['seeders']
+    self.leechers = data['leechers']
+    self.snatched = data['snatched']
+    self.free_torrent = data['freeTorrent']
+    self.time = data['time']
+    self.description = data['description']
+    self.file_list = FileList(data['fileList'])
+    self.file_path = data['filePath']
+    self.user = self.parent_api.get_user(data['userId'])
+
+def _hand_written_torrent_from_browse(self, data):
+    self.group = self.parent_api.get_torrent_group(data['groupId'])
+    self.remastered = data['remastered']
+    self.remaster_year = data['remasterYear']
+    self.remaster_title = data['remasterTitle']
+    self.remaster_catalogue_number = data['remasterCatalogueNumber']
+    self.media = data['media']
+    self.format = data['format']
+    self.encoding = data['encoding']
+    self.has_log = data['hasLog']
+    self.has_cue = data['hasCue']
+    self.log_score = data['logScore']
+    self.scene = data['scene']
+    self.file_count = data['fileCount']
+    self.size = data['size']
+    self.seeders = data['seeders']
+    self.leechers = data['leechers']
+    self.snatched = data['snatches']
+    self.free_torrent = data['isFreeleech'] or data['isPersonalFreeleech']
+    self.time = data['time']
+
+
+def _torrent_items(count):
+    # (schema, hand-written baseline, count torrent items of the matching response)
+    artist = fixtures.artist_response(1, max(1, count // 5), 5)
+    from_artist = [dict(item, groupId=group['groupId']) for group in artist['torrentgroup'] for item in group['torrent']]
+    from_group = []
+    for group_id in range(1, count // 5 + 2):
+        from_group.extend(dict(item, groupId=group_id) for item in fixtures.torrentgroup_response(group_id)['torrents'])
+    from_browse = []
+    for group in fixtures.browse_response(1, 1, max(1, count // 5), 5)['results']:
+        from_browse.extend(dict(item, groupId=group['groupId']) for item in group['torrents'])
+    return [(torrent.FROM_ARTIST, _hand_written_torrent_from_artist, from_artist[:count]),
+            (torrent.FROM_TORRENT_GROUP, _hand_written_torrent_from_torrent_group, from_group[:count]),
+            (torrent.FROM_BROWSE, _hand_written_torrent_from_browse, from_browse[:count])]
+
+
+def hydrator_speed(count=20000, repeat=5):
+    """
+    Times the Torrent schemas' compiled hydrators (see schema.py) against the hand-written set_*_data() bodies they
+    replaced, each filling the same count Torrents from generated response items. Returns a dict of schema name to
+    {'objects': count, 'hand_written': objects per second, 'compiled': objects per second}.
+    """
+    results = {}
+    for schema, hand_written, items in _torrent_items(count):
+        api = OfflineAPI()
+        pairs = [(api.get_torrent(item['id'] if 'id' in item else item['torrentId']), item) for item in items]
+        result = {'objects': len(pairs)}
+        for name, hydrate in (('hand_written', hand_written), ('compiled', schema.hydrate)):
+            def run():
+                for obj, item in pairs:
+                    hydrate(obj, item)
+            result[name] = len(pairs) / min(timeit.repeat(run, number=1, repeat=repeat))
+        results[schema.name] = result
+    return results
+
+
+def decoder_speed(payloads, repeat=5):
+    """
+    Times every installed JSON decoder on each payload (a dict of name to response body bytes). Returns a dict of
+    payload name to {'bytes': size, decoder name: best seconds per decode}.
+    """
+    results = {}
+    for payload_name, body in sorted(payloads.items()):
+        result = {'bytes': len(body)}
+        for decoder_name, loads in available_decoders():
+            number = max(1, int(2e7 // max(len(body), 1)))
+            result[decoder_name] = min(timeit.repeat(lambda: loads(body), number=number, repeat=repeat)) / number
+        results[payload_name] = result
+    return results
+
+
+def _envelope(response):
+    return json.dumps({'status': 'success', 'response': response}).encode('utf-8')
+
+
+def generated_payloads():
+    """
+    Response bodies for the decoder benchmark: a small and a huge 'artist' discography and a big 'torrentgroup'.
+    """
+    return {'artist-20-groups': _envelope(fixtures.artist_response(1, 20, 4)),
+            'artist-2000-groups': _envelope(fixtures.artist_response(2, 2000, 6)),
+            'torrentgroup-40-torrents': _envelope(fixtures.torrentgroup_response(3, 40, 200))}
+
+
+def _search_case(torrents):
+    groups = max(1, torrents // 5)
+    return _envelope(fixtures.browse_response(1, 1, groups, torrents // groups)), \
+        lambda api, response: len(api._set_torrent_search_data(response)['results']) + groups
+
+
+def _search_table_case(torrents):
+    # exports the search results as well, so browse responses (release types by name) are checked to export
+    body, _ = _search_case(torrents)
+    def run(api, response):
+        table = api.torrent_table(api._set_torrent_search_data(response)['results'])
+        assert (table.release_type >= 0).all()
+        return len(table)
+    return body, run
+
+
+def _artist_case(torrents):
+    groups = max(1, torrents // 5)
+    def run(api, response):
+        artist = api.get_artist(response['id'])
+        artist.set_data(response)
+        return 1 + len(artist.torrent_groups) + sum(len(group.torrents) for group in artist.torrent_groups)
+    return _envelope(fixtures.artist_response(1, groups, torrents // groups)), run
+
+
+def _torrentgroup_case(torrents, parse_files):
+    def run(api, response):
+        torrent_group = api.get_torrent_group(response['group']['id'])
+        torrent_group.set_group_data(response)
+        if parse_files:
+            for group_torrent in torrent_group.torrents:
+                group_torrent.file_list.total_size()
+        return 1 + len(torrent_group.torrents)
+    return _envelope(fixtures.torrentgroup_response(1, torrents, 20)), run
+
+
+def _user_case(users):
+    # each user is filled twice, so the second call exercises the stats merge
+    bodies = [_envelope(fixtures.user_response(user_id)) for user_id in range(1, users + 1)]
+    def run(api, responses):
+        for user_id, response in enumerate(responses, 1):
+            user = api.get_user(user_id)
+            user.set_user_data(response)
+            user.set_user_data(dict(response, stats=dict(response['stats'])))
+        return len(responses)
+    return b'[' + b','.join(bodies) + b']', run
+
+
+CASES = {
+    'search': _search_case,
+    'artist': _artist_case,
+    'torrentgroup': lambda size: _torrentgroup_case(size, False),
+    'torrentgroup-filelist': lambda size: _torrentgroup_case(size, True),
+    'user': _user_case,
+}
+if torrent_table.numpy is not None:
+    CASES['search-table'] = _search_table_case
+
+# recorded bodies are matched to a case by file name prefix, e.g. artist-radiohead.json
+RECORDED_RUNNERS = {
+    'browse': lambda api, response: len(api._set_torrent_search_data(response)['results']),
+    'artist': lambda api, response: _artist_case(1)[1](api, response),
+    'torrentgroup': lambda api, response: _torrentgroup_case(1, True)[1](api, response),
+    'user': lambda api, response: _user_case(0)[1](api, [response]),
+}
+
+
+def _decode_response(loads, body):
+    parsed = loads(body)
+    return parsed['response'] if isinstance(parsed, dict) else [item['response'] for item in parsed]
+
+
+def run_hydration_case(name, size, body, run, loads, repeat=3):
+    """
+    Replays body through run on a fresh OfflineAPI repeat times. Decoding happens outside the timed part (every run
+    needs its own copy, since hydration modifies the response). Returns a result dict with the best time, objects
+    per second and peak traced memory of one extra run.
+    """
+    best = None
+    objects = 0
+    for _ in range(repeat):
+        response = _decode_response(loads, body)
+        api = OfflineAPI()
+        gc.collect()
+        start = time.time()
+        objects = run(api, response)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    peak = None
+    if tracemalloc is not None:
+        response = _decode_response(loads, body)
+        api = OfflineAPI()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            run(api, response)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return {'case': name, 'size': size, 'body_bytes': len(body), 'objects': objects, 'seconds': best,
+            'objects_per_second': objects / best if best else None, 'peak_bytes': peak}
+
+
+def hydration(sizes=(10, 1000, 50000), cases=None, recorded=(), repeat=3):
+    """
+    Runs the hydration benchmarks: every case in CASES (or the named ones) at every size, plus any recorded response
+    bodies. Returns a list of result dicts (see run_hydration_case()).
+    """
+    decoder_name, loads = get_decoder()
+    results = []
+    for name in cases or sorted(CASES):
+        for size in sizes:
+            body, run = CASES[name](size)
+            results.append(run_hydration_case(name, size, body, run, loads, repeat))
+    for path in recorded:
+        action = os.path.basename(path).split('-')[0].split('.')[0]
+        if action not in RECORDED_RUNNERS:
+            raise ValueError("Don't know how to replay %s; name it <action>-*.json, action one of %s" %
+                             (path, sorted(RECORDED_RUNNERS)))
+        with open(path, 'rb') as body_file:
+            body = body_file.read()
+        results.append(run_hydration_case(path, None, body, RECORDED_RUNNERS[action], loads, repeat))
+    return results
+
+
+def environment():
+    """
+    Describes the machine and interpreter, saved alongside results so runs can be compared.
+    """
+    return {'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'json_decoder': get_decoder()[0],
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Offline pygazelle benchmarks")
+    parser.add_argument('benchmark', choices=['hydration', 'hydrators', 'memory', 'decode'])
+    parser.add_argument('payloads', nargs='*', help="recorded ajax.php response bodies to replay, named "
+                                                    "<action>-*.json for hydration (default: generated ones)")
+    parser.add_argument('--sizes', default='10,1000,50000', help="comma separated hydration sizes (torrents or "
+                                                                 "users per case)")
+    parser.add_argument('--cases', help="comma separated hydration cases, from: %s" % ", ".join(sorted(CASES)))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="save results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    results = None
+    if args.benchmark == 'hydration':
+        sizes = [int(size) for size in args.sizes.split(',') if size]
+        cases = args.cases.split(',') if args.cases else None
+        results = hydration(sizes, cases, args.payloads, args.repeat)
+        for result in results:
+            peak = "%.1f MB peak" % (result['peak_bytes'] / 1e6) if result['peak_bytes'] is not None else ""
+            print("%-22s %6s %8d objects %9.4fs %12.0f objects/s %s" %
+                  (result['case'], result['size'] or '', result['objects'], result['seconds'],
+                   result['objects_per_second'] or 0, peak))
+    elif args.benchmark == 'hydrators':
+        results = hydrator_speed(repeat=args.repeat)
+        for name, result in sorted(results.items()):
+            print("%-28s %8.0f objects/s hand-written, %8.0f compiled (%d objects)" %
+                  (name, result['hand_written'], result['compiled'], result['objects']))
+    elif args.benchmark == 'memory':
+        results = model_memory()
+        for name, result in sorted(results.items()):
+            print("%-12s %6d bytes/object before, %6d after (%d objects)" %
+                  (name, result['before_bytes_per_object'], result['after_bytes_per_object'], result['objects']))
+    elif args.benchmark == 'decode':
+        payloads = generated_payloads()
+        if args.payloads:
+            payloads = {}
+            for path in args.payloads:
+                with open(path, 'rb') as payload_file:
+                    payloads[path] = payload_file.read()
+        results = decoder_speed(payloads)
+        for name, result in sorted(results.items()):
+            timings = ", ".join("%s %.2fms" % (decoder, result[decoder] * 1000)
+                                for decoder, _ in available_decoders())
+            print("%s (%d bytes): %s" % (name, result['bytes'], timings))
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({'benchmark': args.benchmark, 'environment': environment(), 'results': results}, output_file,
+                      indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,83 @@
+import threading
+from multiprocessing.pool import ThreadPool
+
+class InFlightRequests(object):
+    """
+    Merges concurrent identical calls. While a call for a key is running, other threads asking for the same key wait
+    for it and get its result (or its exception) instead of making the call again. Once the call finishes the key is
+    forgotten, so later calls go out as usual.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.merged = 0
+
+    def call(self, key, function):
+        with self._lock:
+            pending = self._calls.get(key)
+            if pending is None:
+                pending = self._calls[key] = _PendingCall()
+                owner = True
+            else:
+                self.merged += 1
+                owner = False
+        if not owner:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.result
+        try:
+            pending.result = function()
+            return pending.result
+        except Exception as e:
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            pending.done.set()
+
+    def __len__(self):
+        return len(self._calls)
+
+
+class _PendingCall(object):
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def fetch_many(ids, fetch, workers=4):
+    """
+    Calls fetch(id) for every distinct ID on a pool of worker threads. Returns a dict with 'results', a list in the
+    same order as ids holding fetch's return value for each (None where it failed), and 'errors', a dict of ID to the
+    exception its fetch raised.
+    """
+    ids = list(ids)
+    unique_ids = []
+    seen = set()
+    for id in ids:
+        if id not in seen:
+            seen.add(id)
+            unique_ids.append(id)
+
+    outcomes = {}
+    def run(id):
+        try:
+            outcomes[id] = (fetch(id), None)
+        except Exception as e:
+            outcomes[id] = (None, e)
+
+    if unique_ids:
+        pool = ThreadPool(max(1, min(workers, len(unique_ids))))
+        try:
+            pool.map(run, unique_ids)
+        finally:
+            pool.close()
+            pool.join()
+
+    errors = dict((id, outcomes[id][1]) for id in unique_ids if outcomes[id][1] is not None)
+    return {'results': [outcomes[id][0] for id in ids], 'errors': errors}
@@ -1,3 +1,5 @@
+from hooks import fault_in
+
 class InvalidCategoryException(Exception):
     pass
 
@@ -9,5 +11,8 @@ class Category(object):
 
         self.parent_api.cached_categories[self.id] = self # add self to cache of known Category objects
 
+    def __getattr__(self, name):
+        return fault_in(self, name) # only reached for attributes never set, i.e. on objects loaded from a snapshot
+
     def __repr__(self):
         return "Category: %s - id: %s" % (self.name, self.id)
\ No newline at end of file
@@ -0,0 +1,53 @@
+import threading
+
+import media
+import format
+import encoding
+import release_type
+
+class CodeTable(object):
+    """
+    Maps the handful of distinct strings a field can hold (media, format, encoding...) to small ints and back, so
+    model objects can store a shared int instead of their own copy of the string. Values seen for the first time get
+    the next free code, so unexpected strings from the site still round-trip.
+    """
+    def __init__(self, values):
+        self._lock = threading.Lock()
+        self.values = []
+        self.codes = {}
+        for value in values:
+            self.code(value)
+
+    def code(self, value):
+        """
+        Returns the code for value, assigning a new one if needed. None stays None.
+        """
+        if value is None:
+            return None
+        code = self.codes.get(value)
+        if code is None:
+            with self._lock:
+                code = self.codes.get(value)
+                if code is None:
+                    code = self.codes[value] = len(self.values)
+                    self.values.append(value)
+        return code
+
+    def value(self, code):
+        """
+        Returns the string for code. None stays None.
+        """
+        if code is None:
+            return None
+        return self.values[code]
+
+    def __len__(self):
+        return len(self.values)
+
+    def __repr__(self):
+        return "CodeTable: %s values" % len(self.values)
+
+MEDIA = CodeTable(media.ALL_MEDIAS)
+FORMAT = CodeTable(format.ALL_FORMATS)
+ENCODING = CodeTable(encoding.ALL_ENCODINGS)
+RELEASE_TYPE = CodeTable(release_type.ALL_RELEASE_TYPES)
@@ -0,0 +1,207 @@
+import os
+import tempfile
+import threading
+
+try:
+    from queue import Queue
+except ImportError: # Python 2
+    from Queue import Queue
+
+class DownloadException(Exception):
+    pass
+
+def bencode_end(data, start=0):
+    """
+    Returns the index just past the bencoded value starting at data[start], or raises ValueError if it isn't a
+    well-formed value. Walks the structure without building it, so checking a large .torrent file is cheap.
+    """
+    end = len(data)
+    stack = 0 # open lists and dicts
+    index = start
+    while True:
+        if index >= end:
+            raise ValueError("truncated bencode")
+        token = data[index:index + 1]
+        if token in (b'd', b'l'):
+            stack += 1
+            index += 1
+            continue
+        if token == b'e':
+            if not stack:
+                raise ValueError("unexpected end marker at %d" % index)
+            stack -= 1
+            index += 1
+        elif token == b'i':
+            close = data.find(b'e', index)
+            if close < 0:
+                raise ValueError("unterminated integer at %d" % index)
+            int(data[index + 1:close])
+            index = close + 1
+        elif token.isdigit():
+            colon = data.find(b':', index)
+            if colon < 0:
+                raise ValueError("bad string length at %d" % index)
+            index = colon + 1 + int(data[index:colon])
+            if index > end:
+                raise ValueError("truncated string")
+        else:
+            raise ValueError("unexpected %r at %d" % (token, index))
+        if not stack:
+            return index
+
+def is_valid_torrent(data):
+    """
+    Returns whether data (bytes) is a complete bencoded dictionary with an info section, as a .torrent file is. Sites
+    answer bad or unauthorized downloads with an HTML page, which this rejects.
+    """
+    if data[:1] != b'd' or b'4:info' not in data:
+        return False
+    try:
+        return bencode_end(data) == len(data)
+    except ValueError:
+        return False
+
+def is_valid_torrent_file(path):
+    try:
+        with open(path, 'rb') as torrent_file:
+            return is_valid_torrent(torrent_file.read())
+    except (IOError, OSError):
+        return False
+
+def atomic_write(dest, chunks, validate=None):
+    """
+    Writes the byte strings from chunks to a temporary file next to dest, then renames it over dest, so dest is never
+    seen half written, even if the process dies. If validate is given, it's called with the temporary file's path
+    before the rename and the write is abandoned with a DownloadException if it returns False. Returns the number of
+    bytes written.
+    """
+    directory = os.path.dirname(os.path.abspath(dest))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(dest), suffix='.part')
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            for chunk in chunks:
+                if chunk:
+                    temp_file.write(chunk)
+                    size += len(chunk)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        if validate is not None and not validate(temp_path):
+            raise DownloadException("%s is not a valid .torrent file" % dest)
+        if hasattr(os, 'replace'):
+            os.replace(temp_path, dest)
+        else: # Python 2; rename replaces existing files on POSIX
+            os.rename(temp_path, dest)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return size
+
+
+class DownloadResult(object):
+    """
+    What happened to one torrent: status is 'downloaded', 'skipped' (a valid file was already there) or 'failed'
+    (with the exception in error). size is the file's size in bytes.
+    """
+    __slots__ = ('torrent_id', 'path', 'status', 'size', 'error')
+
+    def __init__(self, torrent_id, path, status, size=0, error=None):
+        self.torrent_id = torrent_id
+        self.path = path
+        self.status = status
+        self.size = size
+        self.error = error
+
+    def __repr__(self):
+        return "DownloadResult: %s %s (%s)" % (self.torrent_id, self.status, self.error or self.path)
+
+
+class TorrentDownloader(object):
+    """
+    Downloads many .torrent files into dest_dir as <id>.torrent (or filename(id)). Each file is streamed to disk in
+    chunks through api.save_torrent_file(), so it's written atomically and checked to be valid bencode. Files already
+    in dest_dir and valid are skipped, so an interrupted job can simply be run again.
+
+    IDs are fed to workers threads through a queue holding at most queue_size entries, so a huge (or lazily generated)
+    list of IDs isn't expanded up front. Every request still goes through api's rate limiter, so downloads share the
+    request budget with anything else using the API; priority (from the scheduler module) sets where they queue.
+    """
+    def __init__(self, api, dest_dir, workers=4, queue_size=None, chunk_size=64 * 1024, filename=None,
+                 on_result=None, priority=None):
+        self.api = api
+        self.dest_dir = dest_dir
+        self.workers = workers
+        self.queue_size = queue_size or workers * 2
+        self.chunk_size = chunk_size
+        self.filename = filename or (lambda torrent_id: '%s.torrent' % torrent_id)
+        self.on_result = on_result
+        self.priority = priority
+        self._lock = threading.Lock()
+        self.counts = {'downloaded': 0, 'skipped': 0, 'failed': 0}
+
+    def path(self, torrent_id):
+        return os.path.join(self.dest_dir, self.filename(torrent_id))
+
+    def download_one(self, torrent_id):
+        """
+        Downloads a single torrent unless a valid copy exists. Returns its DownloadResult; never raises for a failed
+        download.
+        """
+        path = self.path(torrent_id)
+        try:
+            if os.path.exists(path) and is_valid_torrent_file(path):
+                return DownloadResult(torrent_id, path, 'skipped', os.path.getsize(path))
+            size = self.api.save_torrent_file(torrent_id, path, self.chunk_size, self.priority)
+        except Exception as e:
+            return DownloadResult(torrent_id, path, 'failed', error=e)
+        return DownloadResult(torrent_id, path, 'downloaded', size)
+
+    def download(self, ids):
+        """
+        Downloads the torrents for ids (any iterable; repeated IDs are fetched once). Returns a dict of torrent ID to
+        DownloadResult. If on_result was given, it's also called with each DownloadResult as soon as it's known; should
+        it raise, that torrent's result is 'failed' with its exception.
+        """
+        if not os.path.isdir(self.dest_dir):
+            os.makedirs(self.dest_dir)
+        queue = Queue(self.queue_size)
+        results = {}
+
+        def worker():
+            while True:
+                torrent_id = queue.get()
+                if torrent_id is None:
+                    return
+                result = None
+                try:
+                    result = self.download_one(torrent_id)
+                    if self.on_result is not None:
+                        self.on_result(result)
+                except Exception as e: # a dead worker would leave queue.put() and join() below blocked for good
+                    result = DownloadResult(torrent_id, result and result.path, 'failed', error=e)
+                with self._lock:
+                    results[torrent_id] = result
+                    self.counts[result.status] += 1
+
+        threads = [threading.Thread(target=worker) for _ in range(max(1, self.workers))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            seen = set()
+            for torrent_id in ids:
+                torrent_id = int(torrent_id)
+                if torrent_id not in seen:
+                    seen.add(torrent_id)
+                    queue.put(torrent_id)
+        finally:
+            for _ in threads:
+                queue.put(None)
+            for thread in threads:
+                thread.join()
+        return results
+
+    def __repr__(self):
+        return "TorrentDownloader: %s (%s)" % (self.dest_dir, ", ".join("%s %s" % item
+                                                                         for item in sorted(self.counts.items())))
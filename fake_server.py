@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+#
+# A local stand-in for a Gazelle site, for load tests and offline development. Run from the package directory with:
+#   python fake_server.py --port 8080 --latency 0.05 --error-rate 0.01
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError: # Python 2
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+import fixtures
+
+class FakeGazelleServer(ThreadingMixIn, HTTPServer):
+    """
+    Serves login.php, ajax.php (index, browse, artist, torrentgroup, user, usersearch and inbox) and
+    torrents.php?action=download from a synthetic catalogue built with the fixtures module:
+        artists 1..artists, each with groups_per_artist torrent groups (IDs artist * 10000 + n), each with
+        torrents_per_group torrents (IDs group * 100 + n). Unknown IDs get a 'failure' response like the real site.
+
+    Misbehaviour is configurable:
+        latency, latency_jitter: seconds added to every response (jitter is uniformly random on top)
+        error_rate: fraction of requests answered with an HTTP 500
+        failure_rate: fraction of ajax.php requests answered with {"status": "failure"}
+        throttle_rate: fraction of requests answered with an HTTP 429 throttling response
+        min_interval: answer with a 429 whenever two requests arrive less than this many seconds apart, like the
+                      site's own rate limiting
+        require_session: redirect requests without the cookie from a login to login.php, like the real site does
+                         once a session has expired; expire_sessions() forgets all sessions handed out so far
+
+    Counts of what was served are kept in stats. start() serves from a background thread; url is the site URL to
+    pass to GazelleAPI.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.0, latency_jitter=0.0, error_rate=0.0, failure_rate=0.0,
+                 throttle_rate=0.0, min_interval=None, artists=1000, groups_per_artist=10, torrents_per_group=5,
+                 files_per_torrent=12, inbox_pages=4, seed=0, require_session=False):
+        HTTPServer.__init__(self, address, FakeGazelleHandler)
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.failure_rate = failure_rate
+        self.throttle_rate = throttle_rate
+        self.min_interval = min_interval
+        self.artists = artists
+        self.groups_per_artist = groups_per_artist
+        self.torrents_per_group = torrents_per_group
+        self.files_per_torrent = files_per_torrent
+        self.inbox_pages = inbox_pages
+        self.require_session = require_session
+        self.sessions = set()
+        self.read_conversations = set()
+        self.random = random.Random(seed)
+        self.user_id = 1
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._last_request = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return "http://%s:%s/" % self.server_address[:2]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def roll(self, rate):
+        with self._lock:
+            return rate and self.random.random() < rate
+
+    def too_soon(self):
+        """
+        Records a request arrival and returns whether it came less than min_interval after the previous one.
+        """
+        with self._lock:
+            now = time.time()
+            too_soon = self.min_interval and self._last_request is not None and \
+                now - self._last_request < self.min_interval
+            self._last_request = now
+            return too_soon
+
+    def new_session(self):
+        with self._lock:
+            session = 'fake%d' % (len(self.sessions) + self.stats.get('login', 0))
+            self.sessions.add(session)
+            return session
+
+    def expire_sessions(self):
+        with self._lock:
+            self.sessions.clear()
+
+    def delay(self):
+        with self._lock:
+            jitter = self.random.uniform(0, self.latency_jitter) if self.latency_jitter else 0.0
+        if self.latency or jitter:
+            time.sleep(self.latency + jitter)
+
+    # catalogue
+
+    def catalogue_size(self):
+        return self.artists * self.groups_per_artist
+
+    def group_id_at(self, index):
+        return (index // self.groups_per_artist + 1) * 10000 + index % self.groups_per_artist
+
+    def group_exists(self, group_id):
+        artist_id, offset = divmod(group_id, 10000)
+        return 1 <= artist_id <= self.artists and offset < self.groups_per_artist
+
+    def response(self, action, params):
+        """
+        Returns the 'response' payload for an ajax.php action, or None for a bad request.
+        """
+        def int_param(name, default=None):
+            try:
+                return int(params.get(name, default))
+            except (TypeError, ValueError):
+                return None
+
+        if action == 'index':
+            return fixtures.index_response(self.user_id)
+        if action == 'user':
+            user_id = int_param('id')
+            return fixtures.user_response(user_id) if user_id and user_id > 0 else None
+        if action == 'usersearch':
+            return fixtures.usersearch_response(params.get('search', ''), int_param('page', 1) or 1, 3)
+        if action == 'artist':
+            artist_id = int_param('id')
+            if not artist_id or not 1 <= artist_id <= self.artists:
+                return None
+            return fixtures.artist_response(artist_id, self.groups_per_artist, self.torrents_per_group,
+                                            files_per_torrent=self.files_per_torrent)
+        if action == 'torrentgroup':
+            group_id = int_param('id')
+            if not group_id or not self.group_exists(group_id):
+                return None
+            return fixtures.torrentgroup_response(group_id, self.torrents_per_group, self.files_per_torrent,
+                                                  group_id // 10000)
+        if action == 'browse':
+            page = int_param('page', 1) or 1
+            per_page = 50
+            pages = max(1, (self.catalogue_size() + per_page - 1) // per_page)
+            if page > pages:
+                return {'currentPage': page, 'pages': pages, 'results': []}
+            indexes = range((page - 1) * per_page, min(page * per_page, self.catalogue_size()))
+            return fixtures.browse_response(page, pages, torrents_per_group=self.torrents_per_group,
+                                            group_ids=[self.group_id_at(index) for index in indexes])
+        if action == 'inbox':
+            if params.get('type') == 'viewconv':
+                conv_id = int_param('id')
+                if not conv_id or conv_id < 1:
+                    return None
+                with self._lock:
+                    self.read_conversations.add(conv_id)
+                return fixtures.conversation_response(conv_id)
+            page = int_param('page', 1) or 1
+            if page > self.inbox_pages:
+                return None
+            return self.inbox_page(page, params.get('sort'))
+        return None
+
+    def inbox_page(self, page, sort=None):
+        """
+        Returns an inbox listing page. Like the site, it's ordered newest first, or unread first with sort=unread, in
+        which case reading conversations moves the rest up the listing.
+        """
+        messages = []
+        for listing_page in range(1, self.inbox_pages + 1):
+            messages.extend(fixtures.inbox_response(listing_page, self.inbox_pages)['messages'])
+        with self._lock:
+            for message in messages:
+                if message['convId'] in self.read_conversations: # viewing a conversation marks it read
+                    message['unread'] = False
+        if sort == 'unread':
+            messages.sort(key=lambda message: not message['unread']) # stable, so newest first within each
+        per_page = len(messages) // self.inbox_pages
+        return {'currentPage': page, 'pages': self.inbox_pages,
+                'messages': messages[(page - 1) * per_page:page * per_page]}
+
+
+class FakeGazelleHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass # keep load tests quiet
+
+    def _send(self, status, body, content_type='application/json', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, payload, status=200):
+        self._send(status, json.dumps(payload).encode('utf-8'))
+
+    def _misbehave(self):
+        """
+        Applies the configured latency, errors and throttling. Returns True if the request has been answered.
+        """
+        server = self.server
+        server.delay()
+        if server.too_soon() or server.roll(server.throttle_rate):
+            server.count('throttled')
+            self._send_json({'status': 'failure', 'error': 'rate limit exceeded'}, 429)
+            return True
+        if server.roll(server.error_rate):
+            server.count('errors')
+            self._send(500, b'Internal Server Error', 'text/plain')
+            return True
+        return False
+
+    def _has_session(self):
+        for cookie in (self.headers.get('Cookie') or '').split(';'):
+            name, _, value = cookie.strip().partition('=')
+            if name == 'session' and value in self.server.sessions:
+                return True
+        return False
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        if urlparse(self.path).path.rstrip('/').endswith('login.php'):
+            self.server.count('login')
+            self._send(200, b'<html>Logged in</html>', 'text/html',
+                       {'Set-Cookie': 'session=%s; path=/' % self.server.new_session()})
+        else:
+            self._send(404, b'Not Found', 'text/plain')
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = dict((key, values[-1]) for key, values in parse_qs(url.query).items())
+        page = url.path.rstrip('/').split('/')[-1]
+        action = params.get('action')
+        server = self.server
+        if page not in ('ajax.php', 'torrents.php'):
+            self._send(404, b'Not Found', 'text/plain')
+            return
+        server.count('%s:%s' % (page, action))
+        if server.require_session and not self._has_session():
+            server.count('expired')
+            self._send(302, b'', 'text/html', {'Location': 'login.php'})
+            return
+        if self._misbehave():
+            return
+
+        if page == 'torrents.php':
+            try:
+                torrent_id = int(params.get('id'))
+            except (TypeError, ValueError):
+                torrent_id = None
+            if action != 'download' or not torrent_id or torrent_id < 1:
+                self._send(404, b'Not Found', 'text/plain')
+            else:
+                self._send(200, fixtures.torrent_file(torrent_id), 'application/x-bittorrent',
+                           {'Content-Disposition': 'attachment; filename="%s.torrent"' % torrent_id})
+            return
+
+        if server.roll(server.failure_rate):
+            server.count('failures')
+            self._send_json({'status': 'failure'})
+            return
+        response = server.response(action, params)
+        if response is None:
+            server.count('bad_requests')
+            self._send_json({'status': 'failure', 'error': 'bad parameters'})
+        else:
+            self._send_json({'status': 'success', 'response': response})
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Local stand-in Gazelle server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--latency-jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--min-interval', type=float, default=None)
+    parser.add_argument('--artists', type=int, default=1000)
+    parser.add_argument('--groups-per-artist', type=int, default=10)
+    parser.add_argument('--torrents-per-group', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    server = FakeGazelleServer((args.host, args.port), args.latency, args.latency_jitter, args.error_rate,
+                               args.failure_rate, args.throttle_rate, args.min_interval, args.artists,
+                               args.groups_per_artist, args.torrents_per_group)
+    print("Serving a fake Gazelle site at %s" % server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
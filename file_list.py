@@ -0,0 +1,107 @@
+import os
+import re
+import sys
+from array import array
+
+try:
+    _intern = sys.intern
+except AttributeError: # Python 2, whose intern() only takes str while JSON strings are unicode
+    def _intern(name):
+        return intern(name) if isinstance(name, str) else name
+
+try:
+    array('q')
+    _SIZE_TYPECODE = 'q'
+except ValueError:
+    _SIZE_TYPECODE = 'l' # Python 2 has no 'q'; 'l' is 64 bits on the platforms that matter
+
+# 'torrentgroup' fileList values look like: name{{{size}}}|||name{{{size}}}|||...
+_FILE_SEPARATOR = '|||'
+_FILE_ENTRY = re.compile(r"(.+)\{\{\{(\d+)\}\}\}\Z")
+
+class FileList(object):
+    """
+    The files in a Torrent, as (filename, size in bytes) pairs. Built from the raw 'fileList' string of a
+    'torrentgroup' response, which is only parsed the first time the list is used. Names are interned and sizes kept
+    in an array of ints, so the pairs are only built when you iterate or index; total_size(), largest_file() and
+    extension_breakdown() work on the columns directly. Malformed entries (without a {{{size}}}) are left out.
+    """
+    __slots__ = ('_raw', '_names', '_sizes')
+
+    def __init__(self, raw=''):
+        self._raw = raw
+        self._names = None
+        self._sizes = None
+
+    def _parse(self):
+        names = []
+        sizes = array(_SIZE_TYPECODE)
+        if self._raw:
+            for entry in self._raw.split(_FILE_SEPARATOR):
+                match = _FILE_ENTRY.match(entry)
+                if match is not None:
+                    names.append(_intern(match.group(1)))
+                    sizes.append(int(match.group(2)))
+        self._names = names
+        self._sizes = sizes
+        self._raw = None
+
+    @property
+    def names(self):
+        if self._names is None:
+            self._parse()
+        return self._names
+
+    @property
+    def sizes(self):
+        if self._sizes is None:
+            self._parse()
+        return self._sizes
+
+    def raw(self):
+        """
+        Returns the list in the site's raw 'fileList' form.
+        """
+        if self._raw is not None:
+            return self._raw
+        return _FILE_SEPARATOR.join('%s{{{%d}}}' % (name, size) for name, size in zip(self._names, self._sizes))
+
+    def total_size(self):
+        return sum(self.sizes)
+
+    def largest_file(self):
+        """
+        Returns the (filename, size) pair of the largest file, or None if the list is empty.
+        """
+        sizes = self.sizes
+        if not sizes:
+            return None
+        index = max(range(len(sizes)), key=sizes.__getitem__)
+        return self.names[index], sizes[index]
+
+    def extension_breakdown(self):
+        """
+        Returns a dict of lower-cased file extension (without the dot, '' for none) to a (file count, total bytes)
+        tuple.
+        """
+        counts = {}
+        totals = {}
+        for name, size in zip(self.names, self.sizes):
+            extension = os.path.splitext(name)[1][1:].lower()
+            counts[extension] = counts.get(extension, 0) + 1
+            totals[extension] = totals.get(extension, 0) + size
+        return dict((extension, (counts[extension], totals[extension])) for extension in counts)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(zip(self.names, self.sizes))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(zip(self.names[index], self.sizes[index]))
+        return self.names[index], self.sizes[index]
+
+    def __repr__(self):
+        return "FileList: %s files" % len(self)
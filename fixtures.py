@@ -0,0 +1,323 @@
+"""
+Synthetic 'ajax.php' payloads shaped like the real What.cd API responses, for benchmarks and offline runs. Every
+generator is deterministic: the same IDs and sizes always produce the same payload.
+"""
+
+import random
+import time
+
+from media import ALL_MEDIAS
+from format import ALL_FORMATS
+from encoding import ALL_ENCODINGS
+from release_type import ALL_RELEASE_TYPES
+
+TAG_NAMES = ['rock', 'electronic', 'jazz', 'hip.hop', 'pop', 'experimental', 'ambient', 'techno', 'folk', 'metal',
+             'indie', 'classical', 'house', 'punk', 'soul', 'funk', 'blues', 'dub', 'noise', 'psychedelic']
+FILE_EXTENSIONS = ['flac', 'mp3', 'log', 'cue', 'jpg', 'm3u', 'txt']
+
+def _time(rng):
+    return "20%02d-%02d-%02d %02d:%02d:%02d" % (rng.randint(7, 13), rng.randint(1, 12), rng.randint(1, 28),
+                                                rng.randint(0, 23), rng.randint(0, 59), rng.randint(0, 59))
+
+def file_list_string(rng, file_count):
+    """
+    Builds a 'fileList' value: 'name{{{size}}}' entries joined by '|||'.
+    """
+    files = []
+    for track in range(1, file_count + 1):
+        extension = rng.choice(FILE_EXTENSIONS) if track > file_count - 3 else 'flac'
+        files.append("%02d - Track Number %s.%s{{{%s}}}" % (track, track, extension, rng.randint(1000, 60000000)))
+    return "|||".join(files)
+
+def _torrent_fields(torrent_id, file_count=None):
+    # seeded by the ID alone, so a torrent looks the same in every response it appears in
+    rng = random.Random(torrent_id)
+    return {'media': rng.choice(ALL_MEDIAS),
+            'format': rng.choice(ALL_FORMATS),
+            'encoding': rng.choice(ALL_ENCODINGS),
+            'remastered': rng.random() < 0.3,
+            'remasterYear': rng.choice([0, rng.randint(1990, 2013)]),
+            'remasterTitle': rng.choice(['', 'Deluxe Edition', 'Remastered']),
+            'remasterRecordLabel': rng.choice(['', 'Warp', 'Sub Pop', 'XL']),
+            'scene': rng.random() < 0.1,
+            'hasLog': rng.random() < 0.5,
+            'hasCue': rng.random() < 0.5,
+            'logScore': rng.choice([0, 100]),
+            'fileCount': file_count or rng.randint(1, 30),
+            'size': rng.randint(10 ** 7, 10 ** 9),
+            'seeders': rng.randint(0, 500),
+            'leechers': rng.randint(0, 20),
+            'snatched': rng.randint(0, 3000),
+            'freeTorrent': rng.random() < 0.05,
+            'time': _time(rng)}
+
+def _group_fields(group_id):
+    rng = random.Random(-group_id - 1)
+    return {'year': rng.randint(1960, 2013),
+            'recordLabel': 'Label %s' % rng.randint(1, 200),
+            'catalogueNumber': 'CAT%s' % rng.randint(100, 999),
+            'releaseType': rng.randint(1, len(ALL_RELEASE_TYPES)),
+            'tags': rng.sample(TAG_NAMES, 3)}
+
+def torrentgroup_response(group_id, torrent_count=5, files_per_torrent=12, artist_id=1, first_torrent_id=None):
+    """
+    Returns a 'torrentgroup' response for group_id with torrent_count torrents.
+    """
+    rng = random.Random(group_id)
+    if first_torrent_id is None:
+        first_torrent_id = group_id * 100
+    torrents = []
+    for torrent_id in range(first_torrent_id, first_torrent_id + torrent_count):
+        torrent = _torrent_fields(torrent_id, files_per_torrent)
+        torrent.update({'id': torrent_id,
+                        'remasterCatalogueNumber': '',
+                        'description': 'Ripped with EAC. ' * rng.randint(1, 5),
+                        'fileList': file_list_string(rng, files_per_torrent),
+                        'filePath': 'Artist %s - Album %s (FLAC)' % (artist_id, group_id),
+                        'userId': rng.randint(1, 5000),
+                        'username': 'uploader'})
+        torrents.append(torrent)
+    group = _group_fields(group_id)
+    return {'group': {'wikiBody': 'Album description. ' * 20,
+                      'wikiImage': 'http://example.com/%s.jpg' % group_id,
+                      'id': group_id,
+                      'name': 'Album %s' % group_id,
+                      'year': group['year'],
+                      'recordLabel': group['recordLabel'],
+                      'catalogueNumber': group['catalogueNumber'],
+                      'releaseType': group['releaseType'],
+                      'categoryId': 1,
+                      'categoryName': 'Music',
+                      'time': _time(rng),
+                      'vanityHouse': False,
+                      'musicInfo': {'composers': [], 'dj': [],
+                                    'artists': [{'id': artist_id, 'name': 'Artist %s' % artist_id}],
+                                    'with': [], 'conductor': [], 'remixedBy': [], 'producer': []}},
+            'torrents': torrents}
+
+def artist_response(artist_id, group_count=20, torrents_per_group=4, similar_count=10, request_count=3,
+                    files_per_torrent=None):
+    """
+    Returns an 'artist' response for artist_id with group_count torrent groups of torrents_per_group torrents.
+    """
+    rng = random.Random(artist_id)
+    groups = []
+    for group_offset in range(group_count):
+        group_id = artist_id * 10000 + group_offset
+        torrents = []
+        for torrent_id in range(group_id * 100, group_id * 100 + torrents_per_group):
+            torrent = _torrent_fields(torrent_id, files_per_torrent)
+            torrent.update({'id': torrent_id, 'groupId': group_id, 'hasFile': torrent_id})
+            torrents.append(torrent)
+        group = _group_fields(group_id)
+        groups.append({'groupId': group_id,
+                       'groupName': 'Album %s' % group_id,
+                       'groupYear': group['year'],
+                       'groupRecordLabel': group['recordLabel'],
+                       'groupCatalogueNumber': group['catalogueNumber'],
+                       'tags': group['tags'],
+                       'releaseType': group['releaseType'],
+                       'groupVanityHouse': False,
+                       'hasBookmarked': False,
+                       'torrent': torrents})
+    return {'id': artist_id,
+            'name': 'Artist %s' % artist_id,
+            'notificationsEnabled': False,
+            'hasBookmarked': False,
+            'image': 'http://example.com/artist%s.jpg' % artist_id,
+            'body': 'Artist biography. ' * 30,
+            'vanityHouse': False,
+            'tags': [{'name': name, 'count': rng.randint(1, 50)} for name in rng.sample(TAG_NAMES, 5)],
+            'similarArtists': [{'artistId': similar_id, 'name': 'Artist %s' % similar_id,
+                                'score': rng.randint(50, 900), 'similarId': rng.randint(1, 10 ** 6)}
+                               for similar_id in rng.sample(range(1, 100000), similar_count) if similar_id != artist_id],
+            'statistics': {'numGroups': group_count, 'numTorrents': group_count * torrents_per_group,
+                           'numSeeders': rng.randint(0, 10000), 'numLeechers': rng.randint(0, 100),
+                           'numSnatches': rng.randint(0, 100000)},
+            'torrentgroup': groups,
+            'requests': [{'requestId': artist_id * 100 + i, 'categoryId': 1, 'title': 'Request %s' % i,
+                          'year': rng.randint(1960, 2013), 'timeAdded': _time(rng), 'votes': rng.randint(1, 40),
+                          'bounty': rng.randint(10 ** 8, 10 ** 10)} for i in range(request_count)]}
+
+def user_response(user_id):
+    """
+    Returns a 'user' response for user_id.
+    """
+    rng = random.Random(user_id)
+    return {'username': 'user%s' % user_id,
+            'avatar': 'http://example.com/avatar%s.png' % user_id,
+            'isFriend': False,
+            'profileText': 'Profile text. ' * rng.randint(0, 10),
+            'stats': {'joinedDate': _time(rng), 'lastAccess': _time(rng), 'uploaded': rng.randint(0, 10 ** 12),
+                      'downloaded': rng.randint(0, 10 ** 12), 'ratio': round(rng.random() * 5, 2),
+                      'requiredRatio': 0.6},
+            'ranks': {'uploaded': rng.randint(0, 100), 'downloaded': rng.randint(0, 100),
+                      'uploads': rng.randint(0, 100), 'requests': rng.randint(0, 100), 'bounty': rng.randint(0, 100),
+                      'posts': rng.randint(0, 100), 'artists': rng.randint(0, 100), 'overall': rng.randint(0, 100)},
+            'personal': {'class': rng.choice(['User', 'Member', 'Power User', 'Elite', 'VIP']), 'paranoia': 0,
+                         'paranoiaText': 'Off', 'donor': False, 'warned': False, 'enabled': True,
+                         'passkey': '%032x' % rng.getrandbits(128)},
+            'community': {'posts': rng.randint(0, 1000), 'torrentComments': rng.randint(0, 100),
+                          'collagesStarted': 0, 'collagesContrib': 0, 'requestsFilled': 0,
+                          'requestsVoted': rng.randint(0, 50), 'perfectFlacs': rng.randint(0, 20),
+                          'uploaded': rng.randint(0, 50), 'groups': rng.randint(0, 50),
+                          'seeding': rng.randint(0, 500), 'leeching': 0, 'snatched': rng.randint(0, 1000),
+                          'invited': 0}}
+
+def non_music_result(group_id, rng):
+    """
+    Returns a 'browse' result outside the music category (an application, e-book, ...): a single torrent, whose
+    fields are in the result itself, with none of the music keys.
+    """
+    fields = _torrent_fields(group_id * 100)
+    return {'groupId': group_id,
+            'groupName': 'Program %s' % group_id,
+            'torrentId': group_id * 100,
+            'tags': _group_fields(group_id)['tags'],
+            'category': 'Applications',
+            'fileCount': fields['fileCount'],
+            'groupTime': str(rng.randint(1200000000, 1400000000)),
+            'size': fields['size'],
+            'snatches': fields['snatched'],
+            'seeders': fields['seeders'],
+            'leechers': fields['leechers'],
+            'isFreeleech': fields['freeTorrent'],
+            'isNeutralLeech': False,
+            'isPersonalFreeleech': False,
+            'canUseToken': True}
+
+def browse_response(page=1, pages=1, group_count=10, torrents_per_group=5, first_group_id=None, group_ids=None,
+                    non_music_every=0):
+    """
+    Returns a 'browse' (torrent search) response page with group_count groups of torrents_per_group torrents, or with
+    the given group_ids. Groups are credited to artist group_id // 10000, as in artist_response(). With
+    non_music_every=n, every nth result is a non-music one (see non_music_result()).
+    """
+    rng = random.Random(page)
+    if first_group_id is None:
+        first_group_id = page * 100000
+    if group_ids is None:
+        group_ids = range(first_group_id, first_group_id + group_count)
+    results = []
+    for i, group_id in enumerate(group_ids, 1):
+        if non_music_every and i % non_music_every == 0:
+            results.append(non_music_result(group_id, rng))
+            continue
+        artist_id = group_id // 10000 or 1
+        torrents = []
+        for torrent_id in range(group_id * 100, group_id * 100 + torrents_per_group):
+            fields = _torrent_fields(torrent_id)
+            torrents.append({'torrentId': torrent_id,
+                             'editionId': 1,
+                             'artists': [{'id': artist_id, 'name': 'Artist %s' % artist_id, 'aliasid': artist_id}],
+                             'remastered': fields['remastered'],
+                             'remasterYear': fields['remasterYear'],
+                             'remasterCatalogueNumber': '',
+                             'remasterTitle': fields['remasterTitle'],
+                             'media': fields['media'],
+                             'encoding': fields['encoding'],
+                             'format': fields['format'],
+                             'hasLog': fields['hasLog'],
+                             'logScore': fields['logScore'],
+                             'hasCue': fields['hasCue'],
+                             'scene': fields['scene'],
+                             'vanityHouse': False,
+                             'fileCount': fields['fileCount'],
+                             'time': fields['time'],
+                             'size': fields['size'],
+                             'snatches': fields['snatched'],
+                             'seeders': fields['seeders'],
+                             'leechers': fields['leechers'],
+                             'isFreeleech': fields['freeTorrent'],
+                             'isNeutralLeech': False,
+                             'isPersonalFreeleech': False,
+                             'canUseToken': True})
+        group = _group_fields(group_id)
+        results.append({'groupId': group_id,
+                        'groupName': 'Album %s' % group_id,
+                        'artist': 'Artist %s' % artist_id,
+                        'cover': '',
+                        'tags': group['tags'],
+                        'bookmarked': False,
+                        'vanityHouse': False,
+                        'groupYear': group['year'],
+                        'releaseType': ALL_RELEASE_TYPES[group['releaseType'] - 1],
+                        'groupTime': rng.randint(1200000000, 1400000000),
+                        'maxSize': max(t['size'] for t in torrents) if torrents else 0,
+                        'totalSnatched': sum(t['snatches'] for t in torrents),
+                        'totalSeeders': sum(t['seeders'] for t in torrents),
+                        'totalLeechers': sum(t['leechers'] for t in torrents),
+                        'torrents': torrents})
+    return {'currentPage': page, 'pages': pages, 'results': results}
+
+def index_response(user_id, username=None):
+    """
+    Returns an 'index' response for the logged in user user_id.
+    """
+    rng = random.Random(user_id)
+    return {'username': username or 'user%s' % user_id,
+            'id': user_id,
+            'authkey': '%032x' % rng.getrandbits(128),
+            'passkey': '%032x' % rng.getrandbits(128),
+            'notifications': {'messages': rng.randint(0, 5), 'notifications': rng.randint(0, 100),
+                              'newAnnouncement': False, 'newBlog': False},
+            'userstats': {'uploaded': rng.randint(0, 10 ** 12), 'downloaded': rng.randint(0, 10 ** 12),
+                          'ratio': round(rng.random() * 5, 2), 'requiredratio': 0.6, 'class': 'Power User'}}
+
+def usersearch_response(search, page=1, pages=1, result_count=10):
+    """
+    Returns a 'usersearch' response page with result_count users whose names contain search.
+    """
+    first_user_id = (page - 1) * result_count + 1
+    return {'currentPage': page,
+            'pages': pages,
+            'results': [{'userId': user_id, 'username': '%s%s' % (search, user_id), 'donor': user_id % 7 == 0,
+                         'warned': False, 'enabled': True, 'class': 'User'}
+                        for user_id in range(first_user_id, first_user_id + result_count)]}
+
+def inbox_response(page=1, pages=1, message_count=25, unread_every=4):
+    """
+    Returns an 'inbox' listing page. Conversation IDs count down from the newest, so later pages hold older
+    conversations; every unread_every-th one is unread.
+    """
+    rng = random.Random(page)
+    first_conv_id = pages * message_count - (page - 1) * message_count
+    messages = []
+    for conv_id in range(first_conv_id, first_conv_id - message_count, -1):
+        messages.append({'convId': conv_id,
+                         'subject': 'Conversation %s' % conv_id,
+                         'unread': conv_id % unread_every == 0,
+                         'sticky': False,
+                         'forwardedId': 0,
+                         'forwardedName': '',
+                         'senderId': rng.randint(1, 5000),
+                         'username': 'sender',
+                         'donor': False,
+                         'warned': False,
+                         'enabled': True,
+                         'date': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(1356998400 + conv_id * 3600))})
+    return {'currentPage': page, 'pages': pages, 'messages': messages}
+
+def conversation_response(conv_id, message_count=3):
+    """
+    Returns an 'inbox' type=viewconv response for conv_id.
+    """
+    rng = random.Random(conv_id)
+    return {'convId': conv_id,
+            'subject': 'Conversation %s' % conv_id,
+            'sticky': False,
+            'messages': [{'messageId': conv_id * 100 + i, 'senderId': rng.randint(1, 5000), 'senderName': 'sender',
+                          'sentDate': _time(rng), 'bbBody': 'Message [b]%s[/b]' % i, 'body': 'Message <b>%s</b>' % i}
+                         for i in range(message_count)]}
+
+def torrent_file(torrent_id, piece_count=20):
+    """
+    Returns the bytes of a small, valid bencoded .torrent file for torrent_id.
+    """
+    name = ('Torrent %s' % torrent_id).encode('utf-8')
+    pieces = b''.join(b'%020d' % (torrent_id * piece_count + i) for i in range(piece_count))
+    info = b'd6:lengthi' + str(piece_count * 262144).encode('ascii') + b'e4:name' + \
+           str(len(name)).encode('ascii') + b':' + name + b'12:piece lengthi262144e6:pieces' + \
+           str(len(pieces)).encode('ascii') + b':' + pieces + b'e'
+    announce = b'http://tracker.example.com/announce'
+    return b'd8:announce' + str(len(announce)).encode('ascii') + b':' + announce + b'4:info' + info + b'e'
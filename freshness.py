@@ -0,0 +1,61 @@
+"""
+When each entity was last filled, and from which API action. Every set_*_data() method (through hooks.hydrates)
+records the time in the entity's fetched dict, keyed by the action it was filled from: 'artist', 'torrentgroup',
+'browse', 'user', ... Each action fills its own group of fields (a Torrent gets its description and file list only from
+'torrentgroup', but its seeders and snatches from all three of its sources), so ages are kept per action. The dict
+is saved with snapshots like any other field.
+"""
+import time
+
+# identity map name -> (the action GazelleAPI.refresh_stale() refills its entities with, the source whose age counts,
+# None meaning the latest of any)
+REFRESH = {
+    'users': ('user', 'user'),
+    'artists': ('artist', 'artist'),
+    'torrent_groups': ('torrentgroup', 'torrentgroup'),
+    'torrents': ('torrentgroup', None), # through their groups; their stats come with every response
+}
+
+def fetched_at(entity, source=None):
+    """
+    Returns when entity was last filled from source (from anything, if None) as a time.time() timestamp, or None if it
+    never was.
+    """
+    fetched = getattr(entity, 'fetched', None)
+    if not fetched:
+        return None
+    if source is None:
+        return max(fetched.values())
+    return fetched.get(source)
+
+def age(entity, source=None, now=None):
+    """
+    Returns how many seconds ago entity was last filled from source (see fetched_at()), or None if it never was.
+    """
+    fetched = fetched_at(entity, source)
+    if fetched is None:
+        return None
+    return (time.time() if now is None else now) - fetched
+
+def is_fresh(entity, max_age, source=None, now=None):
+    """
+    Returns whether entity was filled from source at most max_age seconds ago. Never true when max_age is None.
+    """
+    if max_age is None:
+        return False
+    entity_age = age(entity, source, now)
+    return entity_age is not None and entity_age <= max_age
+
+def stale(entities, max_age, source=None, now=None):
+    """
+    Returns the entities last filled from source more than max_age seconds ago, oldest first. Entities that were
+    never filled from it haven't expired, and are left out.
+    """
+    now = time.time() if now is None else now
+    expired = []
+    for entity in entities:
+        fetched = fetched_at(entity, source)
+        if fetched is not None and now - fetched > max_age:
+            expired.append((fetched, entity))
+    expired.sort(key=lambda item: item[0])
+    return [entity for _, entity in expired]
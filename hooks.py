@@ -0,0 +1,40 @@
+import functools
+import time
+
+def hydrates(source):
+    """
+    Decorator for the models' set_*_data() methods. After the method has copied a response into the object, it tells
+    the parent API which object was filled from which API action ('artist', 'torrentgroup', 'browse', ...) by calling
+    parent_api.on_hydrated(obj, source), so the API's local indexes can follow along.
+    The time is recorded in obj.fetched under source (see freshness.py). If the parent API has instrumentation, the
+    time spent in the method is recorded too.
+    """
+    def decorator(set_data):
+        @functools.wraps(set_data)
+        def wrapper(self, *args, **kwargs):
+            instrumentation = self.parent_api.instrumentation
+            if instrumentation is None:
+                result = set_data(self, *args, **kwargs)
+            else:
+                start = time.time()
+                result = set_data(self, *args, **kwargs)
+                instrumentation.record_hydration(type(self).__name__, source, time.time() - start)
+            if self.fetched is None:
+                self.fetched = {}
+            self.fetched[source] = time.time()
+            self.parent_api.on_hydrated(self, source)
+            return result
+        return wrapper
+    return decorator
+
+def fault_in(obj, name):
+    """
+    Called from the models' __getattr__(), which Python only reaches for attributes that were never set. That's the
+    case for objects created lazily from a snapshot (see snapshot.py), which are filled from it here on first use.
+    """
+    if name.startswith('__'):
+        raise AttributeError(name)
+    snapshot = getattr(object.__getattribute__(obj, 'parent_api'), 'snapshot', None)
+    if snapshot is None or not snapshot.fill(obj, name):
+        raise AttributeError("'%s' object has no attribute '%s'" % (type(obj).__name__, name))
+    return object.__getattribute__(obj, name)
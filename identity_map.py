@@ -0,0 +1,168 @@
+import sys
+import threading
+import weakref
+from collections import OrderedDict
+
+def _slot_value(obj, slot):
+    try:
+        return object.__getattribute__(obj, slot) # without faulting in objects not yet loaded from a snapshot
+    except AttributeError:
+        return None
+
+def estimate_size(obj):
+    """
+    Rough shallow size of a model object in bytes: the object itself plus its attribute dict or slot values.
+    """
+    size = sys.getsizeof(obj)
+    attributes = getattr(obj, '__dict__', None)
+    if attributes is not None:
+        size += sys.getsizeof(attributes)
+        values = attributes.values()
+    else:
+        values = [_slot_value(obj, slot) for cls in type(obj).__mro__ for slot in getattr(cls, '__slots__', ())
+                  if not slot.startswith('__')]
+    for value in values:
+        if isinstance(value, (list, dict, tuple)) or hasattr(value, '__len__'):
+            size += sys.getsizeof(value)
+    return size
+
+
+class IdentityMap(object):
+    """
+    Identity cache used by GazelleAPI for each entity type (GazelleAPI.cached_users, cached_torrents, ...). It maps an
+    ID to the one object that represents it, and supports the parts of the dict interface the models use.
+
+    Every object is tracked through a weak reference, so as long as something still holds an object, looking up its
+    ID returns that same object. On top of that the map holds strong references to the most recently used objects so
+    they stay alive while nothing else refers to them:
+        max_entries=None, max_bytes=None (default): keep everything forever, like a plain dict
+        max_entries=N: keep the N most recently used objects alive (LRU)
+        max_entries=0: weak only; objects disappear as soon as nothing else references them
+        max_bytes=B: also evict least recently used objects once their estimated size (see estimate_size()) passes B
+
+    Evicted objects that are still referenced elsewhere stay in the map until they are garbage collected.
+
+    loader, if set, is called with a key the map doesn't hold. If it returns an object, that's added to the map and
+    returned; a loaded snapshot uses this to create objects as they're asked for (see snapshot.py). Evicted objects
+    are then simply loaded again. Only objects already in the map are counted by len() and listed by keys(), values()
+    and items().
+    """
+    def __init__(self, max_entries=None, max_bytes=None, sizeof=estimate_size, loader=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.loader = loader
+        self._lock = threading.RLock()
+        self._strong = OrderedDict() # id -> object, least recently used first
+        self._sizes = {}
+        self._weak = weakref.WeakValueDictionary()
+        self.estimated_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.loads = 0
+
+    def _bounded(self):
+        return self.max_entries is not None or self.max_bytes is not None
+
+    def _touch(self, key, obj):
+        # (re)insert key as most recently used, refreshing its size estimate, then trim back to the limits
+        if self.max_entries == 0:
+            return
+        self._strong.pop(key, None)
+        self._strong[key] = obj
+        if self.max_bytes is not None:
+            size = self.sizeof(obj)
+            self.estimated_bytes += size - self._sizes.get(key, 0)
+            self._sizes[key] = size
+        if self._bounded():
+            self._trim()
+
+    def _trim(self):
+        while self._strong and ((self.max_entries is not None and len(self._strong) > self.max_entries) or
+                                (self.max_bytes is not None and self.estimated_bytes > self.max_bytes)):
+            key, _ = self._strong.popitem(last=False)
+            self.estimated_bytes -= self._sizes.pop(key, 0)
+            self.evictions += 1
+
+    def get(self, key, default=None):
+        """
+        Returns the object for key, or default. Counts towards the hit/miss statistics.
+        """
+        with self._lock:
+            obj = self._weak.get(key)
+            if obj is None:
+                self.misses += 1
+                if self.loader is not None:
+                    obj = self.loader(key)
+                if obj is None:
+                    return default
+                self.loads += 1
+                self[key] = obj
+                return obj
+            self.hits += 1
+            if self._bounded():
+                self._touch(key, obj)
+            return obj
+
+    def __getitem__(self, key):
+        obj = self.get(key)
+        if obj is None:
+            raise KeyError(key)
+        return obj
+
+    def __setitem__(self, key, obj):
+        with self._lock:
+            self._weak[key] = obj
+            self._touch(key, obj)
+
+    def __delitem__(self, key):
+        with self._lock:
+            del self._weak[key]
+            if self._strong.pop(key, None) is not None:
+                self.estimated_bytes -= self._sizes.pop(key, 0)
+
+    def __contains__(self, key):
+        return key in self._weak
+
+    def __len__(self):
+        return len(self._weak)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        with self._lock:
+            return list(self._weak.keys())
+
+    def values(self):
+        with self._lock:
+            return list(self._weak.values())
+
+    def items(self):
+        with self._lock:
+            return list(self._weak.items())
+
+    def clear(self):
+        with self._lock:
+            self._weak.clear()
+            self._strong.clear()
+            self._sizes.clear()
+            self.estimated_bytes = 0
+
+    def stats(self):
+        """
+        Returns a dict snapshot of the map's size and hit, miss, load and eviction counts.
+        """
+        with self._lock:
+            return {'size': len(self._weak),
+                    'pinned': len(self._strong),
+                    'estimated_bytes': self.estimated_bytes if self.max_bytes is not None else None,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'loads': self.loads,
+                    'evictions': self.evictions}
+
+    def __repr__(self):
+        return "IdentityMap: %s objects (%s pinned) - %s evictions" % (len(self._weak), len(self._strong),
+                                                                        self.evictions)
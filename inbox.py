@@ -1,3 +1,9 @@
+import json
+import os
+
+from pagination import PageIterator
+from downloader import atomic_write
+
 class MailboxMessage(object):
     def __init__(self, api, message):
         self.id = message['convId']
@@ -49,6 +55,7 @@ class Conversation(object):
         self.messages = [ConversationMessage(m) for m in conv_resp['messages']]
 
     def update_conv_data(self):
+        self.parent_api.on_blocking_call('Conversation.update_conv_data')
         response = self.parent_api.request(action='inbox',
                                            type='viewconv', id=self.id)
         self.set_conv_data(response)
@@ -77,10 +84,25 @@ class Mailbox(object):
           [MailboxMessage(self.parent_api, m) for m in mbox_resp['messages']]
 
     def update_mbox_data(self):
+        self.parent_api.on_blocking_call('Mailbox.update_mbox_data')
         response = self.parent_api.request(action='inbox',
                      type=self.boxtype, page=self.current_page, sort=self.sort)
         self.set_mbox_data(response)
 
+    def iter_messages(self, max_pages=None, max_results=None, prefetch=True):
+        """
+        Returns a PageIterator yielding the MailboxMessages from this page onwards, through the last page. The next
+        page is requested in the background while you work through the current one.
+        """
+        self.parent_api.on_blocking_call('Mailbox.iter_messages')
+        def request_page(page):
+            return self.parent_api.request(action='inbox', type=self.boxtype, page=page, sort=self.sort)
+        def parse_page(response):
+            mailbox = Mailbox(self.parent_api, self.boxtype, str(response['currentPage']), self.sort)
+            mailbox.set_mbox_data(response)
+            return mailbox.messages, mailbox.total_pages
+        return PageIterator(request_page, parse_page, self.current_page, max_pages, max_results, prefetch)
+
     def next_page(self):
         if not self.total_pages:
             raise ValueError("call update_mbox_data() first")
@@ -105,3 +127,49 @@ class Mailbox(object):
         return "Mailbox: %s %s Page %s/%s" \
                  % (self.boxtype, self.sort,
                     self.current_page, self.total_pages)
+
+
+class MailboxSyncState(object):
+    """
+    Remembers, per mailbox, the conversations a sync has fetched and the date each one had at the time, in a JSON
+    file at path (or only in memory if path is None). A conversation needs fetching if it's new, its date moved on
+    (someone replied) or it's unread. Each mailbox's high water mark is the date of the newest conversation listed by
+    the last sync that fetched everything it needed to; a sync listing by date can stop at it. A file that can't be
+    read or parsed counts as no state, so everything is fetched again.
+    """
+    def __init__(self, path=None):
+        self.path = os.path.expanduser(path) if path else None
+        self.seen = {}
+        self.high_water = {}
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, 'rb') as state_file:
+                    state = json.loads(state_file.read().decode('utf-8'))
+                seen, high_water = state['seen'], state['high_water']
+            except (IOError, OSError, ValueError, KeyError, TypeError):
+                return
+            if isinstance(seen, dict) and isinstance(high_water, dict):
+                self.seen, self.high_water = seen, high_water
+
+    def needs_fetch(self, boxtype, message):
+        return message.unread or self.seen.get(boxtype, {}).get(str(message.id)) != message.date
+
+    def mark_seen(self, boxtype, message):
+        self.seen.setdefault(boxtype, {})[str(message.id)] = message.date
+
+    def below_high_water(self, boxtype, message):
+        """
+        Returns whether message is older than the mailbox's high water mark, so it was listed and dealt with by an
+        earlier sync. Sticky conversations are listed out of date order, and never are.
+        """
+        high_water = self.high_water.get(boxtype)
+        return high_water is not None and not message.sticky and message.date < high_water
+
+    def save(self):
+        if self.path:
+            state = {'seen': self.seen, 'high_water': self.high_water}
+            atomic_write(self.path, [json.dumps(state, sort_keys=True).encode('utf-8')])
+
+    def __repr__(self):
+        return "MailboxSyncState: %s (%s)" % (self.path, ", ".join("%s %s seen" % (boxtype, len(seen))
+                                                                  for boxtype, seen in sorted(self.seen.items())))
@@ -0,0 +1,175 @@
+import bisect
+import threading
+
+# histogram bucket upper bounds in seconds: from 0.1ms, four buckets per doubling (each ~19% wider than the last) up
+# to ~6 minutes, then overflow
+LATENCY_BUCKETS = [0.0001 * 2 ** (i / 4.0) for i in range(88)]
+
+class Histogram(object):
+    """
+    Fixed-bucket histogram of durations (or sizes, with custom bounds). Keeps count, sum, min and max exactly;
+    percentiles are estimated as the upper bound of the bucket they fall in.
+    """
+    __slots__ = ('bounds', 'counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, fraction):
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.bounds[index], self.max) if index < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {'count': self.count,
+                'sum': self.total,
+                'mean': self.total / self.count if self.count else None,
+                'min': self.min,
+                'max': self.max,
+                'p50': self.percentile(0.5),
+                'p95': self.percentile(0.95),
+                'p99': self.percentile(0.99),
+                'buckets': dict(('le_%g' % bound, count) for bound, count in zip(self.bounds, self.counts) if count)}
+
+
+class Instrumentation(object):
+    """
+    Collects timing and size statistics from a GazelleAPI. Pass one as GazelleAPI(..., instrumentation=...); with the
+    default of None the API skips all of this, so there's no cost when it's off.
+
+    Recorded, per API action unless noted:
+        request: network latency histogram (from sending the request to having the whole body)
+        bytes: response body sizes
+        decode: JSON decode time histogram
+        rate_wait: time spent waiting on the rate limiter before the request
+        queue_wait: time spent queued behind other requests for the rate limiter (see scheduler.PriorityScheduler)
+        cache: response cache hits and misses
+        hydrate: time spent in set_*_data() methods, keyed by 'Entity:source' (e.g. 'Torrent:torrentgroup'); these
+                 include nested objects, so a TorrentGroup's time includes its Torrents'
+
+    add_hook(callback) registers callback(event, key, value), called for every recorded value, e.g.
+    ('request', 'artist', 0.21). Use it to forward measurements to a metrics system as they happen, or poll
+    snapshot() / flat_snapshot() instead.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hooks = []
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = {}
+            self.bytes = {}
+            self.decode = {}
+            self.rate_wait = {}
+            self.queue_wait = {}
+            self.hydrate = {}
+            self.cache_hits = {}
+            self.cache_misses = {}
+
+    def add_hook(self, callback):
+        self.hooks.append(callback)
+
+    def remove_hook(self, callback):
+        self.hooks.remove(callback)
+
+    def _add(self, table, event, key, value):
+        with self._lock:
+            histogram = table.get(key)
+            if histogram is None:
+                histogram = table[key] = Histogram()
+            histogram.add(value)
+        for hook in self.hooks:
+            hook(event, key, value)
+
+    def _count(self, table, event, key):
+        with self._lock:
+            table[key] = table.get(key, 0) + 1
+        for hook in self.hooks:
+            hook(event, key, 1)
+
+    def record_request(self, action, seconds, size):
+        self._add(self.requests, 'request', action, seconds)
+        with self._lock:
+            self.bytes[action] = self.bytes.get(action, 0) + size
+        for hook in self.hooks:
+            hook('bytes', action, size)
+
+    def record_rate_wait(self, action, seconds):
+        self._add(self.rate_wait, 'rate_wait', action, seconds)
+
+    def record_queue_wait(self, action, seconds):
+        self._add(self.queue_wait, 'queue_wait', action, seconds)
+
+    def record_decode(self, action, seconds):
+        self._add(self.decode, 'decode', action, seconds)
+
+    def record_hydration(self, entity, source, seconds):
+        self._add(self.hydrate, 'hydrate', '%s:%s' % (entity, source), seconds)
+
+    def record_cache(self, action, hit):
+        if hit:
+            self._count(self.cache_hits, 'cache_hit', action)
+        else:
+            self._count(self.cache_misses, 'cache_miss', action)
+
+    def snapshot(self):
+        """
+        Returns all statistics as a dict of plain values: for each section, a dict of action (or 'Entity:source')
+        to a histogram summary (count, sum, mean, min, max, p50, p95, p99, buckets). Also the total response bytes
+        and cache hit ratio per action.
+        """
+        with self._lock:
+            cache_actions = set(self.cache_hits) | set(self.cache_misses)
+            cache = {}
+            for action in cache_actions:
+                hits = self.cache_hits.get(action, 0)
+                misses = self.cache_misses.get(action, 0)
+                cache[action] = {'hits': hits, 'misses': misses, 'hit_ratio': float(hits) / (hits + misses)}
+            return {'request': dict((key, h.snapshot()) for key, h in self.requests.items()),
+                    'decode': dict((key, h.snapshot()) for key, h in self.decode.items()),
+                    'rate_wait': dict((key, h.snapshot()) for key, h in self.rate_wait.items()),
+                    'queue_wait': dict((key, h.snapshot()) for key, h in self.queue_wait.items()),
+                    'hydrate': dict((key, h.snapshot()) for key, h in self.hydrate.items()),
+                    'bytes': dict(self.bytes),
+                    'cache': cache}
+
+    def flat_snapshot(self, prefix='pygazelle'):
+        """
+        Returns snapshot() flattened to a dict of dotted metric names to numbers, e.g.
+        'pygazelle.request.artist.p95', ready for a metrics system. Bucket counts are left out.
+        """
+        flat = {}
+        for section, entries in self.snapshot().items():
+            for key, value in entries.items():
+                name = '%s.%s.%s' % (prefix, section, key.replace(':', '.'))
+                if isinstance(value, dict):
+                    for stat, number in value.items():
+                        if stat != 'buckets' and number is not None:
+                            flat['%s.%s' % (name, stat)] = number
+                else:
+                    flat[name] = value
+        return flat
+
+    def __repr__(self):
+        return "Instrumentation: %s requests recorded" % sum(h.count for h in self.requests.values())
@@ -0,0 +1,51 @@
+"""
+Pluggable JSON decoding for API responses. The stdlib decoder is the biggest CPU cost after the network wait on large
+'artist' and 'torrentgroup' payloads, so GazelleAPI uses the fastest installed parser: orjson, then ujson, then
+simplejson, falling back to json. All of them decode straight from the response bytes and raise ValueError (or a
+subclass) on bad input.
+"""
+
+import json
+
+def _load_orjson():
+    import orjson
+    return orjson.loads
+
+def _load_ujson():
+    import ujson
+    return ujson.loads
+
+def _load_simplejson():
+    import simplejson
+    return simplejson.loads
+
+def _load_json():
+    return json.loads
+
+DECODERS = [('orjson', _load_orjson), ('ujson', _load_ujson), ('simplejson', _load_simplejson), ('json', _load_json)]
+
+def available_decoders():
+    """
+    Returns a list of (name, loads function) for every installed decoder, fastest first.
+    """
+    decoders = []
+    for name, load in DECODERS:
+        try:
+            decoders.append((name, load()))
+        except ImportError:
+            pass
+    return decoders
+
+def get_decoder(name=None):
+    """
+    Returns (name, loads function) for the named decoder, or for the fastest installed one if name is None. Raises
+    ImportError if the named decoder isn't installed.
+    """
+    for decoder_name, load in DECODERS:
+        if name is None or name == decoder_name:
+            try:
+                return decoder_name, load()
+            except ImportError:
+                if name is not None:
+                    raise
+    raise ValueError("Unknown JSON decoder '%s', expected one of %s" % (name, [n for n, _ in DECODERS]))
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+#
+# End-to-end load test driving GazelleAPI, by default against an in-process FakeGazelleServer. Run from the package
+# directory with:
+#   python load_test.py --workers 8 --requests 500 --rate-limit 0.01 --latency 0.05
+# Add --async to drive AsyncGazelleAPI from asyncio tasks instead (Python 3, see async_load_test.py).
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from api import GazelleAPI
+from rate_limiter import TokenBucket
+from shared_rate_limit import SharedTokenBucket
+from instrumentation import Instrumentation
+from fake_server import FakeGazelleServer
+
+def _artist(api, rng, catalogue, workdir):
+    api.get_artist(rng.randint(1, catalogue['artists'])).update_data()
+
+def _torrentgroup(api, rng, catalogue, workdir):
+    group_id = rng.randint(1, catalogue['artists']) * 10000 + rng.randint(0, catalogue['groups_per_artist'] - 1)
+    api.get_torrent_group(group_id).update_group_data()
+
+def _browse(api, rng, catalogue, workdir):
+    api.search_torrents(searchstr='', page=rng.randint(1, 20))
+
+def _user(api, rng, catalogue, workdir):
+    api.get_user(rng.randint(2, 5000)).update_user_data()
+
+def _usersearch(api, rng, catalogue, workdir):
+    api.search_users('user')
+
+def _inbox(api, rng, catalogue, workdir):
+    api.get_inbox().update_mbox_data()
+
+def _download(api, rng, catalogue, workdir):
+    torrent_id = rng.randint(1, 10 ** 6)
+    api.save_torrent_file(torrent_id, os.path.join(workdir, '%s.torrent' % torrent_id))
+
+OPERATIONS = {'artist': _artist, 'torrentgroup': _torrentgroup, 'browse': _browse, 'user': _user,
+              'usersearch': _usersearch, 'inbox': _inbox, 'download': _download}
+
+# relative weights, roughly a crawler's traffic
+DEFAULT_MIX = {'artist': 3, 'torrentgroup': 5, 'browse': 2, 'user': 1, 'usersearch': 1, 'inbox': 1, 'download': 1}
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    return {'count': len(latencies),
+            'mean': sum(latencies) / len(latencies) if latencies else None,
+            'p50': percentile(latencies, 0.50),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'max': latencies[-1] if latencies else None}
+
+def run_load_test(api, mix=None, workers=8, requests=200, duration=None, catalogue=None, seed=0):
+    """
+    Runs operations picked at random from mix (operation name -> weight, see OPERATIONS) on workers threads sharing
+    api, until requests operations have run or duration seconds have passed. catalogue describes the site's ID space
+    ({'artists': n, 'groups_per_artist': n}).
+
+    Returns a report dict: operations run, elapsed seconds, throughput, latency summaries (count, mean, p50, p95, p99,
+    max; overall and per operation, each including any rate limit wait), errors by exception type, the rate limiter's
+    and the scheduler's stats, and the time workers spent waiting on the rate limiter and queued behind each other for
+    it, in seconds and as a share of worker time. If api has instrumentation, its snapshot is included as
+    'instrumentation'.
+    """
+    mix = mix or DEFAULT_MIX
+    catalogue = catalogue or {'artists': 1000, 'groups_per_artist': 10}
+    names = sorted(mix)
+    weights = [mix[name] for name in names]
+    lock = threading.Lock()
+    latencies = dict((name, []) for name in names)
+    errors = {}
+    budget = [requests]
+    workdir = tempfile.mkdtemp(prefix='pygazelle-load-')
+    waits_before = _scheduler_waits(api)
+    start = time.time()
+    deadline = start + duration if duration else None
+
+    def take():
+        with lock:
+            if deadline is not None and time.time() >= deadline:
+                return False
+            if requests is not None:
+                if budget[0] <= 0:
+                    return False
+                budget[0] -= 1
+            return True
+
+    def worker(worker_id):
+        rng = random.Random(seed * 1000 + worker_id)
+        while take():
+            name = _weighted_choice(rng, names, weights)
+            op_start = time.time()
+            try:
+                OPERATIONS[name](api, rng, catalogue, workdir)
+            except Exception as e:
+                with lock:
+                    key = '%s: %s' % (name, type(e).__name__)
+                    errors[key] = errors.get(key, 0) + 1
+            with lock:
+                latencies[name].append(time.time() - op_start)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    elapsed = time.time() - start
+    all_latencies = [latency for values in latencies.values() for latency in values]
+    queue_wait, rate_limit_wait = [after - before for before, after in zip(waits_before, _scheduler_waits(api))]
+    worker_time = elapsed * workers
+    return {'operations': len(all_latencies),
+            'elapsed': elapsed,
+            'throughput': len(all_latencies) / elapsed if elapsed else None,
+            'latency': summarize(all_latencies),
+            'latency_by_operation': dict((name, summarize(values)) for name, values in latencies.items() if values),
+            'errors': errors,
+            'rate_limit_wait': rate_limit_wait,
+            'rate_limit_wait_share': rate_limit_wait / worker_time if worker_time else None,
+            'queue_wait': queue_wait,
+            'queue_wait_share': queue_wait / worker_time if worker_time else None,
+            'rate_limiter': api.rate_limiter.stats(),
+            'scheduler': api.scheduler.stats(),
+            'instrumentation': api.instrumentation.snapshot() if api.instrumentation is not None else None}
+
+def _scheduler_waits(api):
+    # (queued, rate limited) seconds over all priorities; the rate limiter's own stats only see the head of the queue
+    stats = api.scheduler.stats().values()
+    return sum(s['queue_wait'] for s in stats), sum(s['rate_wait'] for s in stats)
+
+def _weighted_choice(rng, names, weights):
+    point = rng.uniform(0, sum(weights))
+    for name, weight in zip(names, weights):
+        point -= weight
+        if point <= 0:
+            return name
+    return names[-1]
+
+def print_report(report):
+    def ms(value):
+        return "%8.1fms" % (value * 1000) if value is not None else "       -"
+    print("%d operations in %.1fs: %.1f ops/s" % (report['operations'], report['elapsed'], report['throughput'] or 0))
+    print("rate limit wait: %.1fs total, %.0f%% of worker time; queued behind other requests: %.1fs, %.0f%%" %
+          (report['rate_limit_wait'], (report['rate_limit_wait_share'] or 0) * 100, report['queue_wait'],
+           (report['queue_wait_share'] or 0) * 100))
+    print("%-14s %6s %s %s %s %s" % ('operation', 'count', '     p50  ', '     p95  ', '     p99  ', '     max'))
+    for name, summary in [('all', report['latency'])] + sorted(report['latency_by_operation'].items()):
+        print("%-14s %6d %s %s %s %s" % (name, summary['count'], ms(summary['p50']), ms(summary['p95']),
+                                         ms(summary['p99']), ms(summary['max'])))
+    instrumented = report.get('instrumentation')
+    if instrumented:
+        print("%-14s %6s %s %s %s %s" % ('api action', 'count', ' net p50  ', ' net p95  ', 'decode p50', '   KB avg'))
+        for action, summary in sorted(instrumented['request'].items()):
+            decode = instrumented['decode'].get(action, {})
+            print("%-14s %6d %s %s %s %8.1fK" % (action, summary['count'], ms(summary['p50']), ms(summary['p95']),
+                                                ms(decode.get('p50')),
+                                                instrumented['bytes'][action] / 1024.0 / summary['count']))
+        for key, summary in sorted(instrumented['hydrate'].items()):
+            print("hydrate %-24s %6d %s" % (key, summary['count'], ms(summary['p50'])))
+    for error, count in sorted(report['errors'].items()):
+        print("error %s: %d" % (error, count))
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Load test GazelleAPI against a fake or real Gazelle site")
+    parser.add_argument('--site', help="site to test against (default: start a local FakeGazelleServer)")
+    parser.add_argument('--username', default='user')
+    parser.add_argument('--password', default='password')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=None)
+    parser.add_argument('--rate-limit', type=float, default=0.01, help="seconds between requests")
+    parser.add_argument('--burst', type=int, default=1)
+    parser.add_argument('--rate-limit-file', help="share the rate limit with other processes through this file")
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--latency-jitter', type=float, default=0.02)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--artists', type=int, default=1000)
+    parser.add_argument('--groups-per-artist', type=int, default=10)
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="drive an AsyncGazelleAPI from --workers asyncio tasks instead (needs aiohttp)")
+    parser.add_argument('--instrument', action='store_true', help="report per-action network, decode and hydration "
+                                                                    "times")
+    args = parser.parse_args(argv)
+
+    server = None
+    site = args.site
+    if site is None:
+        server = FakeGazelleServer(latency=args.latency, latency_jitter=args.latency_jitter,
+                                   error_rate=args.error_rate, failure_rate=args.failure_rate,
+                                   throttle_rate=args.throttle_rate, artists=args.artists,
+                                   groups_per_artist=args.groups_per_artist).start()
+        site = server.url
+    try:
+        if args.rate_limit_file:
+            rate_limiter = SharedTokenBucket(args.rate_limit_file, args.rate_limit, args.burst)
+        else:
+            rate_limiter = TokenBucket(args.rate_limit, args.burst)
+        instrumentation = Instrumentation() if args.instrument else None
+        catalogue = {'artists': args.artists, 'groups_per_artist': args.groups_per_artist}
+        if args.use_async:
+            import async_load_test # Python 3 only
+            report = async_load_test.run(args.username, args.password, rate_limiter, site, instrumentation,
+                                         tasks=args.workers, requests=args.requests, duration=args.duration,
+                                         catalogue=catalogue)
+        else:
+            api = GazelleAPI(args.username, args.password, rate_limiter, site=site, instrumentation=instrumentation)
+            report = run_load_test(api, workers=args.workers, requests=args.requests, duration=args.duration,
+                                   catalogue=catalogue)
+        print_report(report)
+        if server is not None:
+            print("server: %s" % ", ".join("%s %s" % item for item in sorted(server.stats.items())))
+    finally:
+        if server is not None:
+            server.stop()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,229 @@
+import threading
+
+import release_type
+from torrent import Torrent
+from torrent_group import TorrentGroup
+from artist import Artist
+
+TORRENT_FIELDS = ('format', 'encoding', 'media')
+GROUP_FIELDS = ('year', 'release_type', 'tag', 'artist')
+RANGE_FIELDS = ('seeders', 'leechers', 'snatched', 'size', 'log_score', 'year')
+
+class _FieldIndex(object):
+    """
+    Maps each value of one field to the set of entity IDs having it, and remembers each entity's current values so
+    they can be replaced when the entity is filled in again.
+    """
+    def __init__(self):
+        self.postings = {}
+        self.values_of = {}
+
+    def update(self, id, values):
+        values = frozenset(value for value in values if value is not None)
+        old_values = self.values_of.get(id, frozenset())
+        if values == old_values:
+            return
+        for value in old_values - values:
+            posting = self.postings[value]
+            posting.discard(id)
+            if not posting:
+                del self.postings[value]
+        for value in values - old_values:
+            self.postings.setdefault(value, set()).add(id)
+        if values:
+            self.values_of[id] = values
+        else:
+            self.values_of.pop(id, None)
+
+    def remove(self, id):
+        self.update(id, ())
+
+    def lookup(self, values):
+        if len(values) == 1:
+            return self.postings.get(values[0], set())
+        matched = set()
+        for value in values:
+            matched |= self.postings.get(value, set())
+        return matched
+
+
+class LocalIndex(object):
+    """
+    Secondary indexes over the Torrents and TorrentGroups the API has seen, kept up to date as set_*_data() methods
+    run (see hooks.hydrates). Available as GazelleAPI.local when the API is created with indexes=True. Lets you
+    answer questions from what's already cached instead of making new 'browse' calls:
+
+        api.local.query(format=format.FLAC, media=media.VINYL, min_seeders=5, artist=artist)
+
+    Torrents are indexed by format, encoding and media; their groups by year, release type, tag name and artist ID.
+    query() intersects the matching posting sets, smallest first, and only then checks range conditions (min_/max_
+    seeders, leechers, snatched, size, log_score, year) on the remaining candidates.
+    """
+    def __init__(self, parent_api):
+        self.parent_api = parent_api
+        self._lock = threading.RLock()
+        self.torrent_indexes = dict((field, _FieldIndex()) for field in TORRENT_FIELDS)
+        self.group_indexes = dict((field, _FieldIndex()) for field in GROUP_FIELDS)
+        self._group_of = {} # torrent ID -> group ID
+        self._group_torrents = {} # group ID -> set of torrent IDs
+        self._artist_groups = {} # artist ID -> group IDs listed in its 'artist' response
+        self._group_artists_from_artists = {} # group ID -> artist IDs whose 'artist' response listed it
+
+    def on_hydrated(self, entity, source):
+        if isinstance(entity, Torrent):
+            self.index_torrent(entity)
+        elif isinstance(entity, TorrentGroup):
+            self.index_group(entity)
+        elif isinstance(entity, Artist):
+            self.index_artist(entity)
+
+    def index_torrent(self, torrent):
+        with self._lock:
+            for field in TORRENT_FIELDS:
+                self.torrent_indexes[field].update(torrent.id, (getattr(torrent, field),))
+            group_id = torrent.group.id if torrent.group is not None else None
+            old_group_id = self._group_of.get(torrent.id)
+            if old_group_id != group_id:
+                if old_group_id is not None:
+                    self._group_torrents[old_group_id].discard(torrent.id)
+                if group_id is not None:
+                    self._group_torrents.setdefault(group_id, set()).add(torrent.id)
+                self._group_of[torrent.id] = group_id
+
+    def index_group(self, torrent_group):
+        with self._lock:
+            indexes = self.group_indexes
+            indexes['year'].update(torrent_group.id, (torrent_group.year,))
+            indexes['release_type'].update(torrent_group.id, (release_type.to_name(torrent_group.release_type),))
+            indexes['tag'].update(torrent_group.id, [tag.name for tag in torrent_group.tags])
+            indexes['artist'].update(torrent_group.id, self._group_artist_ids(torrent_group))
+            for torrent in torrent_group.torrents:
+                if self._group_of.get(torrent.id) != torrent_group.id:
+                    self._group_of[torrent.id] = torrent_group.id
+                    self._group_torrents.setdefault(torrent_group.id, set()).add(torrent.id)
+
+    def index_artist(self, artist):
+        with self._lock:
+            group_ids = set(torrent_group.id for torrent_group in artist.torrent_groups)
+            old_group_ids = self._artist_groups.get(artist.id, set())
+            self._artist_groups[artist.id] = group_ids
+            for group_id in old_group_ids - group_ids:
+                self._group_artists_from_artists[group_id].discard(artist.id)
+            for group_id in group_ids - old_group_ids:
+                self._group_artists_from_artists.setdefault(group_id, set()).add(artist.id)
+            for group_id in old_group_ids ^ group_ids:
+                torrent_group = self.parent_api.cached_torrent_groups.get(group_id)
+                if torrent_group is not None:
+                    self.group_indexes['artist'].update(group_id, self._group_artist_ids(torrent_group))
+
+    def _group_artist_ids(self, torrent_group):
+        artist_ids = set(self._group_artists_from_artists.get(torrent_group.id, ()))
+        if torrent_group.music_info:
+            artist_ids.update(artist.id for artist in torrent_group.music_info.get('artists', ()))
+        return artist_ids
+
+    def _group_candidates(self, conditions):
+        """
+        Returns the set of group IDs matching the group-level equality conditions, or None if there are none.
+        """
+        matched = None
+        postings = sorted((self.group_indexes[field].lookup(values) for field, values in conditions.items()), key=len)
+        for posting in postings:
+            matched = set(posting) if matched is None else matched & posting
+            if not matched:
+                break
+        return matched
+
+    def query_ids(self, **conditions):
+        """
+        Returns the set of IDs of known Torrents matching conditions (see query()).
+        """
+        torrent_conditions = {}
+        group_conditions = {}
+        range_conditions = []
+        for key, value in conditions.items():
+            if key.startswith('min_') or key.startswith('max_'):
+                if key[4:] not in RANGE_FIELDS:
+                    raise ValueError("Can't query a range on '%s'" % key[4:])
+                range_conditions.append((key[4:], key.startswith('min_'), value))
+                continue
+            values = list(value) if isinstance(value, (list, tuple, set, frozenset)) else [value]
+            if key == 'artist':
+                values = [getattr(v, 'id', v) for v in values]
+            elif key == 'tag':
+                values = [getattr(v, 'name', v) for v in values]
+            elif key == 'release_type':
+                values = [release_type.to_name(v) for v in values]
+            if key in TORRENT_FIELDS:
+                torrent_conditions[key] = values
+            elif key in GROUP_FIELDS:
+                group_conditions[key] = values
+            else:
+                raise ValueError("Unknown query field '%s'" % key)
+
+        with self._lock:
+            postings = [self.torrent_indexes[field].lookup(values) for field, values in torrent_conditions.items()]
+            if group_conditions:
+                group_ids = self._group_candidates(group_conditions)
+                torrent_ids = set()
+                for group_id in group_ids:
+                    torrent_ids.update(self._group_torrents.get(group_id, ()))
+                postings.append(torrent_ids)
+            if postings:
+                postings.sort(key=len)
+                matched = set(postings[0])
+                for posting in postings[1:]:
+                    matched &= posting
+                    if not matched:
+                        break
+            else:
+                matched = set(self._group_of)
+
+        if range_conditions:
+            matched = set(torrent.id for torrent in self._resolve(matched)
+                          if self._in_ranges(torrent, range_conditions))
+        return matched
+
+    def query(self, **conditions):
+        """
+        Returns the known Torrents matching all conditions, from the local indexes only (no API calls):
+            format, encoding, media: a value or a list of values (any of them matches)
+            year, release_type, tag, artist: the same, checked against the torrent's group; release_type takes names
+                                             (see release_type.py) or the site's numeric IDs, tag takes names or
+                                             Tags and artist takes IDs or Artists
+            min_<field> / max_<field>: inclusive bounds on seeders, leechers, snatched, size, log_score or year
+        Results are sorted by torrent ID.
+        """
+        return self._resolve(sorted(self.query_ids(**conditions)))
+
+    def _resolve(self, torrent_ids):
+        # the identity map may have dropped torrents nobody holds anymore; forget those as we find them
+        torrents = []
+        for torrent_id in torrent_ids:
+            torrent = self.parent_api.cached_torrents.get(torrent_id)
+            if torrent is None:
+                self._forget_torrent(torrent_id)
+            else:
+                torrents.append(torrent)
+        return torrents
+
+    def _forget_torrent(self, torrent_id):
+        with self._lock:
+            for index in self.torrent_indexes.values():
+                index.remove(torrent_id)
+            group_id = self._group_of.pop(torrent_id, None)
+            if group_id is not None:
+                self._group_torrents[group_id].discard(torrent_id)
+
+    def _in_ranges(self, torrent, range_conditions):
+        for field, is_min, bound in range_conditions:
+            if field == 'year':
+                value = torrent.group.year if torrent.group is not None else None
+            else:
+                value = getattr(torrent, field)
+            if value is None or (value < bound if is_min else value > bound):
+                return False
+        return True
+
+    def __repr__(self):
+        return "LocalIndex: %s torrents in %s groups" % (len(self._group_of), len(self._group_torrents))
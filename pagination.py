@@ -0,0 +1,91 @@
+import threading
+
+class _PageFetch(object):
+    """
+    Fetches one page, on a background thread if prefetching, and hands back the response or re-raises its error.
+    """
+    def __init__(self, request_page, page, background):
+        self.page = page
+        self._request_page = request_page
+        self._response = None
+        self._error = None
+        self._thread = None
+        if background:
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        try:
+            self._response = self._request_page(self.page)
+        except Exception as e:
+            self._error = e
+
+    def result(self):
+        if self._thread is None:
+            self._run()
+        else:
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._response
+
+
+class PageIterator(object):
+    """
+    Iterates over the items of a paginated API call, page after page. request_page(page) makes the API call for a page
+    and returns its parsed response; parse_page(response) turns that into (list of items, total number of pages).
+    Only request_page runs on the background thread; parse_page, which fills model objects, runs on the caller's.
+
+    With prefetch on, the request for page N+1 goes out in the background as soon as page N arrives, so the rate limit
+    wait and the network time overlap with the caller working through page N's items.
+
+    current_page is the page the last yielded item came from and total_pages the page count reported by the site.
+    To resume an interrupted walk, start a new iterator at current_page (or current_page + 1 once a page was
+    finished).
+    """
+    def __init__(self, request_page, parse_page, start_page=1, max_pages=None, max_results=None, prefetch=True):
+        self.request_page = request_page
+        self.parse_page = parse_page
+        self.current_page = None
+        self.total_pages = None
+        self.max_pages = max_pages
+        self.max_results = max_results
+        self.prefetch = prefetch
+        self.pages_fetched = 0
+        self.results = 0
+        self._items = iter(())
+        self._pending = None
+        if max_pages != 0:
+            self._pending = _PageFetch(request_page, int(start_page), False)
+
+    def __iter__(self):
+        return self
+
+    def _next_page(self):
+        fetch = self._pending
+        self._pending = None
+        items, total_pages = self.parse_page(fetch.result())
+        self.current_page = fetch.page
+        self.total_pages = int(total_pages)
+        self.pages_fetched += 1
+        wanted = self.max_results is None or self.results + len(items) < self.max_results
+        if wanted and fetch.page < self.total_pages and (self.max_pages is None or self.pages_fetched < self.max_pages):
+            self._pending = _PageFetch(self.request_page, fetch.page + 1, self.prefetch)
+        self._items = iter(items)
+
+    def __next__(self):
+        if self.max_results is not None and self.results >= self.max_results:
+            raise StopIteration
+        while True:
+            for item in self._items:
+                self.results += 1
+                return item
+            if self._pending is None:
+                raise StopIteration
+            self._next_page()
+
+    next = __next__ # Python 2
+
+    def __repr__(self):
+        return "PageIterator: page %s/%s - %s results" % (self.current_page, self.total_pages, self.results)
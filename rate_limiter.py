@@ -0,0 +1,127 @@
+import time
+import threading
+
+class TokenBucket(object):
+    """
+    Token bucket rate limiter used by GazelleAPI to space out requests. A token is added every 'rate_limit' seconds,
+    up to 'burst' tokens, so up to 'burst' requests can go out back to back before calls start being spaced out.
+
+    The bucket is adaptive: record_failure() (called on error statuses and non-'success' payloads) multiplies the
+    interval between tokens by 'backoff_factor', up to 'max_rate_limit', and record_success() shrinks it back towards
+    'rate_limit' by 'recovery_factor'.
+
+    Waiting is exact: reserve() hands out a slot and returns how long the caller must sleep until it comes up, so
+    there is no polling. Wait times are tallied in stats() so you can see how much of a crawl is spent throttled.
+    GazelleAPI queues its threads in a PriorityScheduler and only the one at the head waits here, so the time the
+    others spend queued is in the scheduler's stats() instead.
+    """
+    def __init__(self, rate_limit=2.0, burst=1, max_rate_limit=60.0, backoff_factor=2.0, recovery_factor=0.9,
+                 clock=time.time, sleep=time.sleep):
+        if burst < 1:
+            raise ValueError("burst must be at least 1, got %s" % burst)
+        self.rate_limit = float(rate_limit)
+        self.burst = int(burst)
+        self.max_rate_limit = max(float(max_rate_limit), self.rate_limit)
+        self.backoff_factor = float(backoff_factor)
+        self.recovery_factor = float(recovery_factor)
+        self.interval = self.rate_limit # current, possibly backed off, seconds per token
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._next_slot = self.clock() # theoretical arrival time of the next request if the bucket were empty
+        self.requests = 0
+        self.throttled_requests = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.failures = 0
+
+    def _delay(self, now):
+        # with a full bucket, a request may go out (burst - 1) intervals ahead of the schedule
+        return max(0.0, self._next_slot - (self.burst - 1) * self.interval - now)
+
+    def peek(self):
+        """
+        Returns how many seconds a request made now would have to wait, without reserving a slot.
+        """
+        with self._lock:
+            return self._delay(self.clock())
+
+    def reserve(self):
+        """
+        Takes the next free slot and returns the number of seconds the caller has to wait before using it. Does not
+        sleep; use wait() for that, or sleep yourself and report it with record_wait().
+        """
+        with self._lock:
+            now = self.clock()
+            self._next_slot = max(self._next_slot, now)
+            delay = self._delay(now)
+            self._next_slot += self.interval
+            return delay
+
+    def record_wait(self, waited):
+        """
+        Adds a wait (in seconds) to the running statistics.
+        """
+        with self._lock:
+            self.requests += 1
+            if waited > 0:
+                self.throttled_requests += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+
+    def wait(self):
+        """
+        Blocks until a request may be made, and returns the number of seconds spent waiting.
+        """
+        delay = self.reserve()
+        if delay > 0:
+            self.sleep(delay)
+        self.record_wait(delay)
+        return delay
+
+    def set_rate_limit(self, rate_limit):
+        """
+        Changes the base interval between requests. A backed off interval stays as it is, unless it's now shorter than
+        rate_limit.
+        """
+        with self._lock:
+            backed_off = self.interval > self.rate_limit
+            self.rate_limit = float(rate_limit)
+            self.max_rate_limit = max(self.max_rate_limit, self.rate_limit)
+            self.interval = max(self.interval, self.rate_limit) if backed_off else self.rate_limit
+
+    def record_success(self):
+        """
+        Signals a good response. Lets a backed-off interval recover towards rate_limit.
+        """
+        with self._lock:
+            if self.interval > self.rate_limit:
+                self.interval = max(self.rate_limit, self.interval * self.recovery_factor)
+
+    def record_failure(self):
+        """
+        Signals an error status or failed payload. Backs the interval off, up to max_rate_limit, and empties the
+        bucket so the next request waits out a full backed-off interval.
+        """
+        with self._lock:
+            self.failures += 1
+            self.interval = min(self.max_rate_limit, self.interval * self.backoff_factor)
+            self._next_slot = max(self._next_slot, self.clock() + self.burst * self.interval)
+
+    def stats(self):
+        """
+        Returns a dict snapshot of the limiter's current interval and accumulated wait statistics.
+        """
+        with self._lock:
+            return {'rate_limit': self.rate_limit,
+                    'interval': self.interval,
+                    'burst': self.burst,
+                    'requests': self.requests,
+                    'throttled_requests': self.throttled_requests,
+                    'total_wait': self.total_wait,
+                    'max_wait': self.max_wait,
+                    'failures': self.failures}
+
+    def __repr__(self):
+        return "TokenBucket: %.2fs/request (burst %s) - waited %.1fs over %s requests" % \
+               (self.interval, self.burst, self.total_wait, self.requests)
@@ -16,4 +16,21 @@ ALL_RELEASE_TYPES = [ALBUM, SOUNDTRACK, EP, ANTHOLOGY, COMPILATION, DJ_MIX, SING
                      INTERVIEW, MIXTAPE, UNKNOWN]
 
 def get_int_val(release_type):
-    return ALL_RELEASE_TYPES.index(release_type) + 1
\ No newline at end of file
+    return ALL_RELEASE_TYPES.index(release_type) + 1
+
+def get_name(int_val):
+    """
+    Returns the release type named by the site's numeric ID, or None for an ID it doesn't know.
+    """
+    if 1 <= int_val <= len(ALL_RELEASE_TYPES):
+        return ALL_RELEASE_TYPES[int_val - 1]
+    return None
+
+def to_name(value):
+    """
+    Returns the release type name for a TorrentGroup.release_type value. Groups filled from 'torrentgroup' or
+    'artist' responses hold the site's numeric ID, those filled from 'browse' its name; empty values become None.
+    """
+    if isinstance(value, int):
+        return get_name(value)
+    return value or None
@@ -1,6 +1,15 @@
+from hooks import hydrates, fault_in
+from schema import Schema, Field, Computed, KEEP
+
 class InvalidRequestException(Exception):
     pass
 
+# a request item of an 'artist' response; keys are the camelCase attribute names (see schema.py)
+FROM_ARTIST = Schema('request_from_artist', [
+    Computed('category', "api.get_category(data['categoryId'])", ('categoryId',), KEEP),
+    Field('title'), Field('year'), Field('time_added'), Field('votes'), Field('bounty'),
+])
+
 class Request(object):
     def __init__(self, id, parent_api):
         self.id = id
@@ -11,19 +20,19 @@ class Request(object):
         self.time_added = None
         self.votes = None
         self.bounty = None
+        self.fetched = None
 
         self.parent_api.cached_requests[self.id] = self # add self to cache of known Request objects
 
+    @hydrates('artist')
     def set_data(self, request_item_json_data):
         if self.id != request_item_json_data['requestId']:
             raise InvalidRequestException("Tried to update a Request's information from a request JSON item with a different id." +
                                          " Should be %s, got %s" % (self.id, request_item_json_data['requestId']) )
-        self.category = self.parent_api.get_category(request_item_json_data['categoryId'])
-        self.title = request_item_json_data['title']
-        self.year = request_item_json_data['year']
-        self.time_added = request_item_json_data['timeAdded']
-        self.votes = request_item_json_data['votes']
-        self.bounty = request_item_json_data['bounty']
+        FROM_ARTIST.hydrate(self, request_item_json_data)
+
+    def __getattr__(self, name):
+        return fault_in(self, name) # only reached for attributes never set, i.e. on objects loaded from a snapshot
 
     def __repr__(self):
         return "Request: %s - ID: %s" % (self.title, self.id)
\ No newline at end of file
@@ -0,0 +1,167 @@
+import json
+import sqlite3
+import threading
+import time
+
+DEFAULT_TTLS = {
+    'torrentgroup': 7 * 24 * 3600,
+    'artist': 24 * 3600,
+    'user': 24 * 3600,
+    'request': 24 * 3600,
+    'browse': 3600,
+    'usersearch': 3600,
+    'index': 60,
+    'inbox': 60,
+}
+
+# 'failure' errors meaning the thing asked for doesn't exist, rather than that the site couldn't answer just then
+NOT_FOUND_ERRORS = ('bad id', 'bad parameters', 'not found', 'no such')
+
+class ResponseCache(object):
+    """
+    Persistent cache of 'ajax.php' responses, kept in an SQLite database so it survives restarts. Entries are keyed on
+    a scope, the action and its normalized parameters, and expire after a per-action TTL in seconds (see DEFAULT_TTLS;
+    actions not listed use default_ttl, and a TTL of 0 disables caching for that action). GazelleAPI uses its site and
+    user ID as the scope, since many responses ('index', 'inbox', bookmarks and snatches in the rest) depend on who's
+    asking; one cache file can then serve several accounts and sites without mixing them up.
+
+    Lookups the site answered with a 'failure' saying the thing doesn't exist (an error containing one of
+    not_found_errors, e.g. 'bad id parameter' for a deleted torrent group) are remembered for negative_ttl seconds, so
+    bad IDs aren't requested again and again. Other failures may be transient and aren't kept.
+
+    Expired entries are deleted when they're next looked up, or all at once by purge_expired(). Hit, miss and eviction
+    counts are available from stats().
+    """
+    def __init__(self, path, ttls=None, default_ttl=3600, negative_ttl=6 * 3600, clock=time.time,
+                 not_found_errors=NOT_FOUND_ERRORS):
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.default_ttl = default_ttl
+        self.negative_ttl = negative_ttl
+        self.not_found_errors = tuple(error.lower() for error in not_found_errors)
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS responses ("
+                         "key TEXT PRIMARY KEY, action TEXT, expires REAL, failed INTEGER, content BLOB)")
+        self._db.commit()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stores = 0
+
+    def ttl(self, action):
+        return self.ttls.get(action, self.default_ttl)
+
+    def _key(self, action, params, scope):
+        return json.dumps([scope, action] + sorted([key, str(value)] for key, value in params.items()))
+
+    def is_not_found(self, error):
+        """
+        Returns whether a 'failure' error message says the thing asked for doesn't exist.
+        """
+        error = (error or '').lower()
+        return any(not_found in error for not_found in self.not_found_errors)
+
+    def get(self, action, params, scope=None):
+        """
+        Returns a (failed, content) tuple for a live entry, or None on a miss. content is the raw response body, or
+        the error message for a remembered failure. scope is any JSON-serializable value, such as (site, user ID).
+        """
+        if not self.ttl(action):
+            return None
+        key = self._key(action, params, scope)
+        with self._lock:
+            row = self._db.execute("SELECT expires, failed, content FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            expires, failed, content = row
+            if expires <= self.clock():
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                self.evictions += 1
+                self.misses += 1
+                return None
+            if failed:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return bool(failed), bytes(content)
+
+    def set(self, action, params, content, scope=None):
+        """
+        Stores a successful response body.
+        """
+        self._store(action, params, scope, content, False, self.ttl(action))
+
+    def set_failure(self, action, params, error=None, scope=None):
+        """
+        Remembers that a request failed, so get() reports it until negative_ttl runs out. Only errors saying the thing
+        doesn't exist are kept (see is_not_found()); returns whether this one was.
+        """
+        if not self.is_not_found(error):
+            return False
+        self._store(action, params, scope, (error or '').encode('utf-8'), True,
+                    min(self.negative_ttl, self.ttl(action)))
+        return True
+
+    def _store(self, action, params, scope, content, failed, ttl):
+        if not ttl:
+            return
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO responses (key, action, expires, failed, content) "
+                             "VALUES (?, ?, ?, ?, ?)",
+                             (self._key(action, params, scope), action, self.clock() + ttl, int(failed),
+                              sqlite3.Binary(content)))
+            self._db.commit()
+            self.stores += 1
+
+    def invalidate(self, action, params=None, scope=None):
+        """
+        Drops the entry for action and params in scope, or every entry for the action (in every scope) if params is
+        None.
+        """
+        with self._lock:
+            if params is None:
+                self._db.execute("DELETE FROM responses WHERE action = ?", (action,))
+            else:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (self._key(action, params, scope),))
+            self._db.commit()
+
+    def purge_expired(self):
+        """
+        Deletes all expired entries and returns how many were removed.
+        """
+        with self._lock:
+            removed = self._db.execute("DELETE FROM responses WHERE expires <= ?", (self.clock(),)).rowcount
+            self._db.commit()
+            self.evictions += removed
+            return removed
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self):
+        """
+        Returns a dict snapshot of the cache's hit, miss, eviction and store counts.
+        """
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {'hits': self.hits,
+                    'negative_hits': self.negative_hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'stores': self.stores,
+                    'hit_ratio': float(self.hits + self.negative_hits) / lookups if lookups else 0.0}
+
+    def __repr__(self):
+        return "ResponseCache: %s - %s hits, %s misses" % (self.path, self.hits + self.negative_hits, self.misses)
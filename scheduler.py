@@ -0,0 +1,107 @@
+import threading
+import time
+
+HIGH = 0
+NORMAL = 1
+LOW = 2
+
+PRIORITY_NAMES = {HIGH: 'high', NORMAL: 'normal', LOW: 'low'}
+
+class PriorityScheduler(object):
+    """
+    Puts requests of different priorities through one rate limiter. Callers queue in wait(priority); each time the
+    limiter frees a slot, the waiting caller with the best priority (HIGH, then NORMAL, then LOW, first come first
+    served within a class) gets it. So an interactive request goes out as soon as the slot being waited on has
+    passed, however many background requests are queued.
+
+    To keep background work from starving, a caller's priority improves by one class for every 'aging' seconds it
+    has been waiting: with the default of 30, a LOW request queued for a minute competes with a fresh HIGH one.
+
+    stats() has, per priority class, the current and largest queue depth, the number of requests, and the time they
+    waited: 'queue_wait' behind other callers, 'rate_wait' on the rate limiter once at the head of the queue, and
+    'total_wait' and 'max_wait' for the two together. Only the caller at the head waits on the limiter, so its own
+    stats count just rate_wait; the rest of the time the limiter holds requests up shows as queue_wait.
+    """
+    def __init__(self, rate_limiter, aging=30.0, clock=time.time):
+        self.rate_limiter = rate_limiter
+        self.aging = float(aging)
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._waiting = []
+        self._busy = False
+        self._stats = dict((priority, {'queued': 0, 'max_queued': 0, 'requests': 0, 'queue_wait': 0.0,
+                                       'rate_wait': 0.0, 'total_wait': 0.0, 'max_wait': 0.0})
+                           for priority in PRIORITY_NAMES)
+
+    def wait(self, priority=NORMAL):
+        """
+        Blocks until it's this caller's turn and the rate limiter allows a request. Returns the seconds spent waiting
+        for the turn and then for the rate limiter, as a pair.
+        """
+        if priority not in PRIORITY_NAMES:
+            raise ValueError("Unknown priority %r, expected one of %s" % (priority, sorted(PRIORITY_NAMES)))
+        ticket = _Ticket(priority, self.clock())
+        with self._lock:
+            stats = self._stats[priority]
+            stats['queued'] += 1
+            stats['max_queued'] = max(stats['max_queued'], stats['queued'])
+            if self._busy:
+                self._waiting.append(ticket)
+            else:
+                self._busy = True
+                ticket.turn.set()
+        ticket.turn.wait()
+        turn = self.clock()
+        try:
+            self.rate_limiter.wait()
+        finally:
+            self._next_turn()
+        queued = turn - ticket.arrival
+        limited = self.clock() - turn
+        with self._lock:
+            stats['queued'] -= 1
+            stats['requests'] += 1
+            stats['queue_wait'] += queued
+            stats['rate_wait'] += limited
+            stats['total_wait'] += queued + limited
+            stats['max_wait'] = max(stats['max_wait'], queued + limited)
+        return queued, limited
+
+    def _next_turn(self):
+        with self._lock:
+            if not self._waiting:
+                self._busy = False
+                return
+            now = self.clock()
+            ticket = min(self._waiting, key=lambda t: (t.priority - (now - t.arrival) / self.aging, t.arrival))
+            self._waiting.remove(ticket)
+            ticket.turn.set()
+
+    def queue_depth(self, priority=None):
+        """
+        Returns how many callers of the given priority (or of any, if None) are waiting or being served.
+        """
+        with self._lock:
+            if priority is None:
+                return sum(stats['queued'] for stats in self._stats.values())
+            return self._stats[priority]['queued']
+
+    def stats(self):
+        """
+        Returns a dict of priority name to a snapshot of that class's queue statistics.
+        """
+        with self._lock:
+            return dict((PRIORITY_NAMES[priority], dict(stats)) for priority, stats in self._stats.items())
+
+    def __repr__(self):
+        return "PriorityScheduler: %s" % ", ".join("%s %s queued" % (PRIORITY_NAMES[priority], stats['queued'])
+                                                    for priority, stats in sorted(self._stats.items()))
+
+
+class _Ticket(object):
+    __slots__ = ('priority', 'arrival', 'turn')
+
+    def __init__(self, priority, arrival):
+        self.priority = priority
+        self.arrival = arrival
+        self.turn = threading.Event()
@@ -0,0 +1,167 @@
+"""
+Declarative mappings from API response keys to model attributes, compiled into plain functions for the models'
+set_*_data() methods.
+
+A Schema lists the fields one response fills: which key goes to which attribute, what to use when the key is missing
+and how a value becomes a model object. It's compiled with exec into a function making the same attribute assignments
+a hand-written method would, so it runs just as fast:
+
+    FROM_BROWSE = Schema('torrent_from_browse', [
+        Reference('group', 'groupId', 'get_torrent_group'),  # obj.group = api.get_torrent_group(data['groupId'])
+        Field('remaster_year'),                               # obj.remaster_year = data['remasterYear']
+        Field('snatched', 'snatches'),                        # a key with another name
+        Computed('free_torrent', "data.get('isFreeleech') or data.get('isPersonalFreeleech')"),
+    ])
+    FROM_BROWSE.hydrate(torrent, search_result)
+
+Keys are the camelCase form of the attribute unless given. A missing key doesn't raise: the attribute is set to the
+field's default (None unless given; defaults are shared, so make them immutable), or with default=KEEP left as it
+is; Schema(..., default=KEEP) does that for every field at once. Computed fields get the same treatment for the keys
+their expression needs, given as requires. The compiled function first runs the plain subscripts and only falls back
+to checking each key when one turns out to be missing, so complete responses pay nothing for this. A Schema's generated code is in its source attribute.
+"""
+import re
+
+KEEP = object() # default meaning "leave the attribute alone if the key is missing"
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+def camel_case(attribute):
+    """
+    Returns the response key named like attribute, e.g. 'remaster_year' -> 'remasterYear'.
+    """
+    return re.sub(r'_([a-z])', lambda match: match.group(1).upper(), attribute.lstrip('_'))
+
+
+class Field(object):
+    """
+    Copies data[key] to the attribute, through convert (a function of the value) if given.
+    """
+    uses_api = False
+
+    def __init__(self, attribute, key=None, default=None, convert=None):
+        if not _IDENTIFIER.match(attribute):
+            raise ValueError("Not an attribute name: %r" % attribute)
+        self.attribute = attribute
+        self.key = key or camel_case(attribute)
+        self.default = default
+        self.convert = convert
+
+    def _converted(self, value, namespace):
+        if self.convert is None:
+            return value
+        name = '_convert_%s' % self.attribute
+        namespace[name] = self.convert
+        return '%s(%s)' % (name, value)
+
+    def _default(self, namespace):
+        if self.default is None:
+            return 'None'
+        name = '_default_%s' % self.attribute
+        namespace[name] = self.default
+        return name
+
+    def lines(self, checked, namespace):
+        """
+        Returns the statements filling this field. Unless checked, they may assume the key is there.
+        """
+        target = 'obj.%s' % self.attribute
+        key = repr(self.key)
+        value = self._converted('data[%s]' % key, namespace)
+        if not checked:
+            return ['%s = %s' % (target, value)]
+        if self.default is KEEP:
+            return ['if %s in data:' % key, '    %s = %s' % (target, value)]
+        if value == 'data[%s]' % key:
+            if self.default is None:
+                return ['%s = data.get(%s)' % (target, key)]
+            return ['%s = data.get(%s, %s)' % (target, key, self._default(namespace))]
+        return ['%s = %s if %s in data else %s' % (target, value, key, self._default(namespace))]
+
+
+class Reference(Field):
+    """
+    Sets the attribute to the model object whose ID is data[key], looked up with the parent API's getter (e.g.
+    'get_torrent_group').
+    """
+    uses_api = True
+
+    def __init__(self, attribute, key, getter, default=None):
+        Field.__init__(self, attribute, key, default)
+        self.getter = getter
+
+    def _converted(self, value, namespace):
+        return 'api.%s(%s)' % (self.getter, value)
+
+
+class Computed(object):
+    """
+    Sets the attribute to a Python expression, which can use data (the response) and api (the parent API). If the
+    expression subscripts data, list those keys in requires: when one is missing the attribute is set to default
+    instead (or left alone, with default=KEEP) rather than the KeyError escaping.
+    """
+    uses_api = True
+
+    def __init__(self, attribute, expression, requires=(), default=None):
+        if not _IDENTIFIER.match(attribute):
+            raise ValueError("Not an attribute name: %r" % attribute)
+        self.attribute = attribute
+        self.expression = expression
+        self.requires = tuple(requires)
+        self.default = default
+
+    def lines(self, checked, namespace):
+        target = 'obj.%s' % self.attribute
+        if not checked or not self.requires:
+            return ['%s = %s' % (target, self.expression)]
+        present = ' and '.join('%r in data' % key for key in self.requires)
+        if self.default is KEEP:
+            return ['if %s:' % present, '    %s = %s' % (target, self.expression)]
+        default = 'None'
+        if self.default is not None:
+            default = '_default_%s' % self.attribute
+            namespace[default] = self.default
+        return ['%s = %s if %s else %s' % (target, self.expression, present, default)]
+
+
+class Schema(object):
+    """
+    The fields filled from one kind of response, compiled into hydrate(obj, data). default, if given, becomes the
+    default of every field without one of its own; default=KEEP suits responses that are partial views of an object.
+    """
+    def __init__(self, name, fields, default=None):
+        if not _IDENTIFIER.match(name):
+            raise ValueError("Not a function name: %r" % name)
+        self.name = name
+        self.fields = list(fields)
+        if default is not None:
+            for field in self.fields:
+                if field.default is None:
+                    field.default = default
+        namespace = {}
+        self.source = self._source(namespace)
+        exec(compile(self.source, '<schema %s>' % name, 'exec'), namespace)
+        self.hydrate = namespace[name]
+
+    def _source(self, namespace):
+        lines = ['def %s(obj, data):' % self.name]
+        if any(field.uses_api for field in self.fields):
+            lines.append('    api = obj.parent_api')
+        fast = [line for field in self.fields for line in field.lines(False, namespace)]
+        checked = [line for field in self.fields for line in field.lines(True, namespace)]
+        if fast == checked:
+            lines.extend('    ' + line for line in fast)
+        else:
+            lines.append('    try:')
+            lines.extend('        ' + line for line in fast)
+            lines.append('    except KeyError:') # a key is missing: start over, checking every key
+            lines.extend('        ' + line for line in checked)
+        if len(lines) == 1:
+            lines.append('    pass')
+        return '\n'.join(lines) + '\n'
+
+    def attributes(self):
+        return [field.attribute for field in self.fields]
+
+    def __repr__(self):
+        return "Schema: %s - %s fields" % (self.name, len(self.fields))
@@ -0,0 +1,57 @@
+import json
+import os
+import time
+
+from downloader import atomic_write
+
+class SessionStore(object):
+    """
+    Keeps a logged in session on disk so a new GazelleAPI can skip logging in. Pass one as
+    GazelleAPI(..., session_store=SessionStore('~/.pygazelle-session.json')).
+
+    The file holds the session cookies and the 'index' response the API logs in with (user ID, authkey, passkey and
+    the rest of the account info) as JSON. It's written atomically with owner-only permissions, since the cookies
+    and keys grant access to the account. A saved session is only used by an API for the same site, and the same
+    username if it has one.
+    """
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+
+    def load(self, site=None, username=None):
+        """
+        Returns the saved state dict, or None if there's none, it can't be read, or it's for another site or user.
+        """
+        try:
+            with open(self.path, 'rb') as state_file:
+                state = json.loads(state_file.read().decode('utf-8'))
+        except (IOError, OSError, ValueError):
+            return None
+        if not isinstance(state, dict) or 'account' not in state or 'cookies' not in state:
+            return None
+        if site is not None and state.get('site') != site:
+            return None
+        if username is not None and state.get('username') != username:
+            return None
+        return state
+
+    def save(self, site, username, cookies, account):
+        """
+        Saves a session: cookies is a list of {'name', 'value', 'domain', 'path'} dicts, account the 'index'
+        response.
+        """
+        state = {'site': site,
+                 'username': username,
+                 'cookies': cookies,
+                 'account': account,
+                 'saved': time.time()}
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        atomic_write(self.path, [json.dumps(state).encode('utf-8')])
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __repr__(self):
+        return "SessionStore: %s" % self.path
@@ -0,0 +1,91 @@
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError: # not on Windows
+    fcntl = None
+
+from rate_limiter import TokenBucket
+
+_STATE = struct.Struct('<dd') # next slot, current interval
+
+class SharedTokenBucket(TokenBucket):
+    """
+    A TokenBucket shared by every process on the host that opens the same state file, so several crawler processes
+    together stay within one request budget. Use it like a TokenBucket:
+
+        api = GazelleAPI(username, password, rate_limiter=SharedTokenBucket('/tmp/pygazelle-what.cd.rate'))
+
+    The file holds the schedule (the next free slot and the current, possibly backed off, interval). Every reserve()
+    takes an exclusive flock on it just long enough to read the schedule, take the next slot and write it back, then
+    sleeps outside the lock. Slots are therefore handed out first come, first served across all processes, and a
+    failure seen by one process backs off all of them. Nothing is held while waiting for a slot, and the kernel drops
+    the flock of a process that dies, so a crashed process can't stall the others; at worst its reserved slot goes
+    unused.
+
+    All processes should use the same rate_limit and burst. The wait statistics in stats() are this process's own.
+    Needs fcntl, so it's Unix only.
+    """
+    def __init__(self, path, rate_limit=2.0, burst=1, max_rate_limit=60.0, backoff_factor=2.0, recovery_factor=0.9,
+                 clock=time.time, sleep=time.sleep):
+        if fcntl is None:
+            raise ImportError("SharedTokenBucket needs fcntl.flock, which isn't available on this platform")
+        TokenBucket.__init__(self, rate_limit, burst, max_rate_limit, backoff_factor, recovery_factor, clock, sleep)
+        self.path = path
+        self._lock = _SharedState(self, path)
+
+    def close(self):
+        self._lock.close()
+
+    def __repr__(self):
+        return "SharedTokenBucket: %s, %.2fs/request (burst %s) - waited %.1fs over %s requests" % \
+               (self.path, self.interval, self.burst, self.total_wait, self.requests)
+
+
+class _SharedState(object):
+    """
+    Stands in for TokenBucket's lock: entering it locks out other threads and (with flock) other processes, then
+    loads the shared schedule into the bucket; leaving it writes any change back before unlocking.
+    """
+    def __init__(self, bucket, path):
+        self.bucket = bucket
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._thread_lock = threading.Lock()
+        self._loaded = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        data = os.read(self.fd, _STATE.size)
+        bucket = self.bucket
+        if len(data) == _STATE.size:
+            next_slot, interval = _STATE.unpack(data)
+            bucket._next_slot = next_slot
+            bucket.interval = min(bucket.max_rate_limit, max(bucket.rate_limit, interval))
+            self._loaded = (next_slot, interval)
+        else: # new file: start from this bucket's schedule
+            self._loaded = None
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            state = (self.bucket._next_slot, self.bucket.interval)
+            if state != self._loaded:
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                os.write(self.fd, _STATE.pack(*state))
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            self._thread_lock.release()
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
@@ -0,0 +1,457 @@
+"""
+Binary snapshots of the API's identity maps, so a restarted program can pick up its object graph without making the
+calls again. GazelleAPI.save_snapshot() writes every known User, Artist, Tag, TorrentGroup, Torrent, Request and
+Category, with references between them (Torrent.group, TorrentGroup.music_info['artists'],
+Artist.similar_artists_and_score, Tag.artist_counts, ...) written as the referenced objects' keys.
+GazelleAPI.load_snapshot() memory maps the file and creates objects only as they are asked for.
+
+File layout, all integers little endian:
+    header: magic, format version, and the Python version that wrote it (marshal's format is only stable within one)
+    per identity map: the objects' records, each a marshal'ed tuple of field values, in key order; the records' end
+                      offsets as an array of int64 (starting with 0); the sorted keys, as an int64 array of IDs or a
+                      marshal'ed list of tag names
+    section table: marshal'ed list of (name, string keys?, count, data offset, offsets offset, keys offset, keys
+                   size, field names)
+    trailer: offset of the section table, magic
+
+Loading reads only the header, the table and the key arrays (in place, on Python 3). An object is created when its
+identity map misses on it, as a shell with only its key and parent_api set, and filled from its record the first
+time one of its other attributes is read (see hooks.fault_in()). Shells only enter the API's local indexes once they
+are filled from the API again.
+"""
+import marshal
+import mmap
+import struct
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+
+from user import User
+from artist import Artist
+from tag import Tag
+from request import Request
+from torrent_group import TorrentGroup
+from torrent import Torrent
+from category import Category
+from file_list import FileList
+from codes import MEDIA, FORMAT, ENCODING
+from downloader import atomic_write
+
+try:
+    array('q')
+    _INT_TYPECODE = 'q'
+except ValueError:
+    _INT_TYPECODE = 'l' # Python 2 has no 'q'; 'l' is 64 bits on the platforms that matter
+
+_MAGIC = b'PGSN'
+_VERSION = 2
+_HEADER = struct.Struct('<4sHBB') # magic, version, Python major and minor version
+_TRAILER = struct.Struct('<Q4s') # section table offset, magic
+
+def _slots(cls):
+    return tuple(slot for klass in cls.__mro__ for slot in getattr(klass, '__slots__', ()) if slot != '__weakref__')
+
+def _fields(cls, key_attribute):
+    return tuple(slot for slot in _slots(cls) if slot not in (key_attribute, 'parent_api'))
+
+# identity map name -> (model class, key attribute, attributes written for each object)
+MODELS = {
+    'users': (User, 'id', _fields(User, 'id')),
+    'artists': (Artist, 'id', _fields(Artist, 'id')),
+    'tags': (Tag, 'name', ('artist_counts',)),
+    'torrent_groups': (TorrentGroup, 'id', _fields(TorrentGroup, 'id')),
+    'torrents': (Torrent, 'id', _fields(Torrent, 'id')),
+    'requests': (Request, 'id', ('category', 'title', 'year', 'time_added', 'votes', 'bounty', 'fetched')),
+    'categories': (Category, 'id', ('name',)),
+}
+
+_MAP_NAMES = dict((cls, name) for name, (cls, _, _) in MODELS.items())
+_FIELD_SETS = dict((name, frozenset(fields)) for name, (_, _, fields) in MODELS.items())
+_SLOTS = dict((name, _slots(cls)) for name, (cls, _, _) in MODELS.items())
+
+_GETTERS = {'users': 'get_user', 'artists': 'get_artist', 'tags': 'get_tag', 'torrent_groups': 'get_torrent_group',
+            'torrents': 'get_torrent', 'requests': 'get_request', 'categories': 'get_category'}
+
+def _attributes(obj, map_name):
+    """
+    Returns a dict of the attributes set on obj, without faulting it in.
+    """
+    if hasattr(type(obj), '__slots__'):
+        attributes = {}
+        for slot in _SLOTS[map_name]:
+            try:
+                attributes[slot] = object.__getattribute__(obj, slot)
+            except AttributeError:
+                pass
+        return attributes
+    return dict(object.__getattribute__(obj, '__dict__'))
+
+
+class _ScratchAPI(object):
+    """
+    Stands in for the parent API while a model's constructor runs on a scratch object, so that object's defaults can
+    be read off it without it being registered in the API's identity maps.
+    """
+    def __getattr__(self, name):
+        if name.startswith('cached_'):
+            return {}
+        raise AttributeError(name)
+
+
+
+class _Reference(object):
+    """
+    A field holding model objects of one identity map: a single object, a list of them, or a dict keyed by them.
+    They're written as their keys.
+    """
+    def __init__(self, map_name):
+        self.map_name = map_name
+        self.key_attribute = MODELS[map_name][1]
+
+    def encode(self, value):
+        if value is None:
+            return None
+        if isinstance(value, list):
+            return [getattr(item, self.key_attribute) for item in value]
+        if isinstance(value, dict):
+            return dict((getattr(item, self.key_attribute), item_value) for item, item_value in value.items())
+        return getattr(value, self.key_attribute)
+
+    def decode(self, api, value):
+        if value is None:
+            return None
+        get = getattr(api, _GETTERS[self.map_name])
+        if isinstance(value, list):
+            return [get(key) for key in value]
+        if isinstance(value, dict):
+            return dict((get(key), item_value) for key, item_value in value.items())
+        return get(value)
+
+
+class _NestedReferences(object):
+    """
+    A dict of plain values where some keys hold references, like TorrentGroup.music_info.
+    """
+    def __init__(self, map_name, keys):
+        self.reference = _Reference(map_name)
+        self.keys = keys
+
+    def _convert(self, value, convert):
+        if value is None:
+            return None
+        value = dict(value)
+        for key in self.keys:
+            if key in value:
+                value[key] = convert(value[key])
+        return value
+
+    def encode(self, value):
+        return self._convert(value, self.reference.encode)
+
+    def decode(self, api, value):
+        return self._convert(value, lambda references: self.reference.decode(api, references))
+
+
+class _FileListField(object):
+    """
+    A Torrent's FileList, written in the site's raw fileList form and parsed again on first use.
+    """
+    def encode(self, value):
+        return None if value is None else value.raw()
+
+    def decode(self, api, value):
+        return None if value is None else FileList(value)
+
+
+class _CodedString(object):
+    """
+    A string stored as a codes.CodeTable code, written as the string: codes for values outside the table's initial
+    list depend on the order a process first saw them in, so they mean nothing to another process.
+    """
+    def __init__(self, table):
+        self.table = table
+
+    def encode(self, value):
+        return self.table.value(value)
+
+    def decode(self, api, value):
+        return self.table.code(value)
+
+
+# identity map name -> {field: codec} for the fields that aren't plain values
+_CODECS = {
+    'torrents': {'group': _Reference('torrent_groups'), 'user': _Reference('users'), '_file_list': _FileListField(),
+                 '_media': _CodedString(MEDIA), '_format': _CodedString(FORMAT), '_encoding': _CodedString(ENCODING)},
+    'torrent_groups': {'category': _Reference('categories'), '_tags': _Reference('tags'),
+                       '_torrents': _Reference('torrents'),
+                       'music_info': _NestedReferences('artists', ('artists', 'with'))},
+    'artists': {'_tags': _Reference('tags'), '_similar_artists_and_score': _Reference('artists'),
+                '_torrent_groups': _Reference('torrent_groups'), '_requests': _Reference('requests')},
+    'tags': {'artist_counts': _Reference('artists')},
+    'requests': {'category': _Reference('categories')},
+}
+
+def _int_bytes(values):
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes() if hasattr(values, 'tobytes') else values.tostring()
+
+def _encode(api, name, obj):
+    _, _, fields = MODELS[name]
+    codecs = _CODECS.get(name, {})
+    values = []
+    for field in fields:
+        value = getattr(obj, field)
+        codec = codecs.get(field)
+        values.append(value if codec is None else codec.encode(value))
+    return marshal.dumps(tuple(values))
+
+def _snapshot_chunks(api, previous):
+    """
+    Yields the snapshot file's contents. Objects that are still only in the previous snapshot, never having been
+    loaded from it, have their records copied across as they are.
+    """
+    position = 0
+    header = _HEADER.pack(_MAGIC, _VERSION, sys.version_info[0], sys.version_info[1])
+    yield header
+    position += len(header)
+    table = []
+    for name in api.identity_map_names:
+        _, key_attribute, fields = MODELS[name]
+        identity_map = getattr(api, 'cached_' + name)
+        objects = dict(identity_map.items())
+        keys = set(objects)
+        old = previous.section(name) if previous is not None else None
+        if old is not None:
+            keys.update(old.keys)
+        copy_records = old is not None and old.fields == fields
+        written = []
+        offsets = array(_INT_TYPECODE, [0])
+        data_offset = position
+        for key in sorted(keys):
+            obj = objects.get(key)
+            if obj is None and copy_records:
+                record = old.raw(old.position(key))
+            else:
+                if obj is None:
+                    obj = identity_map.get(key) # loads it from the previous snapshot
+                    if obj is None:
+                        continue
+                record = _encode(api, name, obj)
+            yield record
+            position += len(record)
+            written.append(key)
+            offsets.append(position - data_offset)
+        padding = -position % offsets.itemsize
+        yield b'\0' * padding
+        position += padding
+        offsets_offset = position
+        offsets = _int_bytes(offsets)
+        yield offsets
+        position += len(offsets)
+        string_keys = key_attribute != 'id'
+        keys_offset = position
+        keys = marshal.dumps(written) if string_keys else _int_bytes(array(_INT_TYPECODE, written))
+        yield keys
+        position += len(keys)
+        table.append((name, string_keys, len(written), data_offset, offsets_offset, keys_offset, len(keys), fields))
+    yield marshal.dumps(table)
+    yield _TRAILER.pack(position, _MAGIC)
+
+def save_snapshot(api, path):
+    """
+    Writes every object in api's identity maps to path (atomically, see downloader.atomic_write()). Objects only known
+    from a snapshot api has loaded are kept. Returns the size of the file in bytes.
+    """
+    return atomic_write(path, _snapshot_chunks(api, api.snapshot))
+
+
+class _Section(object):
+    """
+    One identity map's part of a snapshot file.
+    """
+    def __init__(self, snapshot, name, string_keys, count, data_offset, offsets_offset, keys_offset, keys_size,
+                 fields):
+        self.snapshot = snapshot
+        self.name = name
+        self.count = count
+        self.data_offset = data_offset
+        self.fields = tuple(fields)
+        # (field, codec) for each value in a record; field is None for fields the model no longer has
+        model_fields = _FIELD_SETS.get(name, frozenset())
+        codecs = _CODECS.get(name, {})
+        self.decoders = [(field, codecs.get(field)) if field in model_fields else (None, None) for field in fields]
+        self.offsets = snapshot._ints(offsets_offset, count + 1)
+        if string_keys:
+            self.keys = marshal.loads(snapshot._mmap[keys_offset:keys_offset + keys_size])
+        else:
+            self.keys = snapshot._ints(keys_offset, count)
+
+    def position(self, key):
+        """
+        Returns the index of key's record, or None if it isn't in the section.
+        """
+        keys = self.keys
+        try:
+            i = bisect_left(keys, key)
+        except TypeError: # a key of another type, e.g. a name looked up among IDs
+            return None
+        if i < len(keys) and keys[i] == key:
+            return i
+        return None
+
+    def raw(self, i):
+        return self.snapshot._mmap[self.data_offset + self.offsets[i]:self.data_offset + self.offsets[i + 1]]
+
+    def record(self, i):
+        return marshal.loads(self.raw(i))
+
+
+class Snapshot(object):
+    """
+    A snapshot file opened for lazy loading. GazelleAPI.load_snapshot() opens one and attaches it to the API, which
+    makes the API's identity maps create objects from it as they're asked for. Close it with close() once it's no
+    longer needed; that detaches it from the API.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.api = None
+        self._lock = threading.RLock()
+        self._views = []
+        self._file = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, major, minor = _HEADER.unpack(self._mmap[:_HEADER.size])
+            if magic != _MAGIC or version != _VERSION:
+                raise ValueError("%s is not a snapshot file" % path)
+            if (major, minor) != tuple(sys.version_info[:2]):
+                raise ValueError("%s was written by Python %s.%s" % (path, major, minor))
+            table_offset, magic = _TRAILER.unpack(self._mmap[-_TRAILER.size:])
+            if magic != _MAGIC:
+                raise ValueError("%s is truncated" % path)
+            table = marshal.loads(self._mmap[table_offset:len(self._mmap) - _TRAILER.size])
+            self._sections = dict((entry[0], _Section(self, *entry)) for entry in table)
+        except Exception:
+            self.close()
+            raise
+
+    def _ints(self, offset, count):
+        end = offset + count * array(_INT_TYPECODE).itemsize
+        if sys.byteorder == 'little' and hasattr(memoryview, 'cast'): # Python 3: use the mapped bytes in place
+            view = memoryview(self._mmap)[offset:end].cast(_INT_TYPECODE)
+            self._views.append(view)
+            return view
+        values = array(_INT_TYPECODE)
+        if hasattr(values, 'frombytes'):
+            values.frombytes(self._mmap[offset:end])
+        else:
+            values.fromstring(self._mmap[offset:end])
+        if sys.byteorder != 'little':
+            values.byteswap()
+        return values
+
+    def section(self, name):
+        return self._sections.get(name)
+
+    def keys(self, name):
+        """
+        Returns the sorted keys (IDs, or names for 'tags') of the objects of identity map name in the snapshot.
+        """
+        section = self._sections.get(name)
+        return list(section.keys) if section is not None else []
+
+    def __len__(self):
+        return sum(section.count for section in self._sections.values())
+
+    def attach(self, api):
+        """
+        Makes api's identity maps load the objects they don't know from this snapshot.
+        """
+        self.api = api
+        api.snapshot = self
+        for name in api.identity_map_names:
+            section = self._sections.get(name)
+            getattr(api, 'cached_' + name).loader = None if section is None else self._loader(api, name, section)
+
+    def _loader(self, api, name, section):
+        cls, key_attribute, _ = MODELS[name]
+        def load(key):
+            # runs under the identity map's lock, so it must not fill anything
+            if section.position(key) is None:
+                return None
+            obj = cls.__new__(cls)
+            setattr(obj, key_attribute, key)
+            obj.parent_api = api
+            return obj
+        return load
+
+    def fill(self, obj, name):
+        """
+        Sets up obj, a shell created by this snapshot's loaders, when its attribute name is first read: its attributes
+        are given the values from its record, and its model constructor's defaults for the rest. Attributes that were
+        set on it in the meantime are kept. Returns False if name isn't one of obj's fields.
+
+        The values are built under the snapshot's lock, then assigned under the API's hydration lock (see
+        GazelleAPI._hydrate_lock), so a thread filling obj from a response never sees it half set up from here.
+        """
+        map_name = _MAP_NAMES.get(type(obj))
+        if map_name is None or name not in _FIELD_SETS[map_name]:
+            return False
+        cls, key_attribute, _ = MODELS[map_name]
+        key = object.__getattribute__(obj, key_attribute)
+        api = object.__getattribute__(obj, 'parent_api')
+        with self._lock:
+            scratch = cls.__new__(cls)
+            cls.__init__(scratch, key, _ScratchAPI())
+            values = _attributes(scratch, map_name)
+            del values['parent_api']
+            section = self._sections.get(map_name)
+            i = section.position(key) if section is not None and self._mmap is not None else None
+            if i is not None:
+                for (field, codec), value in zip(section.decoders, section.record(i)):
+                    if codec is not None:
+                        values[field] = codec.decode(api, value)
+                    elif field is not None:
+                        values[field] = value
+        with api._hydrate_lock:
+            current = _attributes(obj, map_name)
+            for attribute, value in values.items():
+                if attribute not in current:
+                    setattr(obj, attribute, value)
+        return True
+
+    def close(self):
+        """
+        Detaches the snapshot from its API and closes the file. Objects created from it that haven't been filled yet
+        are filled first, since they can't be once the file is gone; objects they refer to that were never loaded are
+        then created empty, as for any ID the API hasn't seen.
+        """
+        if self.api is not None and self.api.snapshot is self:
+            for name in self.api.identity_map_names:
+                getattr(self.api, 'cached_' + name).loader = None
+            for name in self.api.identity_map_names:
+                fields = _FIELD_SETS[name]
+                for obj in getattr(self.api, 'cached_' + name).values():
+                    missing = fields.difference(_attributes(obj, name))
+                    if missing:
+                        self.fill(obj, next(iter(missing)))
+            self.api.snapshot = None
+        self.api = None
+        for view in self._views:
+            view.release()
+        self._views = []
+        if getattr(self, '_mmap', None) is not None:
+            self._mmap.close()
+        self._mmap = None
+        self._file.close()
+
+    def stats(self):
+        """
+        Returns a dict of identity map name to the number of its objects in the snapshot.
+        """
+        return dict((name, section.count) for name, section in self._sections.items())
+
+    def __repr__(self):
+        return "Snapshot: %s - %s objects" % (self.path, len(self))
@@ -0,0 +1,143 @@
+"""
+Incremental refreshes. An 'artist' response already carries each of the artist's torrents' stats (seeders, leechers,
+snatches, size, time, ...), so after re-reading it the only groups worth a 'torrentgroup' call (for descriptions, file
+lists and uploaders) are new ones and ones whose torrents were added, removed or edited. These helpers compare an
+artist's groups and torrents before and after an update to find them.
+"""
+import json
+import os
+
+from downloader import atomic_write
+
+# torrent fields whose change means the torrent was edited or replaced, so its group is fetched again
+REFETCH_FIELDS = ('media', 'format', 'encoding', 'remastered', 'remaster_year', 'remaster_title',
+                  'remaster_record_label', 'scene', 'has_log', 'has_cue', 'log_score', 'file_count', 'size', 'time')
+
+# torrent fields that change all the time and are fully updated by the 'artist' response itself
+STAT_FIELDS = ('seeders', 'leechers', 'snatched', 'free_torrent')
+
+GROUP_FIELDS = ('name', 'year', 'record_label', 'catalogue_number', 'release_type')
+
+TORRENT_FIELDS = REFETCH_FIELDS + STAT_FIELDS
+
+def snapshot_artist(artist):
+    """
+    Returns the comparable state of an artist's torrent groups as {group ID: (group fields, {torrent ID: torrent
+    fields})}, with the fields in GROUP_FIELDS (plus tag names) and TORRENT_FIELDS order.
+    """
+    snapshot = {}
+    for group in artist.torrent_groups:
+        group_state = tuple(getattr(group, field) for field in GROUP_FIELDS) + \
+            (tuple(sorted(tag.name for tag in group.tags)),)
+        torrents = dict((torrent.id, tuple(getattr(torrent, field) for field in TORRENT_FIELDS))
+                        for torrent in group.torrents)
+        snapshot[group.id] = (group_state, torrents)
+    return snapshot
+
+def diff_snapshots(before, after, refetch_fields=REFETCH_FIELDS):
+    """
+    Compares two snapshot_artist() results and returns a SyncResult. Groups are marked for refetching if they're new,
+    their own fields changed, a torrent was added or removed, or one of a torrent's refetch_fields changed.
+    """
+    result = SyncResult()
+    refetch_indexes = set(TORRENT_FIELDS.index(field) for field in refetch_fields)
+    for group_id, (group_state, torrents) in after.items():
+        if group_id not in before:
+            result.added_groups.append(group_id)
+            result.added_torrents.extend(torrents)
+            result.refetch_groups.append(group_id)
+            continue
+        old_group_state, old_torrents = before[group_id]
+        changed = refetch = group_state != old_group_state
+        for torrent_id, state in torrents.items():
+            old_state = old_torrents.get(torrent_id)
+            if old_state is None:
+                result.added_torrents.append(torrent_id)
+                changed = refetch = True
+            elif state != old_state:
+                indexes = [i for i, (old, new) in enumerate(zip(old_state, state)) if old != new]
+                result.changed_torrents[torrent_id] = [TORRENT_FIELDS[i] for i in indexes]
+                changed = True
+                refetch = refetch or not refetch_indexes.isdisjoint(indexes)
+        removed = [torrent_id for torrent_id in old_torrents if torrent_id not in torrents]
+        if removed:
+            result.removed_torrents.extend(removed)
+            changed = refetch = True
+        if changed:
+            result.changed_groups.append(group_id)
+        if refetch:
+            result.refetch_groups.append(group_id)
+    for group_id, (_, torrents) in before.items():
+        if group_id not in after:
+            result.removed_groups.append(group_id)
+            result.removed_torrents.extend(torrents)
+    return result
+
+
+class SyncResult(object):
+    """
+    What an incremental sync found, as lists of IDs: added_groups, removed_groups, changed_groups (existing groups
+    with any difference), added_torrents and removed_torrents; changed_torrents maps torrent ID to the names of its
+    changed fields. refetch_groups are the groups that needed a 'torrentgroup' call, and group_errors maps any of
+    those whose call failed to the exception.
+    """
+    __slots__ = ('added_groups', 'removed_groups', 'changed_groups', 'added_torrents', 'removed_torrents',
+                 'changed_torrents', 'refetch_groups', 'group_errors')
+
+    def __init__(self):
+        self.added_groups = []
+        self.removed_groups = []
+        self.changed_groups = []
+        self.added_torrents = []
+        self.removed_torrents = []
+        self.changed_torrents = {}
+        self.refetch_groups = []
+        self.group_errors = {}
+
+    def __repr__(self):
+        return "SyncResult: groups +%s -%s ~%s, torrents +%s -%s ~%s, %s groups to refetch" % \
+               (len(self.added_groups), len(self.removed_groups), len(self.changed_groups), len(self.added_torrents),
+                len(self.removed_torrents), len(self.changed_torrents), len(self.refetch_groups))
+
+
+class ArtistSyncState(object):
+    """
+    Remembers each artist's snapshot_artist() as of the last sync that dealt with everything it found, in a JSON file
+    at path (or only in memory if path is None), so the next sync compares against it rather than against whatever
+    happens to be loaded. A file that can't be read or parsed counts as no state.
+    """
+    def __init__(self, path=None):
+        self.path = os.path.expanduser(path) if path else None
+        self.snapshots = {}
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, 'rb') as state_file:
+                    state = json.loads(state_file.read().decode('utf-8'))
+                self.snapshots = dict((int(artist_id), self._decode(snapshot)) for artist_id, snapshot in state.items())
+            except (IOError, OSError, ValueError, KeyError, TypeError, AttributeError):
+                self.snapshots = {}
+
+    def _decode(self, snapshot):
+        # JSON turned the IDs into strings and the tuples into lists
+        decoded = {}
+        for group_id, (group_state, torrents) in snapshot.items():
+            group_state = tuple(tuple(value) if isinstance(value, list) else value for value in group_state)
+            decoded[int(group_id)] = (group_state, dict((int(torrent_id), tuple(state))
+                                                        for torrent_id, state in torrents.items()))
+        return decoded
+
+    def get(self, artist_id):
+        return self.snapshots.get(artist_id)
+
+    def set(self, artist_id, snapshot):
+        self.snapshots[artist_id] = snapshot
+
+    def save(self):
+        if self.path:
+            state = dict((artist_id, dict((group_id, [list(group_state), torrents])
+                                          for group_id, (group_state, torrents) in snapshot.items()))
+                         for artist_id, snapshot in self.snapshots.items())
+            atomic_write(self.path, [json.dumps(state, sort_keys=True).encode('utf-8')])
+
+    def __repr__(self):
+        return "ArtistSyncState: %s (%s artists)" % (self.path, len(self.snapshots))
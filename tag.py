@@ -1,3 +1,5 @@
+from hooks import fault_in
+
 class Tag(object):
     def __init__(self, name, parent_api):
         self.name = name
@@ -13,5 +15,8 @@ class Tag(object):
         """
         self.artist_counts[artist] = count
 
+    def __getattr__(self, name):
+        return fault_in(self, name) # only reached for attributes never set, i.e. on objects loaded from a snapshot
+
     def __repr__(self):
         return "Tag: %s" % self.name
\ No newline at end of file
@@ -0,0 +1,235 @@
+import threading
+from array import array
+from bisect import bisect_left
+
+from torrent_group import TorrentGroup
+from artist import Artist
+
+try:
+    array('q')
+    _ID_TYPECODE = 'q'
+except ValueError:
+    _ID_TYPECODE = 'l' # Python 2 has no 'q'; 'l' is 64 bits on the platforms that matter
+
+try:
+    _string_types = basestring
+except NameError: # Python 3
+    _string_types = str
+
+def intersect(a, b):
+    """
+    Returns the IDs in both sorted sequences a and b, sorted. Walks the shorter one and binary searches the longer,
+    moving the search window forward, so a rare tag intersected with a common one costs little.
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    result = []
+    lo = 0
+    end = len(b)
+    for id in a:
+        lo = bisect_left(b, id, lo, end)
+        if lo == end:
+            break
+        if b[lo] == id:
+            result.append(id)
+    return result
+
+def union(postings):
+    """
+    Returns the IDs in any of the sorted sequences, sorted.
+    """
+    if len(postings) == 1:
+        return list(postings[0])
+    return sorted(set().union(*postings))
+
+def difference(a, b):
+    """
+    Returns the IDs in sorted sequence a but not in sorted sequence b, sorted.
+    """
+    result = []
+    lo = 0
+    end = len(b)
+    for id in a:
+        lo = bisect_left(b, id, lo, end)
+        if lo == end or b[lo] != id:
+            result.append(id)
+    return result
+
+
+class _Postings(object):
+    """
+    Tag name -> sorted array of entity IDs, plus each entity's current tags so they can be replaced when the entity is
+    filled in again.
+    """
+    def __init__(self):
+        self.postings = {}
+        self.tags_of = {}
+
+    def update(self, id, tags):
+        tags = frozenset(tags)
+        old_tags = self.tags_of.get(id, frozenset())
+        if tags == old_tags:
+            return
+        for tag in old_tags - tags:
+            posting = self.postings[tag]
+            del posting[bisect_left(posting, id)]
+            if not posting:
+                del self.postings[tag]
+        for tag in tags - old_tags:
+            posting = self.postings.get(tag)
+            if posting is None:
+                posting = self.postings[tag] = array(_ID_TYPECODE)
+            posting.insert(bisect_left(posting, id), id)
+        if tags:
+            self.tags_of[id] = tags
+        else:
+            self.tags_of.pop(id, None)
+
+    def query(self, all=(), any=(), none=()):
+        if not all and not any:
+            raise ValueError("Give at least one tag in 'all' or 'any'")
+        empty = array(_ID_TYPECODE)
+        matched = None
+        for posting in sorted((self.postings.get(tag, empty) for tag in all), key=len):
+            matched = posting if matched is None else intersect(matched, posting)
+            if not matched:
+                return []
+        if any:
+            either = union([self.postings.get(tag, empty) for tag in any])
+            matched = either if matched is None else intersect(matched, either)
+        for tag in none:
+            if not matched:
+                break
+            matched = difference(matched, self.postings.get(tag, empty))
+        return list(matched)
+
+
+class TagIndex(object):
+    """
+    Inverted index from tag name to the IDs of the TorrentGroups and Artists carrying it, kept up to date as groups
+    are filled from 'artist' and 'browse' responses and artists from 'artist' responses. Available as
+    GazelleAPI.tag_index when the API is created with indexes=True:
+
+        api.tag_index.groups(all=['electronic', 'ambient'], none=['techno'])
+        api.tag_index.related('electronic')
+
+    Posting lists are sorted arrays of IDs, so boolean queries are merges of sorted lists. Tags can be given as names
+    or Tags.
+
+    It also keeps a sparse, symmetric tag co-occurrence matrix from the artists' tag counts: every artist tagged with
+    both a (count x) and b (count y) adds min(x, y) to the weight of (a, b), so incidental tags weigh little.
+    """
+    def __init__(self, parent_api):
+        self.parent_api = parent_api
+        self._lock = threading.RLock()
+        self._groups = _Postings()
+        self._artists = _Postings()
+        self._artist_counts = {} # artist ID -> {tag name: count}
+        self._cooccurrence = {} # tag name -> {tag name: weight}
+
+    def on_hydrated(self, entity, source):
+        if isinstance(entity, TorrentGroup):
+            if source in ('artist', 'browse'): # 'torrentgroup' responses don't carry the group's tags
+                self.index_group(entity)
+        elif isinstance(entity, Artist):
+            self.index_artist(entity)
+
+    def index_group(self, torrent_group):
+        with self._lock:
+            self._groups.update(torrent_group.id, [tag.name for tag in torrent_group.tags])
+
+    def index_artist(self, artist):
+        counts = dict((tag.name, tag.artist_counts.get(artist, 1)) for tag in artist.tags)
+        with self._lock:
+            self._artists.update(artist.id, counts)
+            old_counts = self._artist_counts.get(artist.id, {})
+            if counts != old_counts:
+                self._add_cooccurrence(old_counts, -1)
+                self._add_cooccurrence(counts, 1)
+                if counts:
+                    self._artist_counts[artist.id] = counts
+                else:
+                    self._artist_counts.pop(artist.id, None)
+
+    def _add_cooccurrence(self, counts, sign):
+        tags = sorted(counts)
+        for i, a in enumerate(tags):
+            for b in tags[i + 1:]:
+                weight = sign * min(counts[a], counts[b])
+                for x, y in ((a, b), (b, a)):
+                    row = self._cooccurrence.setdefault(x, {})
+                    row[y] = row.get(y, 0) + weight
+                    if not row[y]:
+                        del row[y]
+                        if not row:
+                            del self._cooccurrence[x]
+
+    def _names(self, tags):
+        if isinstance(tags, _string_types) or hasattr(tags, 'name'):
+            tags = [tags]
+        return [getattr(tag, 'name', tag) for tag in tags]
+
+    def groups(self, all=(), any=(), none=()):
+        """
+        Returns the sorted IDs of the known TorrentGroups tagged with every tag in all, at least one tag in any (if
+        given) and none of the tags in none.
+        """
+        with self._lock:
+            return self._groups.query(self._names(all), self._names(any), self._names(none))
+
+    def artists(self, all=(), any=(), none=()):
+        """
+        Like groups(), for the known Artists.
+        """
+        with self._lock:
+            return self._artists.query(self._names(all), self._names(any), self._names(none))
+
+    def group_count(self, tag):
+        with self._lock:
+            return len(self._groups.postings.get(self._names(tag)[0], ()))
+
+    def tags(self):
+        """
+        Returns the names of all indexed tags, sorted.
+        """
+        with self._lock:
+            return sorted(set(self._groups.postings) | set(self._artists.postings))
+
+    def cooccurrence(self, a, b):
+        """
+        Returns the co-occurrence weight of two tags (0 if they never appear together).
+        """
+        a, b = self._names(a)[0], self._names(b)[0]
+        with self._lock:
+            return self._cooccurrence.get(a, {}).get(b, 0)
+
+    def related(self, tag, k=10):
+        """
+        Returns the k tags co-occurring most strongly with tag, as (tag name, weight) pairs, strongest first.
+        """
+        with self._lock:
+            row = self._cooccurrence.get(self._names(tag)[0], {})
+            return sorted(row.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+    def cooccurrence_matrix(self):
+        """
+        Returns the co-occurrence matrix in compressed sparse row form as (tag names, indptr, indices, weights): the
+        non-zero entries of row i (tag names[i]) are at columns indices[indptr[i]:indptr[i + 1]] with the matching
+        weights. Easy to hand to scipy.sparse.csr_matrix((weights, indices, indptr)).
+        """
+        with self._lock:
+            names = sorted(self._cooccurrence)
+            column = dict((name, i) for i, name in enumerate(names))
+            indptr = array(_ID_TYPECODE, [0])
+            indices = array('i')
+            weights = array(_ID_TYPECODE)
+            for name in names:
+                row = sorted((column[other], weight) for other, weight in self._cooccurrence[name].items())
+                indices.extend(i for i, _ in row)
+                weights.extend(weight for _, weight in row)
+                indptr.append(len(indices))
+            return names, indptr, indices, weights
+
+    def __repr__(self):
+        return "TagIndex: %s tags over %s groups and %s artists" % \
+               (len(self.tags()), len(self._groups.tags_of), len(self._artists.tags_of))
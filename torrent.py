@@ -1,16 +1,57 @@
-import re
+from codes import MEDIA, FORMAT, ENCODING
+from file_list import FileList
+from hooks import hydrates, fault_in
+from schema import Schema, Field, Reference, Computed, KEEP
 
 class InvalidTorrentException(Exception):
     pass
 
+# what each response fills in; keys are the camelCase attribute names unless given (see schema.py)
+# artist and browse results are partial views of a torrent; what one of them lacks is left as it was
+FROM_ARTIST = Schema('torrent_from_artist', [
+    Reference('group', 'groupId', 'get_torrent_group'),
+    Field('media'), Field('format'), Field('encoding'), Field('remaster_year'), Field('remastered'),
+    Field('remaster_title'), Field('remaster_record_label'), Field('scene'), Field('has_log'), Field('has_cue'),
+    Field('log_score'), Field('file_count'), Field('free_torrent'), Field('size'), Field('leechers'),
+    Field('seeders'), Field('snatched'), Field('time'), Field('has_file'),
+], default=KEEP)
+
+FROM_TORRENT_GROUP = Schema('torrent_from_torrent_group', [
+    Reference('group', 'groupId', 'get_torrent_group'),
+    Field('media'), Field('format'), Field('encoding'), Field('remastered'), Field('remaster_year'),
+    Field('remaster_title'), Field('remaster_record_label'), Field('remaster_catalogue_number'), Field('scene'),
+    Field('has_log'), Field('has_cue'), Field('log_score'), Field('file_count'), Field('size'), Field('seeders'),
+    Field('leechers'), Field('snatched'), Field('free_torrent'), Field('time'), Field('description'),
+    Field('file_list', convert=FileList), # parsed lazily into ( filename, filesize )
+    Field('file_path'),
+    Reference('user', 'userId', 'get_user'),
+])
+
+FROM_BROWSE = Schema('torrent_from_browse', [
+    Reference('group', 'groupId', 'get_torrent_group'),
+    Field('remastered'), Field('remaster_year'), Field('remaster_title'), Field('remaster_catalogue_number'),
+    Field('media'), Field('format'), Field('encoding'), Field('has_log'), Field('has_cue'), Field('log_score'),
+    Field('scene'), Field('file_count'), Field('size'), Field('seeders'), Field('leechers'),
+    Field('snatched', 'snatches'),
+    Computed('free_torrent', "data['isFreeleech'] or data.get('isPersonalFreeleech')", ('isFreeleech',)),
+    Field('time'),
+], default=KEEP)
+
 class Torrent(object):
+    # a full-site crawl holds millions of these, so attributes live in slots and media/format/encoding are stored as
+    # small int codes (see codes.py) behind properties
+    __slots__ = ('__weakref__', 'id', 'parent_api', 'group', '_media', '_format', '_encoding', 'remaster_year',
+                 'remastered', 'remaster_title', 'remaster_record_label', 'remaster_catalogue_number', 'scene',
+                 'has_log', 'has_cue', 'log_score', 'file_count', 'free_torrent', 'size', 'leechers', 'seeders',
+                 'snatched', 'time', 'has_file', 'description', '_file_list', 'file_path', 'user', 'fetched')
+
     def __init__(self, id, parent_api):
         self.id = id
         self.parent_api = parent_api
         self.group = None
-        self.media = None
-        self.format = None
-        self.encoding = None
+        self._media = None
+        self._format = None
+        self._encoding = None
         self.remaster_year = None
         self.remastered = None
         self.remaster_title = None
@@ -29,96 +70,77 @@ class Torrent(object):
         self.time = None
         self.has_file = None
         self.description = None
-        self.file_list = []
+        self._file_list = None
         self.file_path = None
         self.user = None
+        self.fetched = None # {API action: time.time()} of the latest fill from each, see freshness.py
 
         self.parent_api.cached_torrents[self.id] = self
 
+    @property
+    def media(self):
+        return MEDIA.value(self._media)
+
+    @media.setter
+    def media(self, value):
+        self._media = MEDIA.code(value)
+
+    @property
+    def format(self):
+        return FORMAT.value(self._format)
+
+    @format.setter
+    def format(self, value):
+        self._format = FORMAT.code(value)
+
+    @property
+    def encoding(self):
+        return ENCODING.value(self._encoding)
+
+    @encoding.setter
+    def encoding(self, value):
+        self._encoding = ENCODING.code(value)
+
+    @property
+    def file_list(self):
+        """
+        FileList of (filename, size) pairs, filled by 'torrentgroup' calls and parsed on first use.
+        """
+        if self._file_list is None:
+            self._file_list = FileList()
+        return self._file_list
+
+    @file_list.setter
+    def file_list(self, value):
+        self._file_list = value
+
+    @hydrates('artist')
     def set_torrent_artist_data(self, artist_torrent_json_response):
         if self.id != artist_torrent_json_response['id']:
             raise InvalidTorrentException("Tried to update a Torrent's information from an 'artist' API call with a different id." +
                                        " Should be %s, got %s" % (self.id, artist_torrent_json_response['id']) )
+        FROM_ARTIST.hydrate(self, artist_torrent_json_response)
 
-        self.group = self.parent_api.get_torrent_group(artist_torrent_json_response['groupId'])
-        self.media = artist_torrent_json_response['media']
-        self.format = artist_torrent_json_response['format']
-        self.encoding = artist_torrent_json_response['encoding']
-        self.remaster_year = artist_torrent_json_response['remasterYear']
-        self.remastered = artist_torrent_json_response['remastered']
-        self.remaster_title = artist_torrent_json_response['remasterTitle']
-        self.remaster_record_label = artist_torrent_json_response['remasterRecordLabel']
-        self.scene = artist_torrent_json_response['scene']
-        self.has_log = artist_torrent_json_response['hasLog']
-        self.has_cue = artist_torrent_json_response['hasCue']
-        self.log_score = artist_torrent_json_response['logScore']
-        self.file_count = artist_torrent_json_response['fileCount']
-        self.free_torrent = artist_torrent_json_response['freeTorrent']
-        self.size = artist_torrent_json_response['size']
-        self.leechers = artist_torrent_json_response['leechers']
-        self.seeders = artist_torrent_json_response['seeders']
-        self.snatched = artist_torrent_json_response['snatched']
-        self.time = artist_torrent_json_response['time']
-        self.has_file = artist_torrent_json_response['hasFile']
-
+    @hydrates('torrentgroup')
     def set_torrent_group_data(self, group_torrent_json_response):
         if self.id != group_torrent_json_response['id']:
             raise InvalidTorrentException("Tried to update a Torrent's information from a 'torrentgroup' API call with a different id." +
                                           " Should be %s, got %s" % (self.id, group_torrent_json_response['id']) )
+        FROM_TORRENT_GROUP.hydrate(self, group_torrent_json_response)
 
-        self.group = self.parent_api.get_torrent_group(group_torrent_json_response['groupId'])
-        self.media = group_torrent_json_response['media']
-        self.format = group_torrent_json_response['format']
-        self.encoding = group_torrent_json_response['encoding']
-        self.remastered = group_torrent_json_response['remastered']
-        self.remaster_year = group_torrent_json_response['remasterYear']
-        self.remaster_title = group_torrent_json_response['remasterTitle']
-        self.remaster_record_label = group_torrent_json_response['remasterRecordLabel']
-        self.remaster_catalogue_number = group_torrent_json_response['remasterCatalogueNumber']
-        self.scene = group_torrent_json_response['scene']
-        self.has_log = group_torrent_json_response['hasLog']
-        self.has_cue = group_torrent_json_response['hasCue']
-        self.log_score = group_torrent_json_response['logScore']
-        self.file_count = group_torrent_json_response['fileCount']
-        self.size = group_torrent_json_response['size']
-        self.seeders = group_torrent_json_response['seeders']
-        self.leechers = group_torrent_json_response['leechers']
-        self.snatched = group_torrent_json_response['snatched']
-        self.free_torrent = group_torrent_json_response['freeTorrent']
-        self.time = group_torrent_json_response['time']
-        self.description = group_torrent_json_response['description']
-        self.file_list = [ re.match("(.+){{{(\d+)}}}", item).groups()
-                           for item in group_torrent_json_response['fileList'].split("|||") ] # tuple ( filename, filesize )
-        self.file_path = group_torrent_json_response['filePath']
-        self.user = self.parent_api.get_user(group_torrent_json_response['userId'])
-
+    @hydrates('browse')
     def set_torrent_search_data(self, search_torrent_json_response):
+        """
+        Takes a torrent from a 'browse' response. Results outside the music category carry fewer keys (no media,
+        format, remaster information, ...); those attributes are left as they were.
+        """
         if self.id != search_torrent_json_response['torrentId']:
             raise InvalidTorrentException("Tried to update a Torrent's information from a 'browse'/search API call with a different id." +
                                   " Should be %s, got %s" % (self.id, search_torrent_json_response['torrentId']) )
+        FROM_BROWSE.hydrate(self, search_torrent_json_response)
 
-        # TODO: Add conditionals to handle torrents that aren't music
-        self.group = self.parent_api.get_torrent_group(search_torrent_json_response['groupId'])
-        self.remastered = search_torrent_json_response['remastered']
-        self.remaster_year = search_torrent_json_response['remasterYear']
-        self.remaster_title = search_torrent_json_response['remasterTitle']
-        self.remaster_catalogue_number = search_torrent_json_response['remasterCatalogueNumber']
-        self.media = search_torrent_json_response['media']
-        self.format = search_torrent_json_response['format']
-        self.encoding = search_torrent_json_response['encoding']
-        self.has_log = search_torrent_json_response['hasLog']
-        self.has_cue = search_torrent_json_response['hasCue']
-        self.log_score = search_torrent_json_response['logScore']
-        self.scene = search_torrent_json_response['scene']
-        self.file_count = search_torrent_json_response['fileCount']
-        self.size = search_torrent_json_response['size']
-        self.seeders = search_torrent_json_response['seeders']
-        self.leechers = search_torrent_json_response['leechers']
-        self.snatched = search_torrent_json_response['snatches']
-        self.free_torrent = search_torrent_json_response['isFreeleech'] or search_torrent_json_response['isPersonalFreeleech']
-        self.time = search_torrent_json_response['time']
-
-
+    def __getattr__(self, name):
+        return fault_in(self, name) # only reached for attributes never set, i.e. on objects loaded from a snapshot
 
     def __repr__(self):
         if self.group:
@@ -1,14 +1,41 @@
 from torrent import Torrent
+from hooks import hydrates, fault_in
+from schema import Schema, Field, Computed, KEEP
+from freshness import is_fresh
 
 class InvalidTorrentGroupException(Exception):
     pass
 
+# what each response fills in; keys are the camelCase attribute names unless given (see schema.py)
+FROM_TORRENT_GROUP = Schema('torrent_group_from_torrent_group', [ # the response's 'group' part
+    Field('name'), Field('year'), Field('wiki_body'), Field('wiki_image'), Field('record_label'),
+    Field('catalogue_number'), Field('release_type'),
+    Computed('category', "api.get_category(data['categoryId'], data.get('categoryName'))", ('categoryId',), KEEP),
+    Field('time'), Field('vanity_house'), Field('music_info'),
+])
+
+FROM_ARTIST = Schema('torrent_group_from_artist', [
+    Field('name', 'groupName'), Field('year', 'groupYear'), Field('record_label', 'groupRecordLabel'),
+    Field('catalogue_number', 'groupCatalogueNumber'), Field('release_type'), Field('has_bookmarked'),
+])
+
+# results outside the music category have no year, release type, ...; what isn't there is left as it was
+FROM_BROWSE = Schema('torrent_group_from_browse', [
+    # purposefully ignoring 'artist'...the other data updates don't include it, would just get confusing
+    Field('name', 'groupName'), Field('has_bookmarked', 'bookmarked', KEEP), Field('vanity_house', default=KEEP),
+    Field('year', 'groupYear', KEEP), Field('release_type', default=KEEP), Field('time', 'groupTime', KEEP),
+])
+
 class TorrentGroup(object):
     """
     Represents a Torrent Group (usually an album). Note that TorrentGroup.torrents may not be comprehensive if you
     haven't called TorrentGroup.update_group_data()...it may have only been populated with filtered search results.
     Check TorrentGroup.has_complete_torrent_list (boolean) to be sure.
     """
+    __slots__ = ('__weakref__', 'id', 'parent_api', 'name', 'wiki_body', 'wiki_image', 'year', 'record_label',
+                 'catalogue_number', '_tags', 'release_type', 'vanity_house', 'has_bookmarked', 'category', 'time',
+                 'music_info', '_torrents', 'has_complete_torrent_list', 'fetched')
+
     def __init__(self, id, parent_api):
         self.id = id
         self.parent_api = parent_api
@@ -18,22 +45,53 @@ class TorrentGroup(object):
         self.year = None
         self.record_label = None
         self.catalogue_number = None
-        self.tags = []
+        self._tags = None # tags and torrents lists are only created when first used
         self.release_type = None
         self.vanity_house = None
         self.has_bookmarked = None
         self.category = None
         self.time = None
         self.music_info = None
-        self.torrents = []
+        self._torrents = None
         self.has_complete_torrent_list = False
+        self.fetched = None
 
         self.parent_api.cached_torrent_groups[self.id] = self
 
-    def update_group_data(self):
-        response = self.parent_api.request(action='torrentgroup', id=self.id)
+    @property
+    def tags(self):
+        if self._tags is None:
+            self._tags = []
+        return self._tags
+
+    @tags.setter
+    def tags(self, value):
+        self._tags = value
+
+    @property
+    def torrents(self):
+        if self._torrents is None:
+            self._torrents = []
+        return self._torrents
+
+    @torrents.setter
+    def torrents(self, value):
+        self._torrents = value
+
+    def update_group_data(self, max_age=None):
+        """
+        Calls 'torrentgroup' API action and updates this TorrentGroup and its Torrents with it, unless max_age is given
+        and the 'torrentgroup' data is at most that many seconds old (the call then bypasses the API's response cache).
+        Returns whether the call was made.
+        """
+        self.parent_api.on_blocking_call('TorrentGroup.update_group_data')
+        if is_fresh(self, max_age, 'torrentgroup'):
+            return False
+        response = self.parent_api.request(action='torrentgroup', id=self.id, bypass_cache=max_age is not None)
         self.set_group_data(response)
+        return True
 
+    @hydrates('torrentgroup')
     def set_group_data(self, torrent_group_json_response):
         """
         Takes parsed JSON response from 'torrentgroup' action on api, and updates relevant information.
@@ -43,24 +101,12 @@ class TorrentGroup(object):
             raise InvalidTorrentGroupException("Tried to update a TorrentGroup's information from an 'artist' API call with a different id." +
                                                " Should be %s, got %s" % (self.id, torrent_group_json_response['group']['groupId']) )
 
-        self.name = torrent_group_json_response['group']['name']
-        self.year = torrent_group_json_response['group']['year']
-        self.wiki_body = torrent_group_json_response['group']['wikiBody']
-        self.wiki_image = torrent_group_json_response['group']['wikiImage']
-        self.record_label = torrent_group_json_response['group']['recordLabel']
-        self.catalogue_number = torrent_group_json_response['group']['catalogueNumber']
-
-        self.release_type = torrent_group_json_response['group']['releaseType']
-        self.category = self.parent_api.get_category(torrent_group_json_response['group']['categoryId'],
-                                                     torrent_group_json_response['group']['categoryName'])
-        self.time = torrent_group_json_response['group']['time']
-        self.vanity_house = torrent_group_json_response['group']['vanityHouse']
-
-        self.music_info = torrent_group_json_response['group']['musicInfo']
-        self.music_info['artists'] = [ self.parent_api.get_artist(artist['id'], artist['name'])
-                                       for artist in self.music_info['artists'] ]
-        self.music_info['with'] = [ self.parent_api.get_artist(artist['id'], artist['name'])
-                                       for artist in self.music_info['with'] ]
+        FROM_TORRENT_GROUP.hydrate(self, torrent_group_json_response['group'])
+        if self.music_info: # only music groups have one
+            self.music_info['artists'] = [ self.parent_api.get_artist(artist['id'], artist['name'])
+                                           for artist in self.music_info['artists'] ]
+            self.music_info['with'] = [ self.parent_api.get_artist(artist['id'], artist['name'])
+                                           for artist in self.music_info['with'] ]
 
         self.torrents = []
         for torrent_dict in torrent_group_json_response['torrents']:
@@ -70,6 +116,7 @@ class TorrentGroup(object):
             self.torrents.append(torrent)
         self.has_complete_torrent_list = True
 
+    @hydrates('artist')
     def set_artist_group_data(self, artist_group_json_response):
         """
         Takes torrentgroup section from parsed JSON response from 'artist' action on api, and updates relevant information.
@@ -78,19 +125,13 @@ class TorrentGroup(object):
             raise InvalidTorrentGroupException("Tried to update a TorrentGroup's information from an 'artist' API call with a different id." +
                                " Should be %s, got %s" % (self.id, artist_group_json_response['groupId']) )
 
-        self.name = artist_group_json_response['groupName']
-        self.year = artist_group_json_response['groupYear']
-        self.record_label = artist_group_json_response['groupRecordLabel']
-        self.catalogue_number = artist_group_json_response['groupCatalogueNumber']
+        FROM_ARTIST.hydrate(self, artist_group_json_response)
 
         self.tags = []
         for tag_name in artist_group_json_response['tags']:
             tag = self.parent_api.get_tag(tag_name)
             self.tags.append(tag)
 
-        self.release_type = artist_group_json_response['releaseType']
-        self.has_bookmarked = artist_group_json_response['hasBookmarked']
-
         self.torrents = []
         for torrent_dict in artist_group_json_response['torrent']:
             torrent = self.parent_api.get_torrent(torrent_dict['id'])
@@ -98,29 +139,20 @@ class TorrentGroup(object):
             self.torrents.append(torrent)
         self.has_complete_torrent_list = True
 
+    @hydrates('browse')
     def set_torrent_search_data(self, search_json_response):
         if self.id != search_json_response['groupId']:
             raise InvalidTorrentGroupException("Tried to update a TorrentGroup's information from an 'browse'/search API call with a different id." +
                                        " Should be %s, got %s" % (self.id, search_json_response['groupId']) )
 
-        self.name = search_json_response['groupName']
-        # purposefully ignoring search_json_response['artist']...the other data updates don't include it, would just get confusing
+        FROM_BROWSE.hydrate(self, search_json_response)
         self.tags = []
-        for tag_name in search_json_response['tags']:
+        for tag_name in search_json_response.get('tags', ()):
             tag = self.parent_api.get_tag(tag_name)
             self.tags.append(tag)
-        # some of the below keys aren't in things like comics...should probably watch out for this elsewhere
-        if 'bookmarked' in search_json_response.keys():
-            self.has_bookmarked = search_json_response['bookmarked']
-        if 'vanityHouse' in search_json_response.keys():
-            self.vanity_house = search_json_response['vanityHouse']
-        if 'groupYear' in search_json_response.keys():
-            self.year = search_json_response['groupYear']
-        if 'releaseType' in search_json_response.keys():
-            self.release_type = search_json_response['releaseType']
-        self.time = search_json_response['groupTime']
-        if 'torrentId' in search_json_response.keys():
-            search_json_response['torrents'] = [{'torrentId': search_json_response['torrentId']}]
+        if 'torrentId' in search_json_response:
+            # results outside the music category are a single torrent, whose fields are in the result itself
+            search_json_response['torrents'] = [dict(search_json_response)]
 
         new_torrents = []
         for torrent_dict in search_json_response['torrents']:
@@ -131,5 +163,8 @@ class TorrentGroup(object):
         self.torrents = self.torrents + new_torrents
 
 
+    def __getattr__(self, name):
+        return fault_in(self, name) # only reached for attributes never set, i.e. on objects loaded from a snapshot
+
     def __repr__(self):
         return "TorrentGroup: %s - ID: %s" % (self.name, self.id)
\ No newline at end of file
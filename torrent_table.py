@@ -0,0 +1,194 @@
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from codes import MEDIA, FORMAT, ENCODING, RELEASE_TYPE
+import release_type
+
+# categorical columns and the CodeTable their codes come from; -1 marks a missing value
+CATEGORIES = {'media': MEDIA, 'format': FORMAT, 'encoding': ENCODING, 'release_type': RELEASE_TYPE}
+NUMERIC_FIELDS = ('seeders', 'leechers', 'snatched', 'size', 'log_score', 'file_count', 'year')
+FLAG_FIELDS = ('free_torrent', 'has_log', 'has_cue', 'scene', 'remastered')
+
+def _release_type_code(value):
+    code = RELEASE_TYPE.code(release_type.to_name(value))
+    return -1 if code is None else code
+
+class TorrentTable(object):
+    """
+    Column-oriented copy of a set of Torrents for vectorized analytics: one NumPy array per field, all the same
+    length, row i describing the torrent with ID ids[i]. Build one with TorrentTable.from_torrents(), or through
+    GazelleAPI.torrent_table() / Artist.torrent_table().
+
+    Columns:
+        id, group_id: int64
+        seeders, leechers, snatched, size, log_score, file_count: int64 (0 if unknown)
+        year: int64, from the torrent's group (0 if unknown)
+        free_torrent, has_log, has_cue, scene, remastered: bool
+        media, format, encoding: int16 codes into codes.MEDIA/FORMAT/ENCODING (-1 if unknown); use code() to get the
+                                 code for a string and decode() to turn a column back into strings
+        release_type: int16 code into codes.RELEASE_TYPE, from the torrent's group (-1 if unknown)
+
+    filter(), sort() and the table[mask] syntax return new tables; group_by() and aggregate() split on a column.
+    Requires numpy.
+    """
+    def __init__(self, columns, parent_api=None):
+        if numpy is None:
+            raise ImportError("TorrentTable requires the numpy package")
+        self.columns = columns
+        self.parent_api = parent_api
+
+    @classmethod
+    def from_torrents(cls, torrents, parent_api=None):
+        torrents = list(torrents)
+        if parent_api is None and torrents:
+            parent_api = torrents[0].parent_api
+        rows = {'id': [], 'group_id': []}
+        for name in NUMERIC_FIELDS + FLAG_FIELDS:
+            rows[name] = []
+        for name in CATEGORIES:
+            rows[name] = []
+        for torrent in torrents:
+            group = torrent.group
+            rows['id'].append(torrent.id)
+            rows['group_id'].append(group.id if group is not None else 0)
+            rows['seeders'].append(torrent.seeders or 0)
+            rows['leechers'].append(torrent.leechers or 0)
+            rows['snatched'].append(torrent.snatched or 0)
+            rows['size'].append(torrent.size or 0)
+            rows['log_score'].append(torrent.log_score or 0)
+            rows['file_count'].append(torrent.file_count or 0)
+            rows['year'].append(group.year or 0 if group is not None else 0)
+            rows['release_type'].append(_release_type_code(group.release_type if group is not None else None))
+            rows['free_torrent'].append(bool(torrent.free_torrent))
+            rows['has_log'].append(bool(torrent.has_log))
+            rows['has_cue'].append(bool(torrent.has_cue))
+            rows['scene'].append(bool(torrent.scene))
+            rows['remastered'].append(bool(torrent.remastered))
+            # read the stored codes directly rather than decoding to strings and back
+            rows['media'].append(-1 if torrent._media is None else torrent._media)
+            rows['format'].append(-1 if torrent._format is None else torrent._format)
+            rows['encoding'].append(-1 if torrent._encoding is None else torrent._encoding)
+
+        columns = {}
+        for name in ('id', 'group_id') + NUMERIC_FIELDS:
+            columns[name] = numpy.array(rows[name], dtype=numpy.int64)
+        for name in FLAG_FIELDS:
+            columns[name] = numpy.array(rows[name], dtype=bool)
+        for name in CATEGORIES:
+            columns[name] = numpy.array(rows[name], dtype=numpy.int16)
+        return cls(columns, parent_api)
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['columns'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __getitem__(self, selection):
+        """
+        table['seeders'] returns a column; table[mask] or table[indices] returns a new table with those rows.
+        """
+        if isinstance(selection, str):
+            return self.columns[selection]
+        return TorrentTable(dict((name, column[selection]) for name, column in self.columns.items()),
+                            self.parent_api)
+
+    @property
+    def ids(self):
+        return self.columns['id']
+
+    def code(self, field, value):
+        """
+        Returns the code a categorical column uses for value (a string such as format.FLAC), or -1 if it never
+        occurs.
+        """
+        code = CATEGORIES[field].codes.get(value)
+        return -1 if code is None else code
+
+    def decode(self, field):
+        """
+        Returns a categorical column as an object array of strings (None where unknown).
+        """
+        values = numpy.array(CATEGORIES[field].values + [None], dtype=object)
+        return values[self.columns[field]] # -1 picks the trailing None
+
+    def mask(self, **conditions):
+        """
+        Returns a boolean row mask for conditions, which are ANDed together:
+            field=value: equality; categorical fields take their string value (e.g. format=format.FLAC)
+            field=[v1, v2]: membership
+            min_field=x / max_field=x: inclusive bounds, e.g. min_seeders=5
+        """
+        mask = numpy.ones(len(self), dtype=bool)
+        for key, value in conditions.items():
+            if key.startswith('min_'):
+                mask &= self.columns[key[4:]] >= value
+            elif key.startswith('max_'):
+                mask &= self.columns[key[4:]] <= value
+            else:
+                values = value if isinstance(value, (list, tuple, set)) else [value]
+                if key in CATEGORIES:
+                    values = [self.code(key, v) for v in values]
+                mask &= numpy.isin(self.columns[key], list(values))
+        return mask
+
+    def filter(self, mask=None, **conditions):
+        """
+        Returns a new table with the rows matching mask (a boolean array) and/or conditions (see mask()).
+        """
+        if mask is None:
+            mask = self.mask(**conditions)
+        elif conditions:
+            mask = mask & self.mask(**conditions)
+        return self[mask]
+
+    def sort(self, field, descending=False):
+        """
+        Returns a new table ordered by field. The sort is stable, so sort by secondary keys first.
+        """
+        order = numpy.argsort(self.columns[field], kind='stable')
+        if descending:
+            order = order[::-1]
+        return self[order]
+
+    def group_by(self, field):
+        """
+        Returns a dict of each distinct value of field to the table of rows having it.
+        """
+        keys, inverse = numpy.unique(self.columns[field], return_inverse=True)
+        return dict((key.item(), self[inverse == i]) for i, key in enumerate(keys))
+
+    def aggregate(self, by, field=None, how='sum'):
+        """
+        Groups rows by the 'by' column and reduces 'field' within each group. how is one of 'count', 'sum', 'mean',
+        'min' or 'max'. Returns a (keys, values) pair of arrays.
+        """
+        keys, inverse = numpy.unique(self.columns[by], return_inverse=True)
+        counts = numpy.bincount(inverse, minlength=len(keys))
+        if how == 'count':
+            return keys, counts
+        column = self.columns[field]
+        if how == 'sum':
+            return keys, numpy.bincount(inverse, weights=column, minlength=len(keys))
+        if how == 'mean':
+            return keys, numpy.bincount(inverse, weights=column, minlength=len(keys)) / numpy.maximum(counts, 1)
+        if how in ('min', 'max'):
+            reduce = numpy.minimum if how == 'min' else numpy.maximum
+            values = numpy.full(len(keys), column.max() if how == 'min' else column.min(), dtype=column.dtype)
+            reduce.at(values, inverse, column)
+            return keys, values
+        raise ValueError("Unknown aggregation '%s'" % how)
+
+    def torrents(self):
+        """
+        Maps the rows back to their Torrent objects, in row order.
+        """
+        return [self.parent_api.get_torrent(id) for id in self.columns['id'].tolist()]
+
+    def __repr__(self):
+        return "TorrentTable: %s torrents" % len(self)
@@ -1,13 +1,29 @@
+from hooks import hydrates, fault_in
+from schema import Schema, Field
+from freshness import is_fresh
 
 
 class InvalidUserException(Exception):
     pass
 
+# what each response fills in besides the merged stats; keys are the camelCase attribute names (see schema.py)
+FROM_INDEX = Schema('user_from_index', [
+    Field('username'), Field('authkey'), Field('passkey'), Field('notifications'),
+])
+
+FROM_USER = Schema('user_from_user', [
+    Field('username'), Field('avatar'), Field('is_friend'), Field('profile_text'), Field('ranks'), Field('personal'),
+    Field('community'),
+])
+
 class User(object):
     """
     This class represents a User, whether your own or someone else's. It is created knowing only its ID. To reduce
     API accesses, load information using User.update_index_data() or User.update_user_data only as needed.
     """
+    __slots__ = ('__weakref__', 'id', 'parent_api', 'username', 'authkey', 'passkey', 'avatar', 'is_friend',
+                 'profile_text', 'notifications', 'stats', 'ranks', 'personal', 'community', 'fetched')
+
     def __init__(self, id, parent_api):
         self.id = id
         self.parent_api = parent_api
@@ -22,17 +38,25 @@ class User(object):
         self.ranks = None
         self.personal = None
         self.community = None
+        self.fetched = None
 
         self.parent_api.cached_users[self.id] = self # add self to cache of known User objects
 
-    def update_index_data(self):
+    def update_index_data(self, max_age=None):
         """
         Calls 'index' API action, then updates this User objects information with it.
         NOTE: Only call if this user is the logged-in user...throws InvalidUserException otherwise.
+        With max_age, the call is skipped if 'index' data is at most max_age seconds old, and otherwise bypasses the
+        API's response cache, so the data really is new. Returns whether it was made.
         """
-        response = self.parent_api.request(action='index')
+        self.parent_api.on_blocking_call('User.update_index_data')
+        if is_fresh(self, max_age, 'index'):
+            return False
+        response = self.parent_api.request(action='index', bypass_cache=max_age is not None)
         self.set_index_data(response)
+        return True
 
+    @hydrates('index')
     def set_index_data(self, index_json_response):
         """
         Takes parsed JSON response from 'index' action on api, and updates the available subset of user information.
@@ -42,13 +66,9 @@ class User(object):
             raise InvalidUserException("Tried to update non-logged-in User's information from 'index' API call." +
                                        " Should be %s, got %s" % (self.id, index_json_response['id']) )
 
-        self.username = index_json_response['username']
-
-        self.authkey = index_json_response['authkey']
-        self.passkey = index_json_response['passkey']
-        self.notifications = index_json_response['notifications']
+        FROM_INDEX.hydrate(self, index_json_response)
         if self.stats:
-            self.stats = dict(self.stats.items() + index_json_response['userstats'].items()) # merge in new info
+            self.stats = dict(self.stats, **index_json_response['userstats']) # merge in new info
         else:
             self.stats = index_json_response['userstats']
 
@@ -58,10 +78,19 @@ class User(object):
             self.personal['passkey'] = self.passkey
 
 
-    def update_user_data(self):
-        response = self.parent_api.request(action='user', id=self.id)
+    def update_user_data(self, max_age=None):
+        """
+        Calls 'user' API action and updates this User with it, unless max_age is given and the 'user' data is at most
+        that many seconds old (the call then bypasses the API's response cache). Returns whether the call was made.
+        """
+        self.parent_api.on_blocking_call('User.update_user_data')
+        if is_fresh(self, max_age, 'user'):
+            return False
+        response = self.parent_api.request(action='user', id=self.id, bypass_cache=max_age is not None)
         self.set_user_data(response)
+        return True
 
+    @hydrates('user')
     def set_user_data(self, user_json_response):
         """
         Takes parsed JSON response from 'user' action on api, and updates relevant user information.
@@ -71,22 +100,17 @@ class User(object):
             raise InvalidUserException("Tried to update a user's information from a 'user' API call with a different username." +
                                " Should be %s, got %s" % (self.username, user_json_response['username']) )
 
-        self.username = user_json_response['username']
-        self.avatar = user_json_response['avatar']
-        self.is_friend = user_json_response['isFriend']
-        self.profile_text = user_json_response['profileText']
+        FROM_USER.hydrate(self, user_json_response)
         if self.stats:
-            self.stats = dict(self.stats.items() + user_json_response['stats'].items()) # merge in new info
+            self.stats = dict(self.stats, **user_json_response['stats']) # merge in new info
         else:
             self.stats = user_json_response['stats']
-        self.ranks = user_json_response['ranks']
-        self.personal = user_json_response['personal']
-        self.community = user_json_response['community']
 
         # cross pollinate some data that is located in multiple locations in API
         self.stats['class'] = self.personal['class']
         self.passkey = self.personal['passkey']
 
+    @hydrates('usersearch')
     def set_search_result_data(self, search_result_item):
         """
         Takes a single user result item from a 'usersearch' API call and updates user info.
@@ -104,6 +128,9 @@ class User(object):
         self.personal['enabled'] = search_result_item['enabled']
         self.personal['class'] = search_result_item['class']
 
+    def __getattr__(self, name):
+        return fault_in(self, name) # only reached for attributes never set, i.e. on objects loaded from a snapshot
+
     def __repr__(self):
         return "User: %s - ID: %s" % (self.username, self.id)
 